@@ -16,7 +16,11 @@ def main():
     files_written = make_wrapper.write_project_wrapper( project_name=args.project, 
                                                         abi_json_path=args.json, 
                                                         output_dir=args.output,
-                                                        overwrite_ok=args.force_overwrite)
+                                                        overwrite_ok=args.force_overwrite,
+                                                        incremental=args.incremental,
+                                                        jobs=args.jobs,
+                                                        fast_calls=args.fast_calls,
+                                                        async_wrappers=args.async_wrappers)
     # package_dir = args.output / args.project
     package_dir = args.output 
     print(f'Wrote {len(files_written)} files to {package_dir}')
@@ -44,6 +48,14 @@ def parse_all_args(args_in=None):
         help=f'Write wrapper package to OUTPUT directory.')
     parser.add_argument('--force_overwrite', '-f', action='store_true', default=False,
         help=f'Overwrite existing project directory without asking.')
+    parser.add_argument('--jobs', '-J', type=int, default=1,
+        help=f'Render contract modules in JOBS parallel processes. Output is identical to a serial run.')
+    parser.add_argument('--fast_calls', action='store_true', default=False,
+        help=f'Generate view methods that encode calldata and decode results directly from precomputed ABI types, bypassing web3 function lookup.')
+    parser.add_argument('--async_wrappers', action='store_true', default=False,
+        help=f'Also generate Async<Contract> classes and an AsyncAll<Project>Contracts aggregator built on AsyncWeb3.')
+    parser.add_argument('--incremental', '-i', action='store_true', default=False,
+        help=f'Update a previously generated package in place, rewriting only contracts whose ABI or address changed.')
 
     # If no arguments were supplied, print help
     if len(sys.argv) == 1:
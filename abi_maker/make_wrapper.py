@@ -1,4 +1,7 @@
 #! /usr/bin/env python
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from itertools import repeat
 import json
 import keyword
 from pathlib import Path
@@ -6,9 +9,12 @@ import re
 import shutil
 from textwrap import indent, dedent
 
+from eth_utils import keccak
 import inflection
 
-from typing import Dict, List, Optional, Sequence, Tuple, Union, Callable, Any
+from abi_maker import __version__
+
+from typing import Dict, List, Optional, Sequence, Tuple, Union, Any
 
 HexAddress = str
 
@@ -17,6 +23,14 @@ INDENT = '    ' # 4 spaces. Changeable if you're a barbarian
 PACKAGE_DIR = Path(__file__).parent
 TEMPLATES_DIR = PACKAGE_DIR / 'template_modules'
 
+# Written into every generated package. Records a content hash for each contract
+# module so that incremental runs only re-render the contracts whose inputs changed
+MANIFEST_NAME = '.abi_maker_manifest.json'
+
+# Any change to this module can change generated output, so fold a digest of
+# the generator source into the version used for content hashes
+GENERATOR_VERSION = f'{__version__}+{hashlib.sha256(Path(__file__).read_bytes()).hexdigest()[:12]}'
+
 SNAKE_CASE_RE_1 = re.compile(r'(.)([A-Z][a-z]+)')
 SNAKE_CASE_RE_2 = re.compile(r'([a-z0-9])([A-Z])')
 
@@ -50,16 +64,30 @@ INFRASTRUCTURE_FUNCTIONS = [
 # ===============
 # = ENTRY POINT =
 # ===============
-def write_project_wrapper(project_name:str, abi_json_path:Path, output_dir:Path, overwrite_ok=False) -> List[Path]:
+def write_project_wrapper(project_name:str, 
+                          abi_json_path:Path, 
+                          output_dir:Path, 
+                          overwrite_ok=False,
+                          incremental=False,
+                          jobs:int = 1,
+                          fast_calls=False,
+                          async_wrappers=False) -> List[Path]:
     if not abi_json_path.exists():
         raise ValueError(f"No ABI file present for project {project_name} at expected path {abi_json_path}")
     abis_by_name = json.loads(abi_json_path.read_text())
 
-    # Make project dir, erasing any previous dir
-    # Warn before overwriting a dir. If overwrite_ok is True, proceed.
     # project_dir = output_dir / project_name
     project_dir = output_dir 
-    if project_dir.exists():
+
+    # In incremental mode, a previously generated package is updated in place:
+    # only contract modules whose ABI, address, or generator version changed are
+    # rewritten, and untouched files keep their mtimes. Without a manifest
+    # we don't know what's in the directory, so fall back to a full rewrite
+    manifest = read_manifest(project_dir) if incremental else None
+
+    # Make project dir, erasing any previous dir
+    # Warn before overwriting a dir. If overwrite_ok is True, proceed.
+    if project_dir.exists() and manifest is None:
         overwrite_ok = overwrite_ok or yes_no_prompt(f'Overwrite project dir? ({project_dir})')
         if overwrite_ok:
             shutil.rmtree(project_dir)
@@ -68,41 +96,106 @@ def write_project_wrapper(project_name:str, abi_json_path:Path, output_dir:Path,
                   f'\nMove the directory or pass the -f command line option to continue')
             return []
     project_dir.mkdir(exist_ok=True)
+    written:List[Path] = []
 
     # Copy template modules into project dir
-    [shutil.copy(template, project_dir / template.name) for template in TEMPLATES_DIR.iterdir()]
+    for template in sorted(TEMPLATES_DIR.glob('*.py')):
+        if copy_if_changed(template, project_dir / template.name):
+            written.append(project_dir / template.name)
 
     # TODO: Customize superclass module; set default RPC, add anything else that's needed
 
+    # Figure out which contracts need to be (re)written
+    options = {'fast_calls': fast_calls, 'async_wrappers': async_wrappers}
+    contract_hashes = {name: contract_hash(name, info, options) for name, info in abis_by_name['CONTRACTS'].items()}
+    old_contracts = manifest['contracts'] if manifest else {}
+    contracts_dir = project_dir / 'contracts'
+    unchanged = [name for name, h in contract_hashes.items() 
+                    if name in old_contracts 
+                    and old_contracts[name]['hash'] == h
+                    and (contracts_dir / old_contracts[name]['module']).exists()]
+
     # Write a module for each contract in the JSON file
-    module_paths = write_classes_for_abis(project_name, abis_by_name, project_dir)
+    module_paths = write_classes_for_abis(project_name, abis_by_name, project_dir, 
+                                          skip_contracts=unchanged, jobs=jobs, 
+                                          fast_calls=fast_calls, async_wrappers=async_wrappers)
+    written += [p for name, p in zip(abis_by_name['CONTRACTS'], module_paths) if name not in unchanged]
+
+    # Remove modules for contracts that are no longer in the JSON file
+    module_names = {p.name for p in module_paths}
+    for name, entry in old_contracts.items():
+        orphan = contracts_dir / entry['module']
+        if name not in contract_hashes and entry['module'] not in module_names and orphan.exists():
+            orphan.unlink()
+
+    # Every distinct ABI goes in one sidecar file that contract modules import from,
+    # by way of the abis module
+    abis_path = write_shared_abis_file(abis_by_name, project_dir)
+    if abis_path:
+        written.append(abis_path)
 
     # Write a single class that imports & initializes all contract instances with specified RPC, etc
     # This is what a user will import & use
-    all_contracts_path = write_all_contracts_wrapper(project_name, abis_by_name, module_paths, project_dir)
+    all_contracts_path = write_all_contracts_wrapper(project_name, abis_by_name, module_paths, project_dir,
+                                                     async_wrappers=async_wrappers)
+    if all_contracts_path:
+        written.append(all_contracts_path)
+
+    # __init__ modules that import contracts & the aggregator on first use
+    written += write_package_inits(project_name, abis_by_name, module_paths, project_dir,
+                                   async_wrappers=async_wrappers)
 
     # Write the ABI file to the package so there's evidence of how things were generated.
-    shutil.copy(abi_json_path, project_dir / abi_json_path.name)
+    if copy_if_changed(abi_json_path, project_dir / abi_json_path.name):
+        written.append(project_dir / abi_json_path.name)
+
+    manifest = {
+        'generator_version': GENERATOR_VERSION,
+        'contracts': {name: {'module': p.name, 'hash': contract_hashes[name]} 
+                        for name, p in zip(abis_by_name['CONTRACTS'], module_paths)}
+    }
+    write_if_changed(project_dir / MANIFEST_NAME, json.dumps(manifest, indent=2) + '\n')
 
-    return module_paths + [all_contracts_path]
+    return written
 
 def write_classes_for_abis( project_name:str, 
                             project_dict: Dict[str, Dict],
-                            project_dir:Path ) -> List[Path]:
-    written_paths:List[Path] = []
-
+                            project_dir:Path,
+                            skip_contracts:Sequence[str] = (),
+                            jobs:int = 1,
+                            fast_calls=False,
+                            async_wrappers=False ) -> List[Path]:
+    # Returns the module path for every contract, including those in 
+    # `skip_contracts`, which are assumed to be up to date and aren't rewritten
     contracts_dir =  project_dir / 'contracts'
     
     contracts_dir.mkdir(exist_ok=True, parents=True)
 
     # TODO: we might make some provisions for a customizable superclass    
 
-    for contract_name, contract_info in project_dict['CONTRACTS'].items():
-        # Note that this address may be a single hex address or a dict of addresses
-        # for multi-chain contracts
-        address = contract_info.get('ADDRESS')
-        abi = contract_info['ABI']
-        path = write_contract_wrapper_module(contract_name, abi, address, contracts_dir)
+    # Note that each address may be a single hex address or a dict of addresses
+    # for multi-chain contracts
+    to_render = [(name, info['ABI'], info.get('ADDRESS')) 
+                    for name, info in project_dict['CONTRACTS'].items()
+                    if name not in skip_contracts]
+
+    # Rendering is pure string-building, so it parallelizes cleanly across
+    # processes. Results come back in submission order, so files are written
+    # in the same order, with the same contents, as the serial path
+    if jobs > 1 and len(to_render) > 1:
+        chunksize = max(1, len(to_render) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            module_strs = list(executor.map(render_contract_wrapper_module, *zip(*to_render), 
+                                            repeat(fast_calls), repeat(async_wrappers), chunksize=chunksize))
+    else:
+        module_strs = [render_contract_wrapper_module(*args, fast_calls, async_wrappers) for args in to_render]
+    rendered = {args[0]: module_str for args, module_str in zip(to_render, module_strs)}
+
+    written_paths:List[Path] = []
+    for contract_name in project_dict['CONTRACTS']:
+        path = contract_module_path(contract_name, contracts_dir)
+        if contract_name in rendered:
+            path.write_text(rendered[contract_name])
         written_paths.append(path)
     
     return written_paths
@@ -110,11 +203,20 @@ def write_classes_for_abis( project_name:str,
 def write_contract_wrapper_module(contract_name:str, 
                                   contract_dicts:Sequence[Dict], 
                                   contract_address:Union[HexAddress, Dict[str, HexAddress]], 
-                                  super_dir:Path) -> Path:
-
-    abi_str = ',\n    '.join((json.dumps(d) for d in contract_dicts))
-    abi_str = indent(abi_str, INDENT)
+                                  super_dir:Path,
+                                  fast_calls=False,
+                                  async_wrappers=False) -> Path:
+    module_str = render_contract_wrapper_module(contract_name, contract_dicts, contract_address, 
+                                                fast_calls, async_wrappers)
+    contract_path = contract_module_path(contract_name, super_dir)
+    contract_path.write_text(module_str)
+    return contract_path
 
+def render_contract_wrapper_module(contract_name:str, 
+                                   contract_dicts:Sequence[Dict], 
+                                   contract_address:Union[HexAddress, Dict[str, HexAddress]],
+                                   fast_calls=False,
+                                   async_wrappers=False) -> str:
     multichain = isinstance(contract_address, dict)
     custom_contract = (contract_address is None or multichain and None in contract_address.values())
 
@@ -122,49 +224,98 @@ def write_contract_wrapper_module(contract_name:str,
     module_str = python_class_str_for_contract_dicts(contract_name, 
                                                 contract_dicts, 
                                                 contract_address, 
-                                                abi_str,
-                                                superclass_name)
-
-
-    contract_path = (super_dir / to_snake_case(contract_name)).with_suffix('.py')
-    contract_path.write_text(module_str)
-    return contract_path
+                                                abi_name(contract_dicts),
+                                                superclass_name,
+                                                fast_calls,
+                                                async_wrappers)
+    return module_str
+
+def canonical_abi_json(contract_dicts:Sequence[Dict]) -> str:
+    # ABIs that differ only in entry or key order describe the same contract
+    entries = sorted(json.dumps(d, sort_keys=True) for d in contract_dicts)
+    return '[' + ','.join(entries) + ']'
+
+def abi_name(contract_dicts:Sequence[Dict]) -> str:
+    # Name of a contract's ABI in the shared abis module. Based only on the 
+    # ABI's content, so a contract module doesn't change when other contracts do
+    digest = hashlib.sha256(canonical_abi_json(contract_dicts).encode()).hexdigest()
+    return f'ABI_{digest[:16]}'
+
+def abi_str_for_contract_dicts(contract_dicts:Sequence[Dict]) -> str:
+    # Minified, one line per ABI
+    return json.dumps(contract_dicts, separators=(',', ':'))
+
+def write_shared_abis_file(project_dict:Dict, project_dir:Path) -> Path | None:
+    # Bundles often hold several deployments of one contract (e.g. ERC20s), so 
+    # rather than a copy of the ABI in each contract module, every distinct ABI
+    # is written once to a sidecar file, read by the abis template module the 
+    # first time a contract is built. Contracts with the same ABI then share a 
+    # single string, which abi_registry parses once per process.
+    # Returns None if an identical file was already present
+    abi_strs: Dict[str, str] = {}
+    for info in project_dict['CONTRACTS'].values():
+        name = abi_name(info['ABI'])
+        if name not in abi_strs:
+            abi_strs[name] = abi_str_for_contract_dicts(info['ABI'])
+
+    sidecar_str = ''.join(f'{name} {abi_str}\n' for name, abi_str in abi_strs.items())
+    abis_path = project_dir / 'abis.txt'
+    if not write_if_changed(abis_path, sidecar_str):
+        return None
+    return abis_path
+
+def contract_module_path(contract_name:str, super_dir:Path) -> Path:
+    return (super_dir / to_snake_case(contract_name)).with_suffix('.py')
 
 def write_all_contracts_wrapper(project_name:str, 
                                 project_dict:Dict, 
                                 contract_paths:Sequence[Path],
-                                project_dir:Path) -> Path:
-    init_strs = []
+                                project_dir:Path,
+                                async_wrappers=False) -> Path | None:
+    # Returns None if an identical file was already present
+    property_strs = []
+    async_property_strs = []
     import_strs = []
 
     contract_dicts = project_dict['CONTRACTS']
     # Figure out if this is a multichain contract
     single_dict:Dict = next(iter(contract_dicts.values()))
     is_multichain = isinstance(single_dict.get('ADDRESS'), dict)
-    chain_arg = ''
     chain_type_arg = ''
     chain_self = ''
     if is_multichain:
-        chain_arg = 'self.chain_key, '
         chain_type_arg = 'chain_key:str, '
         chain_self = '\n        self.chain_key = chain_key'
 
     default_rpc = project_dict.get('DEFAULT_RPC', None)
 
-    for class_name, module_path in zip(contract_dicts.keys(), contract_paths):
+    for contract_name, module_path in zip(contract_dicts.keys(), contract_paths):
         module_name = module_path.stem
-        address_desc = contract_dicts[class_name]['ADDRESS']
+        # Match the class name written in python_class_str_for_contract_dicts()
+        class_name = inflection.camelize(contract_name)
+        address_desc = contract_dicts[contract_name]['ADDRESS']
         custom_contracts = ((is_multichain and not any(dict(address_desc).values()))
                             or (not is_multichain and not address_desc))
         # subclasses of AbiMultiContractWrapper (== ERC20, for now)
         # don't have a chain key or contract as part of their args
-        chain_arg = '' if custom_contracts else 'self.chain_key, '
-
-        import_strs.append(f'from .contracts.{module_name} import {class_name}')
-        init_strs.append(indent(f'self.{module_name} = {class_name}({chain_arg}self.rpc)', INDENT*2))
+        chain_arg = 'self.chain_key, ' if (is_multichain and not custom_contracts) else ''
+
+        # Contract modules are only imported for type checkers at module level;
+        # at runtime each one is imported and built the first time its 
+        # attribute is read, then cached on the instance by cached_property.
+        # cached_property doesn't lock, so _build() makes sure threads reading
+        # a contract at the same time all get the same wrapper
+        class_names = [class_name, f'Async{class_name}'] if async_wrappers else [class_name]
+        import_strs.append(indent(f'from .contracts.{module_name} import {", ".join(class_names)}', INDENT))
+        for cls, prop_strs in zip(class_names, (property_strs, async_property_strs)):
+            prop_strs.append(indent(dedent(f'''
+                @cached_property
+                def {module_name}(self) -> '{cls}':
+                    from .contracts.{module_name} import {cls}
+                    return self._build('{module_name}', lambda: {cls}({chain_arg}self.rpc))'''), INDENT))
 
     imports = '\n'.join(import_strs)
-    inits = '\n'.join(init_strs)
+    properties = '\n'.join(property_strs)
     default_rpc_declaration = ''
     default_rpc_setting = ''
     if default_rpc:
@@ -172,36 +323,162 @@ def write_all_contracts_wrapper(project_name:str,
             rpc_str = json_nest_dict_to_depth(default_rpc, 1)
             default_rpc_setting = ' or DEFAULT_RPC[chain_key]'
         else:
-            rpc_str = f'"{default_rpc}"'
+            # A list of RPCs is used with failover
+            rpc_str = json.dumps(default_rpc)
             default_rpc_setting = ' or DEFAULT_RPC'
         default_rpc_declaration = f'\nDEFAULT_RPC = {rpc_str}'
 
+    contract_names = ''.join(f"\n        '{p.stem}'," for p in contract_paths)
+
     class_str = dedent(
 f'''
 #! /usr/bin/env python
-
+from functools import cached_property
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Sequence
+
+# Nothing here imports web3; that waits until the first contract is built
+if TYPE_CHECKING:
+    from .multicall import CallBatch
+    from .solidity_types import BlockIdentifier
 {imports}
 {default_rpc_declaration}
 
 class All{project_name.capitalize()}Contracts:
+    # Attribute names of every contract available on this class
+    CONTRACT_NAMES = ({contract_names}
+    )
+
     # TODO: we might want to be able to specify other traits, like gas fees or timeout
-    def __init__(self, {chain_type_arg}rpc:str | None = None):
+    def __init__(self, {chain_type_arg}rpc:str | Sequence[str] | None = None):
+        self.rpc = rpc{default_rpc_setting}{chain_self}
+        self._lock = threading.Lock()
+
+    def load_all(self) -> None:
+        # Contracts are normally built on first access. Build them all now
+        for name in self.CONTRACT_NAMES:
+            getattr(self, name)
+
+    def _build(self, name:str, make:Callable[[], Any]) -> Any:
+        # Called by the contract properties. Contracts are built once per 
+        # instance, even with several threads asking for one at the same time
+        with self._lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = make()
+            return self.__dict__[name]
+
+    def batch(self, 
+              block_identifier:'BlockIdentifier' = 'latest', 
+              multicall_address:str | None = None,
+              chunk_size:int | None = None) -> 'CallBatch':
+        # Queue view calls on any of these contracts & run them with Multicall3:
+        #   with contracts.batch() as b:
+        #       futures = [contracts.hero_core.get_hero(h, batch=b) for h in hero_ids]
+        from .multicall import CallBatch, MULTICALL3_ADDRESS, DEFAULT_CHUNK_SIZE
+        return CallBatch(block_identifier, 
+                         multicall_address or MULTICALL3_ADDRESS, 
+                         chunk_size or DEFAULT_CHUNK_SIZE)
+{properties}
+
+'''
+)
+    if async_wrappers:
+        async_properties = '\n'.join(async_property_strs)
+        class_str += dedent(
+f'''
+class AsyncAll{project_name.capitalize()}Contracts:
+    # Same contracts as All{project_name.capitalize()}Contracts, with awaitable methods
+    CONTRACT_NAMES = All{project_name.capitalize()}Contracts.CONTRACT_NAMES
+
+    def __init__(self, {chain_type_arg}rpc:str | Sequence[str] | None = None):
         self.rpc = rpc{default_rpc_setting}{chain_self}
+        self._lock = threading.Lock()
+
+    def load_all(self) -> None:
+        for name in self.CONTRACT_NAMES:
+            getattr(self, name)
 
-{inits}
+    _build = All{project_name.capitalize()}Contracts._build
+{async_properties}
 
 '''
 )
 
     all_contract_path = project_dir / f'all_{project_name.lower()}_contracts.py'
-    all_contract_path.write_text(class_str)
+    if not write_if_changed(all_contract_path, class_str):
+        return None
     return all_contract_path
 
+def write_package_inits(project_name:str,
+                        project_dict:Dict,
+                        contract_paths:Sequence[Path],
+                        project_dir:Path,
+                        async_wrappers=False) -> List[Path]:
+    # The package & its contracts/ dir get __init__ modules that import names 
+    # on first access, so `from dfk import AllDfkContracts` or 
+    # `from dfk.contracts import HeroCore` only load what they name.
+    # Returns the paths that changed
+    aggregator_module = f'all_{project_name.lower()}_contracts'
+    aggregator_classes = [f'All{project_name.capitalize()}Contracts']
+    contract_classes: Dict[str, str] = {}
+    for contract_name, module_path in zip(project_dict['CONTRACTS'], contract_paths):
+        class_name = inflection.camelize(contract_name)
+        contract_classes[class_name] = module_path.stem
+        if async_wrappers:
+            contract_classes[f'Async{class_name}'] = module_path.stem
+    if async_wrappers:
+        aggregator_classes.append(f'Async{aggregator_classes[0]}')
+
+    inits = {
+        project_dir / '__init__.py': lazy_init_str({c: aggregator_module for c in aggregator_classes}),
+        project_dir / 'contracts' / '__init__.py': lazy_init_str(contract_classes),
+    }
+    return [path for path, init_str in inits.items() if write_if_changed(path, init_str)]
+
+def lazy_init_str(lazy_attrs:Dict[str, str]) -> str:
+    # An __init__ module whose attributes are the classes in `lazy_attrs` 
+    # ({class name: submodule}) and its submodules, each imported when first read
+    type_imports = '\n'.join(f'    from .{module} import {cls}' for cls, module in lazy_attrs.items())
+    attr_lines = ''.join(f"\n    '{cls}': '{module}'," for cls, module in lazy_attrs.items())
+    return dedent(
+f'''
+#! /usr/bin/env python
+import importlib
+
+from typing import TYPE_CHECKING, Any
+
+# Nothing is imported until it's used: attribute access or `from . import x`
+# imports the module it's in the first time
+if TYPE_CHECKING:
+{type_imports}
+
+# class name: module it's defined in
+_LAZY_ATTRS = {{{attr_lines}
+}}
+
+__all__ = list(_LAZY_ATTRS)
+
+def __getattr__(name:str) -> Any:
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(f'.{{_LAZY_ATTRS[name]}}', __name__), name)
+    else:
+        try:
+            value = importlib.import_module(f'.{{name}}', __name__)
+        except ModuleNotFoundError as e:
+            if e.name != f'{{__name__}}.{{name}}':
+                raise
+            raise AttributeError(f"module {{__name__!r}} has no attribute {{name!r}}") from None
+    globals()[name] = value
+    return value
+''').lstrip()
+
 def python_class_str_for_contract_dicts(contract_name:str, 
                                         contract_dicts:Sequence[Dict], 
                                         contract_address:Union[None, HexAddress, Dict[str, HexAddress]],
-                                        abi_str:str, 
-                                        superclass_name:str = 'ABIContractWrapper' ) -> str:
+                                        abi_name:str, 
+                                        superclass_name:str = 'ABIContractWrapper',
+                                        fast_calls=False,
+                                        async_wrappers=False ) -> str:
     # There are two binary options for how we write contracts:
     # - contract may or may not be multichain, in which case CONTRACT_ADDRESS 
     #   is written as a dictionary rather than a single string, or
@@ -227,41 +504,251 @@ def python_class_str_for_contract_dicts(contract_name:str,
             contract_setter = 'contract_address = CONTRACT_ADDRESS[chain_key]'
     else:
         address_str = 'None' if custom_contract else f'"{contract_address}"'
+        if not custom_contract:
+            contract_setter = 'contract_address = CONTRACT_ADDRESS'
 
-    custom_contract_init = dedent(f'''    def __init__(self, rpc:str):
+    custom_contract_init = dedent(f'''    def __init__(self, rpc:str | Sequence[str]):
                 super().__init__(abi=ABI, rpc=rpc)
     ''')
 
-    fixed_contract_init = dedent(f'''    def __init__(self, {chain_type_arg}rpc:str):
+    fixed_contract_init = dedent(f'''    def __init__(self, {chain_type_arg}rpc:str | Sequence[str]):
                 {contract_setter}
                 super().__init__(contract_address=contract_address, abi=ABI, rpc=rpc)
     ''')
 
     init_str = custom_contract_init if custom_contract else fixed_contract_init
 
+    # With async_wrappers, an Async<Contract> class with awaitable methods 
+    # follows the regular class
+    async_superclass_name = f'Async{superclass_name}'
+    superclass_imports = f'from ..{superclass_module} import {superclass_name}'
+    if async_wrappers:
+        superclass_imports += f'\nfrom ..async_abi_contract_wrapper import {async_superclass_name}'
+
+    # Views that return structs return NamedTuple classes built from the ABI
+    class_names, struct_dicts = struct_classes_for_outputs(contract_dicts)
+    struct_tables = result_converters_str(contract_dicts, class_names)
+    if struct_dicts:
+        struct_tables = struct_classes_str(class_names, struct_dicts) + '\n' + struct_tables
+
+    # All but the first line need the template's indentation so dedent() lines up
+    selector_tables = indent(selector_tables_str(contract_dicts), INDENT)[len(INDENT):]
+    struct_tables = indent(struct_tables, INDENT)[len(INDENT):]
+    superclass_imports = indent(superclass_imports, INDENT)[len(INDENT):]
+
     class_str = dedent(
     f'''
-    from ..{superclass_module} import {superclass_name}
+    {superclass_imports}
     from ..solidity_types import *
     from ..credentials import Credentials
+    from ..multicall import CallBatch
+    from ..receipt_watcher import PendingTransaction
+    from ..abis import {abi_name} as ABI
 
     CONTRACT_ADDRESS = {address_str}
 
-    ABI = """[
-    {abi_str}
-    ]
-    """     
+    {selector_tables}
+
+    {struct_tables}
 
     class {inflection.camelize(contract_name)}({superclass_name}):
+        FUNCTION_SELECTORS = FUNCTION_SELECTORS
+        EVENT_TOPICS = EVENT_TOPICS
+        RESULT_CONVERTERS = RESULT_CONVERTERS
+
         {init_str}''')
-    func_strs = [function_body(d, custom_contract) for d in contract_dicts]
+    func_strs = [function_body(d, custom_contract, fast_calls, class_names=class_names) for d in contract_dicts]
     # remove empty strs
     func_strs = [f for f in func_strs if f]
 
     class_str += f'\n'.join(func_strs)
+
+    if async_wrappers:
+        # This template sits one level deeper than the one above
+        init_str = indent(init_str, INDENT)[len(INDENT):]
+        class_str += dedent(
+        f'''
+
+
+        class Async{inflection.camelize(contract_name)}({async_superclass_name}):
+            FUNCTION_SELECTORS = FUNCTION_SELECTORS
+            EVENT_TOPICS = EVENT_TOPICS
+            RESULT_CONVERTERS = RESULT_CONVERTERS
+
+            {init_str}''')
+        async_func_strs = [function_body(d, custom_contract, fast_calls, is_async=True, class_names=class_names) for d in contract_dicts]
+        class_str += f'\n'.join([f for f in async_func_strs if f])
+
     return class_str
 
-def function_body(function_dict:Dict, custom_contract=False) -> str:
+def selector_tables_str(contract_dicts:Sequence[Dict]) -> str:
+    # Precompute what web3 would otherwise derive at runtime for every contract
+    # object it builds: function selectors with their ABI types, and event
+    # topic hashes. Overloaded functions are keyed by name, so (as with the 
+    # generated methods) the last definition wins
+    selector_strs = []
+    topic_strs = []
+    for d in contract_dicts:
+        name = d.get('name')
+        if not name:
+            continue
+        if d['type'] == 'function':
+            selector = '0x' + keccak(text=abi_signature(d))[:4].hex()
+            input_types = tuple(canonical_abi_type(i) for i in d['inputs'])
+            output_types = tuple(canonical_abi_type(o) for o in d.get('outputs', []))
+            selector_strs.append(f"'{name}': ('{selector}', {input_types!r}, {output_types!r}),")
+        elif d['type'] == 'event' and not d.get('anonymous'):
+            topic = '0x' + keccak(text=abi_signature(d)).hex()
+            topic_strs.append(f"'{topic}': {d!r},")
+
+    selectors = indent('\n'.join(selector_strs), INDENT)
+    topics = indent('\n'.join(topic_strs), INDENT)
+    return (f'# Function name: (4-byte selector, input types, output types)\n'
+            f'FUNCTION_SELECTORS = {{\n{selectors}\n}}\n\n'
+            f'# Event topic0: event ABI\n'
+            f'EVENT_TOPICS = {{\n{topics}\n}}')
+
+def abi_signature(function_dict:Dict) -> str:
+    # e.g. 'transferFrom(address,address,uint256)'
+    input_types = ','.join(canonical_abi_type(i) for i in function_dict['inputs'])
+    return f"{function_dict['name']}({input_types})"
+
+def canonical_abi_type(arg_dict:Dict) -> str:
+    # Structs appear in ABIs as 'tuple' (or 'tuple[]', etc.) with their fields in 
+    # 'components'. The canonical form spells the fields out: '(uint256,address)[]'
+    type_str = arg_dict['type']
+    if type_str.startswith('tuple'):
+        components = ','.join(canonical_abi_type(c) for c in arg_dict['components'])
+        return f'({components}){type_str[len("tuple"):]}'
+    return type_str
+
+def struct_key(arg_dict:Dict) -> Tuple[str, str] | None:
+    # Structs show up as tuples with an internalType like 'struct IHeroTypes.Hero[]'.
+    # Two structs are the same if they have the same name & named fields.
+    # Plain tuples (no internalType) don't get a class
+    internal_type = arg_dict.get('internalType') or ''
+    if not (arg_dict['type'].startswith('tuple') and internal_type.startswith('struct ')):
+        return None
+    struct_name = re.sub(r'\[\d*\]', '', internal_type[len('struct '):])
+    fields = ','.join(f"{c['name']}:{canonical_abi_type(c)}" for c in arg_dict['components'])
+    return (struct_name, fields)
+
+def struct_classes_for_outputs(contract_dicts:Sequence[Dict]) -> Tuple[Dict[Tuple[str, str], str], List[Dict]]:
+    # Class names for every struct returned by a view, plus each struct's ABI 
+    # dict, nested structs first so classes can refer to them. Names are the 
+    # struct's own name unless two different structs share it, in which case
+    # the library/contract prefix is kept, e.g. IHeroTypesHero
+    struct_dicts: Dict[Tuple[str, str], Dict] = {}
+    def collect(arg_dict:Dict) -> None:
+        if not arg_dict['type'].startswith('tuple'):
+            return
+        for c in arg_dict['components']:
+            collect(c)
+        key = struct_key(arg_dict)
+        if key is not None and key not in struct_dicts:
+            struct_dicts[key] = arg_dict
+
+    for d in contract_dicts:
+        if d['type'] == 'function' and d.get('stateMutability') in ('view', 'pure'):
+            for o in d.get('outputs', []):
+                collect(o)
+
+    short_names = [key[0].split('.')[-1] for key in struct_dicts]
+    class_names: Dict[Tuple[str, str], str] = {}
+    for key, short_name in zip(struct_dicts, short_names):
+        class_name = short_name if short_names.count(short_name) == 1 else key[0].replace('.', '')
+        class_name = inflection.camelize(class_name)
+        while class_name in class_names.values():
+            class_name += '_'
+        class_names[key] = class_name
+    return class_names, list(struct_dicts.values())
+
+def struct_field_names(components:Sequence[Dict]) -> List[str]:
+    # NamedTuple fields can't start with an underscore or be keywords
+    names = []
+    for i, c in enumerate(components):
+        name = to_snake_case(c['name']).lstrip('_')
+        if not name:
+            name = f'field_{i}'
+        if keyword.iskeyword(name):
+            name += '_'
+        while name in names:
+            name += '_'
+        names.append(name)
+    return names
+
+def struct_conversion_expr(arg_dict:Dict, expr:str, class_names:Dict[Tuple[str, str], str], depth:int=0) -> str:
+    # Python expression turning the decoded value `expr` into struct classes.
+    # Returns `expr` unchanged if there are no structs to convert
+    type_str = arg_dict['type']
+    array_match = re.search(r'\[\d*\]$', type_str)
+    if array_match:
+        item_dict = {**arg_dict, 'type': type_str[:array_match.start()]}
+        item_var = f'x{depth}'
+        item_expr = struct_conversion_expr(item_dict, item_var, class_names, depth + 1)
+        if item_expr == item_var:
+            return expr
+        return f'[{item_expr} for {item_var} in {expr}]'
+    key = struct_key(arg_dict)
+    if key in class_names:
+        return f'{class_names[key]}.from_tuple({expr})'
+    return expr
+
+def struct_classes_str(class_names:Dict[Tuple[str, str], str], struct_dicts:Sequence[Dict]) -> str:
+    # A NamedTuple per struct. They're still tuples, so existing code that 
+    # indexes or compares results keeps working, at no extra memory per result
+    class_strs = []
+    for d in struct_dicts:
+        class_name = class_names[struct_key(d)] # type: ignore
+        field_names = struct_field_names(d['components'])
+        fields = []
+        for name, c in zip(field_names, d['components']):
+            fields.append(f'{name}: {abi_type_to_hint(c, is_output=True, class_names=class_names)}')
+        conversions = [struct_conversion_expr(c, f't[{i}]', class_names) for i, c in enumerate(d['components'])]
+        if all(conv == f't[{i}]' for i, conv in enumerate(conversions)):
+            from_tuple = 'return cls._make(t)'
+        else:
+            from_tuple = f"return cls({', '.join(conversions)})"
+        fields_str = indent('\n'.join(fields), INDENT)
+        class_strs.append(
+            f'class {class_name}(NamedTuple):\n'
+            f'{fields_str}\n\n'
+            f'{INDENT}@classmethod\n'
+            f"{INDENT}def from_tuple(cls, t:Sequence) -> '{class_name}':\n"
+            f'{INDENT*2}{from_tuple}\n')
+    return '\n'.join(class_strs)
+
+def result_converters_str(contract_dicts:Sequence[Dict], class_names:Dict[Tuple[str, str], str]) -> str:
+    # Function name: callable turning a view's decoded result into struct 
+    # classes, for views that return structs
+    converter_strs = []
+    for d in contract_dicts:
+        name = d.get('name')
+        if not name or d['type'] != 'function' or d.get('stateMutability') not in ('view', 'pure'):
+            continue
+        outputs = d.get('outputs', [])
+        if len(outputs) == 1:
+            expr = struct_conversion_expr(outputs[0], 'r', class_names)
+        else:
+            exprs = [struct_conversion_expr(o, f'r[{i}]', class_names) for i, o in enumerate(outputs)]
+            expr = 'r' if all(e == f'r[{i}]' for i, e in enumerate(exprs)) else f"[{', '.join(exprs)}]"
+        if expr == 'r':
+            continue
+        if expr.endswith('.from_tuple(r)') and expr.count('(') == 1:
+            converter = expr[:-len('(r)')]
+        else:
+            converter = f'lambda r: {expr}'
+        converter_strs.append(f"'{name}': {converter},")
+    converters = indent('\n'.join(converter_strs), INDENT)
+    return (f'# Function name: converts decoded results to struct classes\n'
+            f'RESULT_CONVERTERS = {{\n{converters}\n}}')
+
+def function_body(function_dict:Dict, custom_contract=False, fast_calls=False, is_async=False, class_names=None) -> str:
+    # fast_calls: views encode calldata & decode results themselves, with the
+    # types in the module's FUNCTION_SELECTORS table, rather than going
+    # through web3's per-call function lookup & argument matching
+    # is_async: write an `async def` method for an Async<Contract> class
+    # class_names: struct classes for view outputs, used in return type hints
 
     body = ''
     if function_dict['type'] != 'function':
@@ -282,37 +769,66 @@ def function_body(function_dict:Dict, custom_contract=False) -> str:
     solidity_args = [solidity_arg_name_to_pep_8(i['name']) for i in function_dict['inputs']]
     solidity_args = increment_empty_args(solidity_args, 'a')
     solidity_args_str = ', '.join(solidity_args)
+    solidity_args_tuple = f'({solidity_args_str},)' if len(solidity_args) == 1 else f'({solidity_args_str})'
 
     is_view = function_dict['stateMutability'] in ('view', 'pure')
 
     # We return 2 types of functions: contract function calls (views) & transactions,
     # and we return slightly different functions for standard contracts vs
     # currencies (like ERC20s) that create a contract object for each transaction
-    def_func = function_signature(function_dict, custom_contract=custom_contract)
-    if custom_contract:
-        if is_view:
-            body = dedent(f'''
-            {def_func}
-                contract = self.get_custom_contract(contract_address, abi=self.abi)
-                return contract.functions.{contract_func_name}({solidity_args_str}).call()''')
-        else:
-            body = dedent(f'''
-            {def_func}
-                contract = self.get_custom_contract(contract_address, abi=self.abi)
-                tx = contract.functions.{contract_func_name}({solidity_args_str})
-                return self.send_transaction(tx, cred)''')
+    def_func = function_signature(function_dict, custom_contract=custom_contract, is_async=is_async, class_names=class_names)
+    if is_async:
+        return indent(async_function_body(def_func, contract_func_name, solidity_args_str, solidity_args_tuple, 
+                                          is_view, custom_contract, fast_calls), INDENT)
+    if is_view:
+        # view_call() goes through web3's contract functions, or through the
+        # view cache when that's enabled. See view_cache.py
+        call_method = 'fast_call' if fast_calls else 'view_call'
+        address_arg = ', contract_address=contract_address' if custom_contract else ''
+        body = dedent(f'''
+        {def_func}
+            return self.{call_method}('{contract_func_name}', {solidity_args_tuple}, block_identifier{address_arg}, batch=batch)''')
+    elif custom_contract:
+        body = dedent(f'''
+        {def_func}
+            contract = self.get_custom_contract(contract_address, abi=self.abi)
+            tx = contract.functions.{contract_func_name}({solidity_args_str})
+            return self.send_transaction(tx, cred, wait=wait)''')
     else:
-        if is_view:
-            body = dedent(f'''
-            {def_func}
-                return self.contract.functions.{contract_func_name}({solidity_args_str}).call(block_identifier=block_identifier)''')
-        else:
-            body = dedent(f'''
-            {def_func}
-                tx = self.contract.functions.{contract_func_name}({solidity_args_str})
-                return self.send_transaction(tx, cred)''')
+        body = dedent(f'''
+        {def_func}
+            tx = self.contract.functions.{contract_func_name}({solidity_args_str})
+            return self.send_transaction(tx, cred, wait=wait)''')
     return indent(body, INDENT)
 
+def async_function_body(def_func:str,
+                        contract_func_name:str,
+                        solidity_args_str:str,
+                        solidity_args_tuple:str,
+                        is_view:bool,
+                        custom_contract:bool,
+                        fast_calls:bool) -> str:
+    # Same shapes as the sync methods in function_body(), with network calls awaited.
+    # Multicall batches are sync-only, so there's no batch argument
+    if is_view:
+        call_method = 'fast_call' if fast_calls else 'view_call'
+        address_arg = ', contract_address=contract_address' if custom_contract else ''
+        return dedent(f'''
+        {def_func}
+            return await self.{call_method}('{contract_func_name}', {solidity_args_tuple}, block_identifier{address_arg})''')
+
+    contract_str = 'self.contract'
+    get_contract_str = ''
+    if custom_contract:
+        contract_str = 'contract'
+        get_contract_str = '\ncontract = self.get_custom_contract(contract_address, abi=self.abi)'
+    get_contract_str = indent(get_contract_str, INDENT*3)
+
+    return dedent(f'''
+        {def_func}{get_contract_str}
+            tx = {contract_str}.functions.{contract_func_name}({solidity_args_str})
+            return await self.send_transaction(tx, cred, wait=wait)''')
+
 def solidity_arg_name_to_pep_8(arg_name:Optional[str]) -> str:
     # Note: some arg names are empty ("name":""). We depend
     # on the calling function to do something like `increment_empty_args()`
@@ -334,7 +850,7 @@ def increment_empty_args(args:Sequence[str], incr_char='a') -> List[str]:
         
     return args_out
 
-def function_signature(function_dict:Dict, custom_contract=False) -> str:
+def function_signature(function_dict:Dict, custom_contract=False, is_async=False, class_names=None) -> str:
     # TODO: add type hints
     contract_func_name = function_dict['name']
     func_name = to_snake_case(contract_func_name)
@@ -345,9 +861,9 @@ def function_signature(function_dict:Dict, custom_contract=False) -> str:
     # Transactions require a Credentials argument to sign with; add it
     if is_transaction:
         inputs.append('cred:Credentials')
-        return_type = ' -> TxReceipt'
+        return_type = ' -> TxReceipt | PendingTransaction'
     else:
-        return_type = f' -> {get_output_types(function_dict["outputs"])}'
+        return_type = f' -> {get_output_types(function_dict["outputs"], class_names)}'
 
     if custom_contract:
         inputs.append('contract_address:address')
@@ -361,26 +877,37 @@ def function_signature(function_dict:Dict, custom_contract=False) -> str:
         arg_type = abi_type_to_hint(arg_dict, is_output=False)
         inputs.append(f'{arg_name}:{arg_type}')
 
-    if not is_transaction:
+    # With wait=False, transactions return a PendingTransaction future without waiting for a receipt
+    if is_transaction:
+        inputs.append('wait:bool = True')
+    else:
         inputs.append(f"block_identifier:BlockIdentifier = 'latest'")
+        # If a batch is given, the call is queued in it and a Future is returned
+        if not is_async:
+            inputs.append(f"batch:CallBatch | None = None")
 
     inputs_str = ', '.join(inputs)
 
-    sig = f'def {func_name}({inputs_str}){return_type}:'
+    def_str = 'async def' if is_async else 'def'
+    sig = f'{def_str} {func_name}({inputs_str}){return_type}:'
     return sig
 
-def get_output_types(outputs_list:Sequence[Dict]) -> str:
+def get_output_types(outputs_list:Sequence[Dict], class_names:Dict[Tuple[str, str], str] | None = None) -> str:
     if len(outputs_list) == 0:
         return 'None'
     else:
         if len(outputs_list) == 1:
-            return abi_type_to_hint(outputs_list[0], is_output=True)
+            return abi_type_to_hint(outputs_list[0], is_output=True, class_names=class_names)
         else:
-            out_types_str = ', '.join([abi_type_to_hint(o, is_output=True) for o in outputs_list])
+            out_types_str = ', '.join([abi_type_to_hint(o, is_output=True, class_names=class_names) for o in outputs_list])
             return f'Tuple[{out_types_str}]'
 
-def abi_type_to_hint(arg_dict:Dict, is_output=False) -> str:
+def abi_type_to_hint(arg_dict:Dict, is_output=False, class_names:Dict[Tuple[str, str], str] | None = None) -> str:
+    # class_names: struct classes generated for view outputs. See struct_classes_for_outputs()
     type_in = arg_dict['type']
+    key = struct_key(arg_dict)
+    if class_names and key in class_names:
+        type_in = class_names[key] + type_in[len('tuple'):]
     
     # Figure out if this is a (possibly nested) list type
     bracket_pair_re = re.compile(r'\[\d*\]')
@@ -505,6 +1032,41 @@ def make_ordered_dict(d: Union[List, Dict], exclude_infra_funcs=True) -> Union[L
 
     return new_dict
 
+# ===========================
+# = INCREMENTAL REGENERATION =
+# ===========================
+def contract_hash(contract_name:str, contract_info:Dict, options:Dict[str, Any] | None = None) -> str:
+    # Everything that goes into a contract module: its name, ABI & address(es),
+    # and the generator (and generator options) that render them
+    key = [GENERATOR_VERSION, contract_name, contract_info['ABI'], contract_info.get('ADDRESS'), options or {}]
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def read_manifest(project_dir:Path) -> Dict | None:
+    manifest_path = project_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except ValueError:
+        return None
+    if not isinstance(manifest.get('contracts'), dict):
+        return None
+    return manifest
+
+def write_if_changed(path:Path, text:str) -> bool:
+    # Leave identical files alone so their mtimes (and any caches keyed 
+    # on them) stay valid. Returns True if the file was written
+    if path.exists() and path.read_text() == text:
+        return False
+    path.write_text(text)
+    return True
+
+def copy_if_changed(src:Path, dest:Path) -> bool:
+    if dest.exists() and dest.read_bytes() == src.read_bytes():
+        return False
+    shutil.copy(src, dest)
+    return True
+
 # ===========
 # = HELPERS =
 # ===========
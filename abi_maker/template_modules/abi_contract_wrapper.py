@@ -1,132 +1,306 @@
 #! /usr/bin/env python
+import warnings
+
 from web3 import Web3
-from web3.middleware.geth_poa import geth_poa_middleware
-from web3.logs import DISCARD
+from web3.exceptions import BadFunctionCallOutput
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from eth_abi.exceptions import DecodingError, EncodingError
 
+from . import abi_registry, gas_cache, metrics, view_cache
+from .provider_registry import get_w3, rpc_key
 from .credentials import Credentials
+from .multicall import CallBatch, MULTICALL3_ADDRESS, DEFAULT_CHUNK_SIZE
+from .nonce_manager import NONCE_MANAGER, is_nonce_error, chain_id_for_rpc
+from .receipt_watcher import PendingTransaction, watcher_for_rpc
+from .fee_oracle import FeeOracle, oracle_for_rpc, cap_fees
+from .gas_cache import GasKey, arg_shape
+from .event_decoder import EventDecoder, decoder_for_topics, decoder_for_abi
+from .view_cache import resolve_block, LATEST
+from .metrics import instrumented
 
-from .solidity_types import (address, ChecksumAddress, TxReceipt, AttributeDict)
+from .solidity_types import (address, ChecksumAddress, TxReceipt, AttributeDict, BlockIdentifier, HexStr, HexBytes)
 from web3.contract.contract import Contract
-from typing import Dict, Tuple, Union, Optional, Any, Sequence
+from typing import Dict, List, Tuple, Any, Sequence, Hashable, Callable
 
 DEFAULT_TIMEOUT = 30
 DEFAULT_MAX_GAS = 50
 DEFAULT_MAX_PRIORITY_GAS = 3
-
-W3_INSTANCES: Dict[str, Web3] = {}
+# Times to refetch the nonce and resend after a nonce error
+NONCE_RETRIES = 2
 
 class ABIContractWrapper:
+    # Generated subclasses override these with tables computed from their ABI 
+    # at generation time, so we don't have to hash signatures at runtime.
+    # Function name: (4-byte selector, input types, output types)
+    FUNCTION_SELECTORS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = {}
+    # Event topic0: event ABI
+    EVENT_TOPICS: Dict[str, Dict[str, Any]] = {}
+    # Function name: converts a view's decoded result to generated struct classes
+    RESULT_CONVERTERS: Dict[str, Callable[[Any], Any]] = {}
+
     def __init__(self, 
                  contract_address:str, 
                  abi:str,
-                 rpc:str,
+                 rpc:str | Sequence[str],
                  max_gas_gwei:float=DEFAULT_MAX_GAS,
                  max_priority_gwei:float=DEFAULT_MAX_PRIORITY_GAS):
-        self.rpc = rpc
+        # A list of URLs is used with failover. See provider_registry.rpc_key()
+        self.rpc = rpc_key(rpc)
         # self.contract_address = contract_address
         self.abi = abi
-        self.nonces: Dict[address, int] = {}
         self.timeout = DEFAULT_TIMEOUT
 
         # This one superclass may be used by many contracts, who don't all need to
-        # create separate Web3 instances. Just use one per RPC
-        global W3_INSTANCES
-        w3 = W3_INSTANCES.get(self.rpc, None)
-        if not w3:
-            w3 = Web3(Web3.HTTPProvider(self.rpc))
-            w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-            W3_INSTANCES[self.rpc] = w3
-        self.w3 = w3
+        # create separate Web3 instances. Just use one per RPC. See provider_registry.py
+        self.w3 = get_w3(self.rpc)
         self.contract_address:ChecksumAddress = self.w3.to_checksum_address(contract_address)
 
         self.max_gas_wei = self.w3.to_wei(max_gas_gwei, 'gwei')
         self.max_priority_wei = self.w3.to_wei(max_priority_gwei, 'gwei')
+        self.fee_oracle: FeeOracle | None = oracle_for_rpc(self.rpc)
 
-        self.contract = self.w3.eth.contract(self.contract_address, abi=self.abi)
-
-    def get_nonce_and_update(self, address:address, force_fetch=True) -> int:
-        # FIXME: I think there's a bug in the caching logic below that lets
-        # nonces run ahead of where they should be and causes transactions to
-        # fail.
-        # So force_fetch is set to true, which fetches the appropriate nonce for
-        # every transaction
-        # - Athiriyya 13 December 2022
+        # Parsed ABIs and contract objects are shared process-wide. See abi_registry.py
+        self.contract = abi_registry.get_contract(self.w3, self.contract_address, self.abi)
 
-        # We keep track of our own nonce, and only re-fetch it if a 'nonce too low'
-        # error gets thrown       
-        nonce = self.nonces.get(address, 0) 
-        if force_fetch or nonce == 0:
-            nonce = self.w3.eth.get_transaction_count( address, 'pending')
+    def get_chain_id(self) -> int:
+        return chain_id_for_rpc(self.w3, self.rpc)
 
-        # Store the next nonce this address will use, and return the current one
-        self.nonces[address] = nonce + 1
-        return nonce
+    def get_nonce_and_update(self, address:address, force_fetch=False) -> int:
+        # Deprecated: send_transaction() takes nonces itself, and gives them
+        # back if a transaction isn't sent. 
+        #
+        # Nonces are tracked per (chain, address) for the whole process, so 
+        # every wrapper sending from an address draws from the same sequence.
+        # The nonce returned here is reserved: if it isn't used for a 
+        # transaction the node accepts, pass it to release_nonce(), or every 
+        # later transaction from `address` waits on it. See nonce_manager.py
+        warnings.warn('get_nonce_and_update() is deprecated; call release_nonce() for any nonce '
+                      'it returns that is not sent', DeprecationWarning, stacklevel=2)
+        address = self.w3.to_checksum_address(address)
+        chain_id = self.get_chain_id()
+        if force_fetch:
+            NONCE_MANAGER.resync(chain_id, address)
+        return NONCE_MANAGER.next_nonce(self.w3, chain_id, address)
 
     def get_gas_dict_and_update(self, address:address) -> Dict[str, int]:
-        nonce = self.get_nonce_and_update(address)
-         
-        legacy = False
-        if legacy:
-            # TODO: it's expensive to query for fees with every transaction. 
-            # Maybe query only once a minute?
-            gas, gas_price = self.get_legacy_gas_fee()
-            gas_dict = {
-                'gas': gas, 
-                'gasPrice':gas_price, 
-                'nonce':nonce
-            }
-        else:
-            gas_dict = {
-                'from': address, 
+        # Deprecated, as get_nonce_and_update(): the nonce in the returned 
+        # dict is reserved, and must be passed to release_nonce() if unsent
+        warnings.warn('get_gas_dict_and_update() is deprecated; call release_nonce() for its '
+                      'nonce if the transaction is not sent', DeprecationWarning, stacklevel=2)
+        gas_dict = self.get_gas_dict(address)
+        address = self.w3.to_checksum_address(address)
+        gas_dict['nonce'] = NONCE_MANAGER.next_nonce(self.w3, self.get_chain_id(), address)
+        return gas_dict
+
+    def release_nonce(self, address:address, nonce:int) -> None:
+        # Give back a nonce from get_nonce_and_update() that was never sent
+        NONCE_MANAGER.release(self.get_chain_id(), self.w3.to_checksum_address(address), nonce)
+
+    def get_gas_dict(self, address:address) -> Dict[str, int]:
+        # Fees, sender & chain for a transaction, but no nonce. Giving web3 the 
+        # chainId saves an eth_chainId request per transaction
+        #
+        # Fees come from the FeeOracle shared by all wrappers on this RPC, which
+        # caches them (see fee_oracle.py), capped at max_gas_wei & max_priority_wei.
+        # With self.fee_oracle set to None, those caps are used as the fees
+        if self.fee_oracle is None:
+            fees = {
                 'maxFeePerGas': int(self.max_gas_wei), 
                 'maxPriorityFeePerGas': int(self.max_priority_wei), 
-                'nonce': nonce
             }
+        else:
+            fees = cap_fees(self.fee_oracle.fees(), self.max_gas_wei, self.max_priority_wei)
+        gas_dict = {'from': address, **fees}
+        gas_dict['chainId'] = self.get_chain_id()
         return gas_dict
 
+    def encode_call(self, function_name:str, args:Sequence[Any]) -> HexStr:
+        selector, input_types, _ = self.FUNCTION_SELECTORS[function_name]
+        return HexStr(selector + self.w3.codec.encode(input_types, args).hex())
+
+    def decode_output(self, function_name:str, data:bytes) -> Any:
+        # Decode and normalize return data the same way web3's ContractFunction.call() 
+        # does, so results are identical. (eth_abi caches decoders per type list)
+        _, _, output_types = self.FUNCTION_SELECTORS[function_name]
+        try:
+            decoded = self.w3.codec.decode(output_types, data)
+        except DecodingError as e:
+            raise BadFunctionCallOutput(f'Could not decode contract function call to {function_name} '
+                                        f'with return data: {str(data)}, output_types: {output_types}') from e
+        # Addresses get checksummed and arrays become lists. Plain scalars 
+        # need nothing, so skip walking the data when that's all there is
+        if any(('address' in t or '[' in t or '(' in t) for t in output_types):
+            results = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+        else:
+            results = list(decoded)
+        result = results[0] if len(results) == 1 else results
+        return self.convert_result(function_name, result)
+
+    def convert_result(self, function_name:str, result:Any) -> Any:
+        # Structs come back from decoding as plain tuples. Views that return 
+        # them give instances of the module's generated NamedTuple classes instead
+        converter = self.RESULT_CONVERTERS.get(function_name)
+        return result if converter is None else converter(result)
+
+    @instrumented('fast_call', str)
+    def fast_call(self, 
+                  function_name:str, 
+                  args:Sequence[Any], 
+                  block_identifier:BlockIdentifier='latest',
+                  contract_address:address | None = None,
+                  batch:CallBatch | None = None) -> Any:
+        # Used by methods generated with --fast_calls. Equivalent to
+        # `self.contract.functions.<function_name>(*args).call(block_identifier=...)`,
+        # but encodes calldata straight from the precomputed selector & types in
+        # FUNCTION_SELECTORS, skipping web3's function lookup and argument matching.
+        # Arguments must already be Python-native values (e.g. bytes, not hex 
+        # strings, for bytesN arguments)
+        if batch is not None:
+            return batch.queue(self, function_name, args, contract_address)
+        if contract_address is None:
+            contract_address = self.contract_address
+        else:
+            contract_address = self.w3.to_checksum_address(contract_address)
+        return_data = self.eth_call(contract_address, self.encode_call(function_name, args), block_identifier)
+        return self.decode_output(function_name, return_data)
+
+    @instrumented('view_call', str)
+    def view_call(self,
+                  function_name:str,
+                  args:Sequence[Any],
+                  block_identifier:BlockIdentifier='latest',
+                  contract_address:address | None = None,
+                  batch:CallBatch | None = None) -> Any:
+        # Used by generated view methods. Calls through web3's contract 
+        # functions, unless the view cache is on (see view_cache.py), in which
+        # case calls go through fast_call() so their return data can be cached.
+        # Arguments fast_call() can't encode (e.g. hex strings for bytes) 
+        # fall back to web3, uncached
+        if batch is not None:
+            return batch.queue(self, function_name, args, contract_address)
+        if view_cache.VIEW_CACHE is not None and function_name in self.FUNCTION_SELECTORS:
+            try:
+                return self.fast_call(function_name, args, block_identifier, contract_address)
+            except EncodingError:
+                pass
+        contract = self.contract if contract_address is None else self.get_custom_contract(contract_address)
+        result = contract.functions[function_name](*args).call(block_identifier=block_identifier)
+        return self.convert_result(function_name, result)
+
+    def eth_call(self, contract_address:ChecksumAddress, calldata:HexStr, block_identifier:BlockIdentifier='latest') -> bytes:
+        # Raw return data for `calldata`, from the view cache if it's on
+        cache = view_cache.VIEW_CACHE
+        call_tx = {'to': contract_address, 'data': calldata}
+        block = resolve_block(block_identifier) if cache is not None else None
+        if block is None:
+            return self.w3.eth.call(call_tx, block_identifier) # type: ignore
+
+        chain_id = self.get_chain_id()
+        if block == LATEST and cache.head_is_stale(chain_id):
+            cache.new_block(chain_id, self.w3.eth.block_number)
+        head = cache.head(chain_id)
+        key = (chain_id, contract_address, calldata, block)
+        return_data = cache.get(key)
+        if return_data is None:
+            return_data = self.w3.eth.call(call_tx, block_identifier) # type: ignore
+            cache.put(key, return_data, head)
+        return return_data
+
+    def batch(self, 
+              block_identifier:BlockIdentifier = 'latest', 
+              multicall_address:str = MULTICALL3_ADDRESS,
+              chunk_size:int = DEFAULT_CHUNK_SIZE) -> CallBatch:
+        # Pass the returned batch to view methods to have them queue calls &
+        # return futures, then run everything with a few Multicall3 calls.
+        # See multicall.py
+        return CallBatch(block_identifier, multicall_address, chunk_size)
+
     def call_contract_function(self, function_name:str, *args) -> Any:
         contract_func = getattr(self.contract, function_name)
         return contract_func(*args).call()
 
     def get_custom_contract(self, contract_address:ChecksumAddress, abi:str | None=None) -> Contract:
-        # TODO: Many custom contracts for e.g. ERC20 tokens could
-        # be re-used by caching a contracts dictionary keyed by address
-        # For now, just return a new contract
-        abi = abi or self.abi
-        checked_addr = self.w3.to_checksum_address(contract_address)
-        contract = self.w3.eth.contract(checked_addr, abi=abi)
-        return contract
+        # Contracts for e.g. ERC20 tokens are re-used from a bounded LRU, 
+        # keyed by ABI & checksum address. See abi_registry.ContractLRU
+        return abi_registry.custom_contract(self.w3, contract_address, abi or self.abi)
 
+    @instrumented('send_transaction', lambda tx: tx.fn_name)
     def send_transaction(self,
                          tx,
                          cred:Credentials,
-                         extra_dict:Dict[str,Any] | None = None
-                        ) -> TxReceipt:
+                         extra_dict:Dict[str,Any] | None = None,
+                         wait:bool = True,
+                         gas_key:Hashable = None
+                        ) -> TxReceipt | PendingTransaction:
         # Some transactions require extra information or fees when building 
         # the transaction. e.g. bridging functions need a {'value': <bridge_fee_in_wei>}
         # argument. If supplied, add that extra info
-        address = cred.address  
-        gas_dict = self.get_gas_dict_and_update(address)
+        #
+        # With wait=False, a PendingTransaction future is returned as soon as
+        # the node has accepted the transaction, so many transactions from one 
+        # account can be submitted back-to-back. Either way, the receipt comes 
+        # from this RPC's shared ReceiptWatcher rather than a polling loop per
+        # transaction. See receipt_watcher.py
+        #
+        # If the gas cache is on (see gas_cache.py), gas limits are cached per
+        # contract function and `gas_key`, which defaults to the lengths of
+        # any array arguments
+        address = self.w3.to_checksum_address(cred.address)
+        gas_dict = self.get_gas_dict(address)
         if extra_dict:
             gas_dict.update(extra_dict)
+
+        cache = gas_cache.GAS_CACHE
+        cache_key = None
+        if cache is not None and 'gas' not in gas_dict:
+            cache_key = self.gas_cache_key(tx, gas_key)
+            cached_gas = cache.get(cache_key)
+            if cached_gas is not None:
+                gas_dict['gas'] = cached_gas
+        # Building may estimate gas, which can revert. Do it before taking a nonce
         tx_dict = tx.build_transaction(gas_dict)    
-        signed_tx = self.w3.eth.account.sign_transaction(tx_dict, private_key=cred.private_key)
-        try:
-            self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-
-        except Exception as e:
-            if 'nonce too low' in str(e):
-                nonce = self.get_nonce_and_update(address, force_fetch=True)
-                return self.send_transaction( tx, cred)
-            # otherwise, raise
-            raise(e)
-
-        receipt = self.w3.eth.wait_for_transaction_receipt(
-            transaction_hash=signed_tx.hash,
-            poll_latency=1,
-            timeout=self.timeout,
-        )
-        return receipt
+        if cache_key is not None and 'gas' not in gas_dict:
+            tx_dict['gas'] = cache.put(cache_key, tx_dict['gas'])
+
+        tx_hash = self.sign_and_send(tx_dict, cred)
+        pending_tx = watcher_for_rpc(self.rpc).watch(tx_hash, address, tx_dict['nonce'], self.timeout)
+        if metrics.METRICS is not None:
+            metrics.track_receipt(pending_tx)
+        if cache_key is not None:
+            cache.track(cache_key, tx_dict['gas'], pending_tx)
+        if not wait:
+            return pending_tx
+        return pending_tx.result()
+
+    def gas_cache_key(self, tx, gas_key:Hashable = None) -> GasKey:
+        function_name = tx.function_identifier
+        selector = self.FUNCTION_SELECTORS.get(function_name, (function_name,))[0]
+        if gas_key is None:
+            gas_key = arg_shape(tx.args)
+        return (self.get_chain_id(), tx.address, selector, gas_key)
+
+    def sign_and_send(self, tx_dict:Dict[str, Any], cred:Credentials) -> HexBytes:
+        # Sign `tx_dict` with the next nonce for cred.address & send it
+        address = self.w3.to_checksum_address(cred.address)
+        chain_id = self.get_chain_id()
+        retries = NONCE_RETRIES
+        while True:
+            nonce = NONCE_MANAGER.next_nonce(self.w3, chain_id, address)
+            tx_dict['nonce'] = nonce
+            signed_tx = self.w3.eth.account.sign_transaction(tx_dict, private_key=cred.private_key)
+            try:
+                self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+                return signed_tx.hash
+            except Exception as e:
+                if not is_nonce_error(e):
+                    # Never sent, so the nonce is still free
+                    NONCE_MANAGER.release(chain_id, address, nonce)
+                    raise
+                NONCE_MANAGER.resync(chain_id, address)
+                if retries == 0:
+                    raise
+                retries -= 1
 
     def get_legacy_gas_fee(self) ->Tuple[int, int]:
         # See: https://web3py.readthedocs.io/en/stable/gas_price.html#gas-price-api
@@ -141,13 +315,26 @@ class ABIContractWrapper:
         tx_receipt = self.w3.eth.get_transaction_receipt(tx_hash)
         return tx_receipt
 
-    def parse_events(self, tx_receipt:TxReceipt, event_names:Sequence[str] | None = None) -> Dict[str, AttributeDict]:
-        event_dicts = {}
-        for event in self.contract.events: # type: ignore
-            eds = event().process_receipt(tx_receipt, errors=DISCARD)
-            if eds:
-                for ed in eds:
-                    event_dicts.setdefault(ed.event,[]).append(ed)
-        if event_names:
-            event_dicts = {k:v for k,v in event_dicts.items() if k in event_names}
-        return event_dicts        
+    def function_selector(self, function_name:str) -> str:
+        return self.FUNCTION_SELECTORS[function_name][0]
+
+    def event_abi_for_topic(self, topic:str | bytes) -> Dict[str, Any] | None:
+        return self.EVENT_TOPICS.get(Web3.to_hex(topic))
+
+    def event_decoder(self) -> EventDecoder:
+        if self.EVENT_TOPICS:
+            return decoder_for_topics(self.EVENT_TOPICS)
+        return decoder_for_abi(self.abi)
+
+    @instrumented('parse_events')
+    def parse_events(self, 
+                     tx_receipt:TxReceipt, 
+                     event_names:Sequence[str] | None = None,
+                     addresses:Sequence[address] | None = None) -> Dict[str, List[AttributeDict]]:
+        # Same results as running each event's process_receipt(tx_receipt, errors=DISCARD),
+        # but each log is matched to its event by topic and decoded at most once.
+        # Logs for events not in `event_names`, or not emitted from one of 
+        # `addresses`, are skipped without decoding. See event_decoder.py
+        if addresses is not None:
+            addresses = [self.w3.to_checksum_address(a) for a in addresses]
+        return self.event_decoder().decode_logs(tx_receipt['logs'], event_names or None, addresses)        
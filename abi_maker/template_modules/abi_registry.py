@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+from collections import OrderedDict
+import gc
+import json
+import threading
+
+from web3 import Web3
+from web3.contract.contract import Contract
+
+from .solidity_types import ChecksumAddress
+from typing import Dict, List, Tuple, Type, Any
+
+# Every wrapper for a given contract passes the same ABI string to web3, once
+# per chain and once per aggregator instance. Parsing that string and building
+# web3's function & event classes for it is the bulk of a wrapper's setup cost
+# and memory, so we do it once per process and share the results.
+#
+# All three caches are keyed by ABI content (the ABI string itself, whose hash
+# Python computes once and caches), so identical ABIs in different contract
+# modules share entries too.
+#
+# Web3 contract factories & contracts are bound to a Web3 instance, so those
+# are additionally keyed per Web3 instance (i.e., per RPC). We keep a
+# reference to the Web3 instance alongside each entry so its id() can't be reused
+
+# abi_str: parsed ABI
+PARSED_ABIS: Dict[str, List[Dict[str, Any]]] = {}
+# (abi_str, id(w3)): (w3, factory)
+CONTRACT_FACTORIES: Dict[Tuple[str, int], Tuple[Web3, Type[Contract]]] = {}
+# (abi_str, id(w3), checksum_address): (w3, contract)
+CONTRACTS: Dict[Tuple[str, int, str], Tuple[Web3, Contract]] = {}
+
+# Contracts built for addresses passed to multi-contract wrappers (e.g. every
+# ERC20 token a portfolio holds) aren't known ahead of time and can number in
+# the thousands, so those go in a bounded LRU rather than CONTRACTS
+DEFAULT_CUSTOM_CONTRACTS_SIZE = 4096
+
+_LOCK = threading.RLock()
+
+def parsed_abi(abi:str) -> List[Dict[str, Any]]:
+    parsed = PARSED_ABIS.get(abi)
+    if parsed is None:
+        with _LOCK:
+            parsed = PARSED_ABIS.setdefault(abi, json.loads(abi))
+    return parsed
+
+def contract_factory(w3:Web3, abi:str) -> Type[Contract]:
+    key = (abi, id(w3))
+    entry = CONTRACT_FACTORIES.get(key)
+    if entry is None:
+        with _LOCK:
+            entry = CONTRACT_FACTORIES.get(key)
+            if entry is None:
+                entry = (w3, w3.eth.contract(abi=parsed_abi(abi)))
+                CONTRACT_FACTORIES[key] = entry
+    return entry[1]
+
+def get_contract(w3:Web3, contract_address:ChecksumAddress, abi:str) -> Contract:
+    # Contract objects hold no per-caller state, so wrappers for the same
+    # address on the same RPC can share one
+    key = (abi, id(w3), contract_address)
+    entry = CONTRACTS.get(key)
+    if entry is None:
+        with _LOCK:
+            entry = CONTRACTS.get(key)
+            if entry is None:
+                entry = (w3, contract_factory(w3, abi)(address=contract_address))
+                CONTRACTS[key] = entry
+    return entry[1]
+
+class ContractLRU:
+    def __init__(self, max_size:int = DEFAULT_CUSTOM_CONTRACTS_SIZE):
+        self.max_size = max_size
+        # (abi_str, id(w3), checksum_address): (w3, contract)
+        self.entries: OrderedDict[Tuple[str, int, str], Tuple[Web3, Contract]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, w3:Web3, contract_address:str, abi:str) -> Contract:
+        # Addresses are usually already checksummed, so look them up as given 
+        # first and only checksum them on a miss
+        contract = self._lookup((abi, id(w3), contract_address))
+        if contract is not None:
+            return contract
+        checked_addr = Web3.to_checksum_address(contract_address)
+        key = (abi, id(w3), checked_addr)
+        if checked_addr != contract_address:
+            contract = self._lookup(key)
+            if contract is not None:
+                return contract
+
+        contract = contract_factory(w3, abi)(address=checked_addr)
+        with self._lock:
+            self.misses += 1
+            self.entries[key] = (w3, contract)
+            self._evict()
+        return contract
+
+    def _lookup(self, key:Tuple[str, int, str]) -> Contract | None:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, max_size:int) -> None:
+        with self._lock:
+            self.max_size = max_size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'max_size': self.max_size,
+        }
+
+CUSTOM_CONTRACTS = ContractLRU()
+
+def custom_contract(w3:Web3, contract_address:str, abi:str) -> Contract:
+    return CUSTOM_CONTRACTS.get(w3, contract_address, abi)
+
+def set_custom_contract_cache_size(max_size:int) -> None:
+    CUSTOM_CONTRACTS.resize(max_size)
+
+def warm_up(*aggregators:Any, freeze:bool=True) -> None:
+    # Call this in a pre-fork server's parent process (e.g. in gunicorn's
+    # `on_starting` hook or a --preload'ed app module) with the aggregators
+    # the workers will use, e.g.:
+    #   warm_up(AllDfkContracts('cv'), AllDfkContracts('sd'))
+    # Every contract is built in the parent, and the workers' own aggregators
+    # then pick the shared objects out of the caches above.
+    #
+    # With `freeze`, everything alive is moved into the garbage collector's
+    # permanent generation, so collections in the workers don't touch (and
+    # copy) the inherited pages.
+    #
+    # No network requests are made here, so no sockets are shared across the fork
+    for aggregator in aggregators:
+        aggregator.load_all()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+def clear() -> None:
+    CUSTOM_CONTRACTS.clear()
+    with _LOCK:
+        CONTRACTS.clear()
+        CONTRACT_FACTORIES.clear()
+        PARSED_ABIS.clear()
@@ -0,0 +1,41 @@
+#! /usr/bin/env python
+import threading
+from pathlib import Path
+
+from typing import Dict
+
+# Every distinct ABI in the project, imported by the modules in contracts/ as
+#   from ..abis import ABI_<hash> as ABI
+# The ABIs live in the abis.txt sidecar next to this module, one per line as
+#   ABI_<hash> <minified ABI JSON>
+# which is read the first time any ABI is asked for. Importing this module,
+# or the package, costs nothing until a contract is actually built.
+
+SIDECAR_PATH = Path(__file__).with_name('abis.txt')
+
+_ABI_STRS: Dict[str, str] | None = None
+_LOAD_LOCK = threading.Lock()
+
+def _load() -> Dict[str, str]:
+    global _ABI_STRS
+    with _LOAD_LOCK:
+        if _ABI_STRS is None:
+            abi_strs = {}
+            with SIDECAR_PATH.open(encoding='utf-8') as f:
+                for line in f:
+                    name, _, abi_str = line.rstrip('\n').partition(' ')
+                    if name:
+                        abi_strs[name] = abi_str
+            _ABI_STRS = abi_strs
+    return _ABI_STRS
+
+def __getattr__(name:str) -> str:
+    if not name.startswith('ABI_'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    try:
+        abi_str = _load()[name]
+    except KeyError:
+        raise AttributeError(f"No ABI named {name!r} in {SIDECAR_PATH}") from None
+    # Keep it, so later imports of this ABI skip __getattr__ & get the same string
+    globals()[name] = abi_str
+    return abi_str
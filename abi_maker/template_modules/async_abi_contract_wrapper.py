@@ -0,0 +1,249 @@
+#! /usr/bin/env python
+import asyncio
+import warnings
+
+from web3 import Web3
+from web3.contract.async_contract import AsyncContract
+from eth_abi.exceptions import EncodingError
+
+from . import abi_registry, gas_cache, metrics, view_cache
+from .provider_registry import get_async_w3, rpc_key
+from .abi_contract_wrapper import (ABIContractWrapper, DEFAULT_TIMEOUT, DEFAULT_MAX_GAS, 
+                                   DEFAULT_MAX_PRIORITY_GAS, NONCE_RETRIES)
+from .credentials import Credentials
+from .nonce_manager import NONCE_MANAGER, CHAIN_IDS, is_nonce_error
+from .receipt_watcher import PendingTransaction, watcher_for_rpc
+from .fee_oracle import FeeOracle, oracle_for_rpc, cap_fees
+from .gas_cache import GasKey, arg_shape
+from .view_cache import resolve_block, LATEST
+from .metrics import instrumented
+
+from .solidity_types import (address, ChecksumAddress, TxReceipt, BlockIdentifier, HexBytes, HexStr)
+from typing import Dict, Tuple, Any, Sequence, Hashable, Callable
+
+# Async counterparts of ABIContractWrapper & ABIMultiContractWrapper, for
+# wrappers generated with --async_wrappers. Every network call is awaitable,
+# so many reads and transactions can run concurrently on one event loop.
+
+class AsyncABIContractWrapper:
+    FUNCTION_SELECTORS: Dict[str, Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = {}
+    EVENT_TOPICS: Dict[str, Dict[str, Any]] = {}
+    RESULT_CONVERTERS: Dict[str, Callable[[Any], Any]] = {}
+
+    def __init__(self,
+                 contract_address:str,
+                 abi:str,
+                 rpc:str | Sequence[str],
+                 max_gas_gwei:float=DEFAULT_MAX_GAS,
+                 max_priority_gwei:float=DEFAULT_MAX_PRIORITY_GAS):
+        self._init_w3(abi, rpc, max_gas_gwei, max_priority_gwei)
+        self.contract_address:ChecksumAddress = Web3.to_checksum_address(contract_address)
+        self.contract: AsyncContract = abi_registry.get_contract(self.w3, self.contract_address, self.abi) # type: ignore
+
+    def _init_w3(self, abi:str, rpc:str | Sequence[str], max_gas_gwei:float, max_priority_gwei:float) -> None:
+        # A list of URLs is used with failover. See provider_registry.rpc_key()
+        self.rpc = rpc_key(rpc)
+        self.abi = abi
+        self.timeout = DEFAULT_TIMEOUT
+
+        # As with the sync wrappers, all contracts on an RPC share one AsyncWeb3 
+        # instance. See provider_registry.py
+        self.w3 = get_async_w3(self.rpc)
+
+        self.max_gas_wei = Web3.to_wei(max_gas_gwei, 'gwei')
+        self.max_priority_wei = Web3.to_wei(max_priority_gwei, 'gwei')
+        # The oracle is sync and shared with the sync wrappers; fetches run in a thread
+        self.fee_oracle: FeeOracle | None = oracle_for_rpc(self.rpc)
+
+    # These don't touch the network, so the sync versions work as-is
+    encode_call = ABIContractWrapper.encode_call
+    decode_output = ABIContractWrapper.decode_output
+    convert_result = ABIContractWrapper.convert_result
+    function_selector = ABIContractWrapper.function_selector
+    event_abi_for_topic = ABIContractWrapper.event_abi_for_topic
+    event_decoder = ABIContractWrapper.event_decoder
+    parse_events = ABIContractWrapper.parse_events
+
+    async def get_chain_id(self) -> int:
+        chain_id = CHAIN_IDS.get(self.rpc)
+        if chain_id is None:
+            chain_id = await self.w3.eth.chain_id
+            CHAIN_IDS[self.rpc] = chain_id
+        return chain_id
+
+    async def get_nonce_and_update(self, address:address, force_fetch=False) -> int:
+        # Deprecated; see ABIContractWrapper.get_nonce_and_update(). Sync & 
+        # async wrappers share the same nonces
+        warnings.warn('get_nonce_and_update() is deprecated; call release_nonce() for any nonce '
+                      'it returns that is not sent', DeprecationWarning, stacklevel=2)
+        address = Web3.to_checksum_address(address)
+        chain_id = await self.get_chain_id()
+        if force_fetch:
+            NONCE_MANAGER.resync(chain_id, address)
+        return await self.next_nonce(chain_id, address)
+
+    async def get_gas_dict_and_update(self, address:address) -> Dict[str, Any]:
+        # Deprecated; see ABIContractWrapper.get_gas_dict_and_update()
+        warnings.warn('get_gas_dict_and_update() is deprecated; call release_nonce() for its '
+                      'nonce if the transaction is not sent', DeprecationWarning, stacklevel=2)
+        gas_dict = await self.get_gas_dict(address)
+        gas_dict['nonce'] = await self.next_nonce(await self.get_chain_id(), Web3.to_checksum_address(address))
+        return gas_dict
+
+    async def release_nonce(self, address:address, nonce:int) -> None:
+        NONCE_MANAGER.release(await self.get_chain_id(), Web3.to_checksum_address(address), nonce)
+
+    async def next_nonce(self, chain_id:int, address:ChecksumAddress) -> int:
+        # NonceManager.next_nonce(), with the fetch awaited
+        while True:
+            fetched = None
+            if NONCE_MANAGER.needs_fetch(chain_id, address):
+                fetched = await self.w3.eth.get_transaction_count(address, 'pending')
+            nonce = NONCE_MANAGER.try_take(chain_id, address, fetched)
+            if nonce is not None:
+                return nonce
+
+    async def get_gas_dict(self, address:address) -> Dict[str, Any]:
+        # See ABIContractWrapper.get_gas_dict()
+        if self.fee_oracle is None:
+            fees = {
+                'maxFeePerGas': int(self.max_gas_wei),
+                'maxPriorityFeePerGas': int(self.max_priority_wei),
+            }
+        else:
+            oracle_fees = self.fee_oracle.cached_fees() or await asyncio.to_thread(self.fee_oracle.refresh)
+            fees = cap_fees(oracle_fees, self.max_gas_wei, self.max_priority_wei)
+        gas_dict = {'from': address, **fees}
+        gas_dict['chainId'] = await self.get_chain_id()
+        return gas_dict
+
+    @instrumented('fast_call', str)
+    async def fast_call(self,
+                        function_name:str,
+                        args:Sequence[Any],
+                        block_identifier:BlockIdentifier='latest',
+                        contract_address:address | None = None) -> Any:
+        # See ABIContractWrapper.fast_call()
+        if contract_address is None:
+            contract_address = self.contract_address
+        else:
+            contract_address = Web3.to_checksum_address(contract_address)
+        return_data = await self.eth_call(contract_address, self.encode_call(function_name, args), block_identifier)
+        return self.decode_output(function_name, return_data)
+
+    @instrumented('view_call', str)
+    async def view_call(self,
+                        function_name:str,
+                        args:Sequence[Any],
+                        block_identifier:BlockIdentifier='latest',
+                        contract_address:address | None = None) -> Any:
+        # See ABIContractWrapper.view_call()
+        if view_cache.VIEW_CACHE is not None and function_name in self.FUNCTION_SELECTORS:
+            try:
+                return await self.fast_call(function_name, args, block_identifier, contract_address)
+            except EncodingError:
+                pass
+        contract = self.contract if contract_address is None else self.get_custom_contract(contract_address)
+        result = await contract.functions[function_name](*args).call(block_identifier=block_identifier)
+        return self.convert_result(function_name, result)
+
+    async def eth_call(self, contract_address:ChecksumAddress, calldata:HexStr, block_identifier:BlockIdentifier='latest') -> bytes:
+        # See ABIContractWrapper.eth_call(). Sync & async wrappers share the view cache
+        cache = view_cache.VIEW_CACHE
+        call_tx = {'to': contract_address, 'data': calldata}
+        block = resolve_block(block_identifier) if cache is not None else None
+        if block is None:
+            return await self.w3.eth.call(call_tx, block_identifier) # type: ignore
+
+        chain_id = await self.get_chain_id()
+        if block == LATEST and cache.head_is_stale(chain_id):
+            cache.new_block(chain_id, await self.w3.eth.block_number)
+        head = cache.head(chain_id)
+        key = (chain_id, contract_address, calldata, block)
+        return_data = cache.get(key)
+        if return_data is None:
+            return_data = await self.w3.eth.call(call_tx, block_identifier) # type: ignore
+            cache.put(key, return_data, head)
+        return return_data
+
+    def get_custom_contract(self, contract_address:ChecksumAddress, abi:str | None=None) -> AsyncContract:
+        return abi_registry.custom_contract(self.w3, contract_address, abi or self.abi) # type: ignore
+
+    @instrumented('send_transaction', lambda tx: tx.fn_name)
+    async def send_transaction(self,
+                               tx,
+                               cred:Credentials,
+                               extra_dict:Dict[str,Any] | None = None,
+                               wait:bool = True,
+                               gas_key:Hashable = None
+                              ) -> TxReceipt | PendingTransaction:
+        # See ABIContractWrapper.send_transaction(). Receipts come from the 
+        # same per-RPC ReceiptWatcher thread as the sync wrappers use; 
+        # `await asyncio.wrap_future(pending_tx)` waits on a returned PendingTransaction
+        address = Web3.to_checksum_address(cred.address)
+        gas_dict = await self.get_gas_dict(address)
+        if extra_dict:
+            gas_dict.update(extra_dict)
+
+        cache = gas_cache.GAS_CACHE
+        cache_key = None
+        if cache is not None and 'gas' not in gas_dict:
+            cache_key = await self.gas_cache_key(tx, gas_key)
+            cached_gas = cache.get(cache_key)
+            if cached_gas is not None:
+                gas_dict['gas'] = cached_gas
+        tx_dict = await tx.build_transaction(gas_dict)
+        if cache_key is not None and 'gas' not in gas_dict:
+            tx_dict['gas'] = cache.put(cache_key, tx_dict['gas'])
+
+        tx_hash = await self.sign_and_send(tx_dict, cred)
+        # get_chain_id() above has cached the chain id, so this doesn't block
+        pending_tx = watcher_for_rpc(self.rpc).watch(tx_hash, address, tx_dict['nonce'], self.timeout)
+        if metrics.METRICS is not None:
+            metrics.track_receipt(pending_tx)
+        if cache_key is not None:
+            cache.track(cache_key, tx_dict['gas'], pending_tx)
+        if not wait:
+            return pending_tx
+        return await asyncio.wrap_future(pending_tx)
+
+    async def gas_cache_key(self, tx, gas_key:Hashable = None) -> GasKey:
+        function_name = tx.function_identifier
+        selector = self.FUNCTION_SELECTORS.get(function_name, (function_name,))[0]
+        if gas_key is None:
+            gas_key = arg_shape(tx.args)
+        return (await self.get_chain_id(), tx.address, selector, gas_key)
+
+    async def sign_and_send(self, tx_dict:Dict[str, Any], cred:Credentials) -> HexBytes:
+        # See ABIContractWrapper.sign_and_send()
+        address = Web3.to_checksum_address(cred.address)
+        chain_id = await self.get_chain_id()
+        retries = NONCE_RETRIES
+        while True:
+            nonce = await self.next_nonce(chain_id, address)
+            tx_dict['nonce'] = nonce
+            signed_tx = self.w3.eth.account.sign_transaction(tx_dict, private_key=cred.private_key)
+            try:
+                await self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+                return signed_tx.hash
+            except Exception as e:
+                if not is_nonce_error(e):
+                    NONCE_MANAGER.release(chain_id, address, nonce)
+                    raise
+                NONCE_MANAGER.resync(chain_id, address)
+                if retries == 0:
+                    raise
+                retries -= 1
+
+    async def tx_receipt_for_hash(self, tx_hash:address) -> TxReceipt:
+        return await self.w3.eth.get_transaction_receipt(tx_hash) # type: ignore
+
+class AsyncABIMultiContractWrapper(AsyncABIContractWrapper):
+    # Async counterpart of ABIMultiContractWrapper: no fixed address; every
+    # generated method takes a contract_address
+    def __init__(self,
+                 abi:str,
+                 rpc:str | Sequence[str],
+                 max_gas_gwei:float=DEFAULT_MAX_GAS,
+                 max_priority_gwei:float=DEFAULT_MAX_PRIORITY_GAS):
+        self._init_w3(abi, rpc, max_gas_gwei, max_priority_gwei)
@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+import json
+import threading
+
+from web3._utils.encoding import Web3JsonEncoder
+from web3.types import RPCEndpoint, RPCResponse
+
+from . import provider_registry
+from .provider_registry import PooledHTTPProvider
+from .rate_limiter import RATE_LIMIT_RETRIES, is_rate_limit_response, priority_for_method
+
+from typing import Dict, List, Any
+
+DEFAULT_MAX_BATCH_SIZE = 50
+# Seconds to wait for other requests to join a batch before sending it
+DEFAULT_FLUSH_INTERVAL = 0.005
+
+class _PendingRequest:
+    def __init__(self, request:Dict[str, Any]):
+        self.request = request
+        self.response: RPCResponse | None = None
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+    def resolve(self, response:RPCResponse | None = None, error:Exception | None = None) -> None:
+        self.response = response
+        self.error = error
+        self.done.set()
+
+class BatchingHTTPProvider(PooledHTTPProvider):
+    '''
+    A PooledHTTPProvider that coalesces requests made concurrently from different
+    threads into a single JSON-RPC batch POST. A batch is sent when it reaches
+    `max_batch_size` requests or `flush_interval` seconds after its first
+    request, whichever comes first. Each caller blocks until its own response
+    has been split out of the batch response.
+
+    Providers that reject batches get the requests re-sent one at a time.
+    Requests answered with rate limit errors slow the RPC's rate limiter down
+    and are re-sent, as they would be without batching.
+    '''
+    def __init__(self,
+                 endpoint_uri:str,
+                 max_batch_size:int = DEFAULT_MAX_BATCH_SIZE,
+                 flush_interval:float = DEFAULT_FLUSH_INTERVAL,
+                 **pool_kwargs:Any):
+        # pool_kwargs: see PooledHTTPProvider
+        super().__init__(endpoint_uri, **pool_kwargs)
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._pending: List[_PendingRequest] = []
+        self._lock = threading.Lock()
+        self._flush_timer: threading.Timer | None = None
+
+    def make_request(self, method:RPCEndpoint, params:Any) -> RPCResponse:
+        pending = _PendingRequest({
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params or [],
+            'id': next(self.request_counter),
+        })
+        full_batch = None
+        with self._lock:
+            self._pending.append(pending)
+            if len(self._pending) >= self.max_batch_size:
+                full_batch = self._take_pending()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+        # Whoever fills a batch sends it; partial batches are sent by the timer
+        if full_batch:
+            self._send_batch(full_batch)
+
+        pending.done.wait()
+        if pending.error:
+            raise pending.error
+        return pending.response # type: ignore
+
+    def flush(self) -> None:
+        with self._lock:
+            batch = self._take_pending()
+        if batch:
+            self._send_batch(batch)
+
+    def _take_pending(self) -> List[_PendingRequest]:
+        # Call with self._lock held
+        batch, self._pending = self._pending, []
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        return batch
+
+    def _send_batch(self, batch:List[_PendingRequest]) -> None:
+        # Requests answered with a rate limit error are sent again, as a 
+        # smaller batch, once the limiter lets us, up to RATE_LIMIT_RETRIES 
+        # times; like PooledHTTPProvider.make_request() does for single requests
+        retries = RATE_LIMIT_RETRIES
+        while batch:
+            if len(batch) == 1:
+                payload: Any = batch[0].request
+            else:
+                payload = [p.request for p in batch]
+            try:
+                request_data = json.dumps(payload, cls=Web3JsonEncoder).encode()
+                # The batch waits its turn as its most urgent request would
+                priority = min(priority_for_method(p.request['method']) for p in batch)
+                raw_response, sent_at = self._post(request_data, priority, len(batch))
+                response = self.decode_rpc_response(raw_response)
+            except Exception as e:
+                for p in batch:
+                    p.resolve(error=e)
+                return
+
+            if len(batch) == 1 or (retries > 0 and is_rate_limit_response(response)):
+                # One request, or a whole batch turned away for going too fast
+                responses_by_id = {p.request['id']: response for p in batch}
+            elif isinstance(response, list):
+                responses_by_id = {r.get('id'): r for r in response if isinstance(r, dict)}
+            else:
+                # Some providers answer a batch with a single error object
+                self._send_individually(batch)
+                return
+
+            limited = []
+            for p in batch:
+                r = responses_by_id.get(p.request['id'])
+                if r is None:
+                    p.resolve(error=ValueError(f'No response for {p.request["method"]} (id {p.request["id"]}) in batch from {self.endpoint_uri}'))
+                elif retries > 0 and is_rate_limit_response(r):
+                    limited.append(p)
+                else:
+                    p.resolve(r) # type: ignore
+            if limited:
+                self.limiter.rate_limited(None, sent_at)
+                retries -= 1
+            batch = limited
+
+    def _send_individually(self, batch:List[_PendingRequest]) -> None:
+        for p in batch:
+            try:
+                p.resolve(super().make_request(p.request['method'], p.request['params']))
+            except Exception as e:
+                p.resolve(error=e)
+
+def enable_request_batching(rpc:str,
+                            max_batch_size:int = DEFAULT_MAX_BATCH_SIZE,
+                            flush_interval:float = DEFAULT_FLUSH_INTERVAL,
+                            **pool_kwargs:Any) -> None:
+    # Wrappers created for `rpc` after this is called share a BatchingHTTPProvider.
+    # Call it before creating any wrappers or aggregators for that RPC.
+    # pool_kwargs: see provider_registry.configure_rpc()
+    provider_registry.configure_rpc(rpc, batch_requests=True, max_batch_size=max_batch_size,
+                                    flush_interval=flush_interval, **pool_kwargs)
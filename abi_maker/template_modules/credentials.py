@@ -1,11 +1,25 @@
 #! /usr/bin/env python
+from bisect import bisect_left
+from concurrent.futures import Executor, ProcessPoolExecutor
+import multiprocessing
+import threading
 
-from .solidity_types import address as HexAddress
-from typing import Dict, List, Optional, Sequence, Tuple, Union, cast
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union, cast
+
+# eth_account is only needed to sign, so it's imported when we do
+if TYPE_CHECKING:
+    from eth_account.datastructures import SignedTransaction
+    from eth_typing.evm import ChecksumAddress as HexAddress
+
+# Below this many transactions, sign_transactions() signs in this process; 
+# shipping work to the pool costs more than it saves
+MIN_PARALLEL_SIGNATURES = 64
+# Transactions sent to a signing process at a time
+SIGNING_CHUNK_SIZE = 64
 
 class Credentials:
-    def __init__(self, address:HexAddress|str, private_key:str ='', nickname:str=''):
-        self.address:HexAddress = cast(HexAddress, address)
+    def __init__(self, address:'HexAddress | str', private_key:str ='', nickname:str=''):
+        self.address:'HexAddress' = cast('HexAddress', address)
         self.private_key = private_key
         self.nickname = nickname
 
@@ -20,8 +34,12 @@ class Credentials:
         # as self.nickname, case-insensitive, e.g. 'sli' for 'Slipfoot'
         return self.nickname.lower().startswith(query.lower())
 
+    # These take either a sequence of Credentials, which is scanned, or a 
+    # CredentialStore, which is indexed. Use a CredentialStore for many accounts
     @staticmethod
-    def cred_for_nickname(creds:Sequence['Credentials'], nickname:str, accept_abbreviation=True) -> 'Credentials':
+    def cred_for_nickname(creds:Union[Sequence['Credentials'], 'CredentialStore'], nickname:str, accept_abbreviation=True) -> 'Credentials':
+        if isinstance(creds, CredentialStore):
+            return creds.cred_for_nickname(nickname, accept_abbreviation)
         if accept_abbreviation:
             gen = (c for c in creds if c.matches_abbreviation(nickname))
         else:
@@ -32,7 +50,9 @@ class Credentials:
             raise ValueError(f'Nickname {nickname} not found in {creds}')
 
     @staticmethod
-    def cred_for_address(creds:Sequence['Credentials'], address:HexAddress) -> 'Credentials':
+    def cred_for_address(creds:Union[Sequence['Credentials'], 'CredentialStore'], address:'HexAddress') -> 'Credentials':
+        if isinstance(creds, CredentialStore):
+            return creds.cred_for_address(address)
         gen = (c for c in creds if c.address == address)
         try:
             return next(gen)
@@ -41,12 +61,160 @@ class Credentials:
 
 
     @staticmethod 
-    def creds_for_nicknames(creds:Sequence['Credentials'], nicknames:Sequence[str], accept_abbreviation=True) -> List['Credentials']:
+    def creds_for_nicknames(creds:Union[Sequence['Credentials'], 'CredentialStore'], nicknames:Sequence[str], accept_abbreviation=True) -> List['Credentials']:
+        # Index `creds` once rather than scanning them for every nickname
+        if not isinstance(creds, CredentialStore):
+            creds = CredentialStore(creds)
+        return creds.creds_for_nicknames(nicknames, accept_abbreviation)
+
+class CredentialStore:
+    # An indexed collection of Credentials for working with thousands of accounts.
+    # Lookups give the same results as Credentials' static methods do for a 
+    # list of the same credentials in the same order (i.e., the first match
+    # wins), but:
+    #   - addresses are looked up in a dict (case-insensitively)
+    #   - exact nicknames are looked up in a dict
+    #   - abbreviations are found by binary search in a sorted list of
+    #     lowercase nicknames
+    def __init__(self, creds:Iterable[Credentials] = ()):
+        self._creds: List[Credentials] = []
+        # lowercase address: cred
+        self._by_address: Dict[str, Credentials] = {}
+        # nickname: cred
+        self._by_nickname: Dict[str, Credentials] = {}
+        # Lowercase nicknames, sorted, and each one's position in self._creds
+        self._sorted_nicknames: List[str] = []
+        self._sorted_positions: List[int] = []
+        self._lock = threading.Lock()
+        self.extend(creds)
+
+    def add(self, cred:Credentials) -> None:
+        self.extend([cred])
+
+    def extend(self, creds:Iterable[Credentials]) -> None:
+        with self._lock:
+            index = list(zip(self._sorted_nicknames, self._sorted_positions))
+            for cred in creds:
+                index.append((cred.nickname.lower(), len(self._creds)))
+                self._creds.append(cred)
+                self._by_address.setdefault(cred.address.lower(), cred)
+                self._by_nickname.setdefault(cred.nickname, cred)
+            index.sort()
+            self._sorted_nicknames = [n for n, _ in index]
+            self._sorted_positions = [p for _, p in index]
+
+    def __len__(self) -> int:
+        return len(self._creds)
+
+    def __iter__(self) -> Iterator[Credentials]:
+        return iter(self._creds)
+
+    def __contains__(self, address:object) -> bool:
+        return isinstance(address, str) and address.lower() in self._by_address
+
+    def __repr__(self):
+        return f'CredentialStore({len(self._creds)} credentials)'
+
+    def cred_for_address(self, address:'HexAddress | str') -> Credentials:
+        cred = self._by_address.get(address.lower())
+        if cred is None:
+            raise ValueError(f'Address {address} not found in {self}')
+        return cred
+
+    def cred_for_nickname(self, nickname:str, accept_abbreviation=True) -> Credentials:
+        if accept_abbreviation:
+            matches = self._prefix_matches(nickname)
+            # First added, as with a list
+            cred = self._creds[min(matches)] if matches else None
+        else:
+            cred = self._by_nickname.get(nickname)
+        if cred is None:
+            raise ValueError(f'Nickname {nickname} not found in {self}')
+        return cred
+
+    def creds_for_nicknames(self, nicknames:Sequence[str], accept_abbreviation=True) -> List[Credentials]:
+        # Nicknames with no match are skipped
         creds_out = []
         for n in nicknames:
             try:
-                c = Credentials.cred_for_nickname(creds, n, accept_abbreviation)
-                creds_out.append(c)
+                creds_out.append(self.cred_for_nickname(n, accept_abbreviation))
             except ValueError:
                 pass
         return creds_out
+
+    def creds_matching_abbreviation(self, query:str) -> List[Credentials]:
+        # Every credential whose nickname starts with `query`, case-insensitive,
+        # in the order they were added
+        return [self._creds[i] for i in sorted(self._prefix_matches(query))]
+
+    def _prefix_matches(self, query:str) -> List[int]:
+        # Positions of credentials whose lowercase nickname starts with `query`.
+        # These are adjacent in the sorted index, so two binary searches find them
+        query = query.lower()
+        start = bisect_left(self._sorted_nicknames, query)
+        end = bisect_left(self._sorted_nicknames, query + '\U0010ffff', start)
+        return self._sorted_positions[start:end]
+
+    def sign_transactions(self, 
+                          tx_dicts:Sequence[Dict[str, Any]], 
+                          executor:Executor | None = None) -> List['SignedTransaction']:
+        # Sign each tx dict with the key for its 'from' address. 
+        # See sign_transactions() below
+        creds = [self.cred_for_address(tx['from']) for tx in tx_dicts]
+        return sign_transactions(tx_dicts, creds, executor)
+
+# Bulk signing. Signing is CPU-bound ECDSA that holds the GIL, so a thread pool doesn't 
+# help. Mass-send jobs sign in a pool of processes instead: a tx dict, 
+# complete with nonce, gas & chainId, goes in and the signed transaction comes 
+# back, ready for eth_sendRawTransaction. Private keys are sent to the signing 
+# processes along with the transactions they sign.
+#
+# The pool spawns its processes rather than forking: by the time it starts,
+# this process usually has background threads (receipt watchers, fee oracle
+# refreshes, batch flushers), and a forked child can deadlock on a lock one 
+# of them held.
+_SIGNING_POOL: ProcessPoolExecutor | None = None
+_POOL_LOCK = threading.Lock()
+
+def signing_pool(max_workers:int | None = None) -> ProcessPoolExecutor:
+    # The process pool shared by sign_transactions() calls, started on first 
+    # use with `max_workers` processes (default: one per CPU)
+    global _SIGNING_POOL
+    with _POOL_LOCK:
+        if _SIGNING_POOL is None:
+            _SIGNING_POOL = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _SIGNING_POOL
+
+def shutdown_signing_pool() -> None:
+    global _SIGNING_POOL
+    with _POOL_LOCK:
+        if _SIGNING_POOL is not None:
+            _SIGNING_POOL.shutdown()
+            _SIGNING_POOL = None
+
+def sign_transactions(tx_dicts:Sequence[Dict[str, Any]],
+                      creds:Credentials | Sequence[Credentials],
+                      executor:Executor | None = None) -> List['SignedTransaction']:
+    # Sign every tx dict, in order. `creds` is either one Credentials to sign
+    # everything with, or one per tx dict. Large batches are split into 
+    # chunks and signed in `executor`, or the shared signing_pool()
+    if isinstance(creds, Credentials):
+        creds = [creds] * len(tx_dicts)
+    if len(creds) != len(tx_dicts):
+        raise ValueError(f'Got {len(tx_dicts)} transactions but {len(creds)} credentials')
+
+    jobs = [(tx, cred.private_key) for tx, cred in zip(tx_dicts, creds)]
+    if executor is None and len(jobs) < MIN_PARALLEL_SIGNATURES:
+        return _sign_chunk(jobs)
+
+    executor = executor or signing_pool()
+    chunks = [jobs[i:i + SIGNING_CHUNK_SIZE] for i in range(0, len(jobs), SIGNING_CHUNK_SIZE)]
+    signed: List['SignedTransaction'] = []
+    for signed_chunk in executor.map(_sign_chunk, chunks):
+        signed.extend(signed_chunk)
+    return signed
+
+def _sign_chunk(jobs:Sequence[Tuple[Dict[str, Any], str]]) -> List['SignedTransaction']:
+    # Runs in the signing processes, so must stay importable at module level
+    from eth_account import Account
+    return [Account.sign_transaction(tx, private_key) for tx, private_key in jobs]
@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+import threading
+
+from eth_abi.codec import ABICodec
+from eth_abi.exceptions import DecodingError
+from eth_abi.grammar import parse, TupleType
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+from hexbytes import HexBytes
+from web3._utils.abi import build_strict_registry, normalize_event_input_types, collapse_if_tuple
+from web3._utils.events import get_event_abi_types_for_decoding
+from web3.datastructures import AttributeDict
+
+from . import abi_registry
+from .solidity_types import address
+from typing import Dict, List, Tuple, Any, Sequence, Iterable, Callable
+
+# web3's process_receipt() decodes a whole receipt once per event class, so
+# parsing a receipt against a contract with E events tries E x (number of logs)
+# decodes. EventDecoder looks each log's topic0 up in a table instead: logs
+# whose topic isn't one of the contract's events (or isn't one of the requested
+# events) are skipped without decoding, and every other log is decoded once.
+#
+# Results are identical to process_receipt(tx_receipt, errors=DISCARD)
+
+# Same codec settings web3 uses
+CODEC = ABICodec(build_strict_registry())
+
+def _shaper(abi_input:Dict[str, Any]) -> Callable[[Any], Any] | None:
+    # A function that turns a decoded value into what web3's map_abi_data() +
+    # named_tree() would return: checksummed addresses, arrays as lists, and
+    # structs as dicts. Built once per event input, so decoding doesn't re-parse
+    # type strings for every value. None if the value is already final
+    abi_type = parse(collapse_if_tuple(dict(abi_input)))
+    if abi_type.is_array:
+        item_shaper = _shaper({**abi_input, 'type': abi_type.item_type.to_type_str(), 'name': ''})
+        if item_shaper is None:
+            return list
+        return lambda values: [item_shaper(v) for v in values]
+    if isinstance(abi_type, TupleType):
+        names = [c['name'] for c in abi_input['components']]
+        shapers = [_shaper(c) or _identity for c in abi_input['components']]
+        return lambda values: {n: s(v) for n, s, v in zip(names, shapers, values)}
+    if abi_type.base == 'address':
+        return to_checksum_address
+    return None
+
+def _identity(value:Any) -> Any:
+    return value
+
+def _topic_key(topic:bytes | str) -> bytes:
+    # Receipts from web3 have HexBytes topics, which hash & compare as bytes.
+    # Raw JSON logs have hex strings
+    return HexBytes(topic) if isinstance(topic, str) else topic
+
+class EventLayout:
+    # Everything needed to decode one event, worked out once
+    __slots__ = ('name', 'topic_types', 'topic_names', 'topic_shapers', 'data_types', 'data_names', 'data_shapers')
+
+    def __init__(self, event_abi:Dict[str, Any]):
+        self.name: str = event_abi['name']
+        # Same type derivation as web3's get_event_data(). (Indexed strings, 
+        # bytes & dynamic arrays are stored as their keccak hash)
+        indexed = list(normalize_event_input_types([i for i in event_abi['inputs'] if i['indexed']]))
+        not_indexed = list(normalize_event_input_types([i for i in event_abi['inputs'] if not i['indexed']]))
+        self.topic_types = tuple(get_event_abi_types_for_decoding(indexed))
+        self.topic_names = tuple(i['name'] for i in indexed)
+        self.data_types = tuple(get_event_abi_types_for_decoding(not_indexed))
+        self.data_names = tuple(i['name'] for i in not_indexed)
+        # Topics are 32-byte scalars (or hashes), so only addresses need work. 
+        # None means nothing needs reshaping
+        self.topic_shapers = None
+        if any('address' in t for t in self.topic_types):
+            self.topic_shapers = [to_checksum_address if t == 'address' else _identity for t in self.topic_types]
+        data_shapers = [_shaper(i) for i in not_indexed]
+        self.data_shapers = None
+        if any(data_shapers):
+            self.data_shapers = [s or _identity for s in data_shapers]
+
+    def decode(self, log:Dict[str, Any]) -> Dict[str, Any] | None:
+        # Decoded args for `log`, or None if it doesn't fit this event
+        topics = log['topics'][1:]
+        if len(topics) != len(self.topic_types):
+            return None
+        try:
+            topic_values = [CODEC.decode((t,), HexBytes(topic))[0] for t, topic in zip(self.topic_types, topics)]
+            data_values = CODEC.decode(self.data_types, HexBytes(log['data']))
+        except (DecodingError, TypeError):
+            return None
+
+        if self.topic_shapers is not None:
+            topic_values = [s(v) for s, v in zip(self.topic_shapers, topic_values)]
+        if self.data_shapers is not None:
+            data_values = [s(v) for s, v in zip(self.data_shapers, data_values)]
+
+        args = dict(zip(self.topic_names, topic_values))
+        args.update(zip(self.data_names, data_values))
+        return args
+
+class EventDecoder:
+    def __init__(self, event_topics:Dict[str, Dict[str, Any]]):
+        # event_topics: {topic0 hex: event ABI}, e.g. a generated class's EVENT_TOPICS
+        self.layouts: Dict[bytes, EventLayout] = {
+            bytes(HexBytes(topic)): EventLayout(event_abi) for topic, event_abi in event_topics.items()
+        }
+
+    def decode_log(self, log:Dict[str, Any]) -> AttributeDict | None:
+        if not log['topics']:
+            return None
+        layout = self.layouts.get(_topic_key(log['topics'][0]))
+        if layout is None:
+            return None
+        return self._event_data(layout, log)
+
+    def decode_logs(self,
+                    logs:Iterable[Dict[str, Any]],
+                    event_names:Sequence[str] | None = None,
+                    addresses:Sequence[address] | None = None) -> Dict[str, List[AttributeDict]]:
+        # Decoded events by name. Only logs emitted by `addresses` (checksum
+        # addresses) and events in `event_names` are decoded, if those are given
+        layouts = self.layouts
+        if event_names is not None:
+            layouts = {t: l for t, l in layouts.items() if l.name in event_names}
+        address_set = set(addresses) if addresses is not None else None
+
+        event_dicts: Dict[str, List[AttributeDict]] = {}
+        for log in logs:
+            topics = log['topics']
+            if not topics:
+                continue
+            layout = layouts.get(_topic_key(topics[0]))
+            if layout is None:
+                continue
+            if address_set is not None and log['address'] not in address_set:
+                continue
+            event_data = self._event_data(layout, log)
+            if event_data is not None:
+                event_dicts.setdefault(layout.name, []).append(event_data)
+        return event_dicts
+
+    def _event_data(self, layout:EventLayout, log:Dict[str, Any]) -> AttributeDict | None:
+        args = layout.decode(log)
+        if args is None:
+            return None
+        event_data = {
+            'args': args,
+            'event': layout.name,
+            'logIndex': log['logIndex'],
+            'transactionIndex': log['transactionIndex'],
+            'transactionHash': log['transactionHash'],
+            'address': log['address'],
+            'blockHash': log['blockHash'],
+            'blockNumber': log['blockNumber'],
+        }
+        if isinstance(log, AttributeDict):
+            return AttributeDict.recursive(event_data)
+        return event_data # type: ignore
+
+# id(event_topics): (event_topics, decoder). We keep a reference to each
+# table so its id can't be reused
+_DECODERS: Dict[int, Tuple[Dict, EventDecoder]] = {}
+# abi_str: decoder
+_ABI_DECODERS: Dict[str, EventDecoder] = {}
+_LOCK = threading.Lock()
+
+def decoder_for_topics(event_topics:Dict[str, Dict[str, Any]]) -> EventDecoder:
+    # One decoder per generated class's EVENT_TOPICS table
+    entry = _DECODERS.get(id(event_topics))
+    if entry is None:
+        with _LOCK:
+            entry = _DECODERS.setdefault(id(event_topics), (event_topics, EventDecoder(event_topics)))
+    return entry[1]
+
+def decoder_for_abi(abi:str) -> EventDecoder:
+    # For wrappers without precomputed tables, derive topics from the ABI itself
+    decoder = _ABI_DECODERS.get(abi)
+    if decoder is None:
+        event_topics = {HexBytes(event_abi_to_log_topic(e)).hex(): e
+                        for e in abi_registry.parsed_abi(abi)
+                        if e.get('type') == 'event' and not e.get('anonymous')}
+        with _LOCK:
+            decoder = _ABI_DECODERS.setdefault(abi, EventDecoder(event_topics))
+    return decoder
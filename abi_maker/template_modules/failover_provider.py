@@ -0,0 +1,402 @@
+#! /usr/bin/env python
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import math
+import threading
+import time
+
+from web3.providers import JSONBaseProvider
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from typing import Any, Callable, Deque, Dict, List, Sequence, Set
+
+# Routes each request over several RPC endpoints for the same chain.
+#
+# Every endpoint keeps a rolling health record: an exponentially weighted
+# average of its latency & error rate, plus recent latencies for a p95.
+# Requests go to the endpoint with the best score (lowest latency, weighted
+# by errors). An endpoint that fails is skipped for a cooldown that doubles
+# with each consecutive failure, and an endpoint that hasn't been used for
+# a while gets the next read, so its score doesn't go stale.
+#
+# Reads (IDEMPOTENT_METHODS) that fail, or get an error that another node may
+# not give (RETRYABLE_RPC_ERRORS), are retried on the next best endpoint.
+# Anything else, e.g. eth_sendRawTransaction, is sent once.
+#
+# With hedged_reads, a read that the best endpoint hasn't answered within
+# its p95 latency is also sent to the next best one, and whichever answers
+# first wins. This costs a few percent more requests to cut the slowest ones.
+#
+# Health is kept per URL for the whole process, so sync & async providers
+# and groups that share an endpoint share what's known about it.
+
+IDEMPOTENT_METHODS = frozenset((
+    'eth_blockNumber',
+    'eth_call',
+    'eth_chainId',
+    'eth_estimateGas',
+    'eth_feeHistory',
+    'eth_gasPrice',
+    'eth_getBalance',
+    'eth_getBlockByHash',
+    'eth_getBlockByNumber',
+    'eth_getBlockTransactionCountByNumber',
+    'eth_getCode',
+    'eth_getLogs',
+    'eth_getStorageAt',
+    'eth_getTransactionByHash',
+    'eth_getTransactionCount',
+    'eth_getTransactionReceipt',
+    'eth_maxPriorityFeePerGas',
+    'eth_syncing',
+    'net_version',
+    'web3_clientVersion',
+))
+
+# Substrings of JSON-RPC error messages that mean "this node can't answer
+# right now", not "the answer is an error" (like a revert)
+RETRYABLE_RPC_ERRORS = (
+    'header not found',
+    'missing trie node',
+    'rate limit',
+    'too many requests',
+    'service unavailable',
+    'timeout',
+    'timed out',
+)
+
+DEFAULT_MAX_ATTEMPTS = 3
+# Used as the hedge delay until an endpoint has enough latency samples for a p95
+DEFAULT_HEDGE_DELAY = 0.25
+MIN_HEDGE_DELAY = 0.005
+MIN_P95_SAMPLES = 20
+LATENCY_WINDOW = 256
+# Weight of each new sample in the latency & error rate averages
+EWMA_ALPHA = 0.2
+# An endpoint with a 50% error rate scores as if it were 3x slower
+ERROR_PENALTY = 4
+BASE_COOLDOWN = 1.0
+MAX_COOLDOWN = 60.0
+# Seconds an endpoint can go unused before it gets a read to refresh its score
+PROBE_INTERVAL = 10.0
+
+def is_retryable_response(response:RPCResponse) -> bool:
+    error = response.get('error')
+    if not error:
+        return False
+    message = str(error.get('message', '') if isinstance(error, dict) else error).lower()
+    return any(e in message for e in RETRYABLE_RPC_ERRORS)
+
+class EndpointHealth:
+    def __init__(self, url:str):
+        self.url = url
+        self.latency: float | None = None
+        self.error_rate = 0.0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.last_used = 0.0
+        self._p95: float | None = None
+        self._p95_age = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency:float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.latency = latency if self.latency is None else self.latency + EWMA_ALPHA * (latency - self.latency)
+            self.error_rate -= EWMA_ALPHA * self.error_rate
+            self.latencies.append(latency)
+            self._p95_age += 1
+            self.consecutive_failures = 0
+            self.down_until = 0.0
+
+    def record_failure(self, latency:float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.error_rate += EWMA_ALPHA * (1 - self.error_rate)
+            # A failure that took a long time (e.g. a timeout) counts against latency too
+            if self.latency is None or latency > self.latency:
+                self.latency = latency if self.latency is None else self.latency + EWMA_ALPHA * (latency - self.latency)
+            self.consecutive_failures += 1
+            cooldown = min(BASE_COOLDOWN * 2 ** (self.consecutive_failures - 1), MAX_COOLDOWN)
+            self.down_until = time.monotonic() + cooldown
+
+    def score(self) -> float:
+        # Lower is better. Endpoints we haven't heard from yet score 0, so
+        # each gets tried
+        return (self.latency or 0.0) * (1 + ERROR_PENALTY * self.error_rate)
+
+    def is_down(self, now:float) -> bool:
+        return now < self.down_until
+
+    def p95(self) -> float | None:
+        # Recomputed every 32 samples rather than on every request
+        with self._lock:
+            if len(self.latencies) < MIN_P95_SAMPLES:
+                return None
+            if self._p95 is None or self._p95_age >= 32:
+                # Nearest rank: the smallest sample at or above 95% of them
+                ordered = sorted(self.latencies)
+                self._p95 = ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+                self._p95_age = 0
+            return self._p95
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        p95 = self.p95()
+        return {
+            'score': self.score(),
+            'latency_ms': None if self.latency is None else self.latency * 1000,
+            'p95_ms': None if p95 is None else p95 * 1000,
+            'error_rate': self.error_rate,
+            'requests': self.requests,
+            'errors': self.errors,
+            'down_for': max(0.0, self.down_until - now),
+        }
+
+# url: EndpointHealth
+ENDPOINT_HEALTH: Dict[str, EndpointHealth] = {}
+_HEALTH_LOCK = threading.Lock()
+
+def health_for_url(url:str) -> EndpointHealth:
+    health = ENDPOINT_HEALTH.get(url)
+    if health is None:
+        with _HEALTH_LOCK:
+            health = ENDPOINT_HEALTH.setdefault(url, EndpointHealth(url))
+    return health
+
+def endpoint_stats() -> Dict[str, Dict[str, Any]]:
+    return {url: health.stats() for url, health in list(ENDPOINT_HEALTH.items())}
+
+class _Router:
+    # Endpoint choice & bookkeeping shared by the sync & async providers
+    def __init__(self,
+                 urls:Sequence[str],
+                 hedged_reads:bool = False,
+                 max_attempts:int = DEFAULT_MAX_ATTEMPTS):
+        if len(urls) < 2:
+            raise ValueError(f'Failover needs at least 2 RPC URLs, got {urls}')
+        self.urls = list(urls)
+        self.health = [health_for_url(url) for url in self.urls]
+        self.hedged_reads = hedged_reads
+        self.max_attempts = max_attempts
+        self.retries = 0
+        self.hedges = 0
+
+    def ranked(self, probe:bool) -> List[int]:
+        # Indexes of our endpoints, best first. Endpoints in cooldown go last,
+        # soonest to recover first. With `probe`, an endpoint that's been idle
+        # for PROBE_INTERVAL goes first
+        now = time.monotonic()
+        order = sorted(range(len(self.urls)), key=lambda i: (self.health[i].is_down(now),
+                                                             self.health[i].down_until,
+                                                             self.health[i].score()))
+        if probe:
+            for n, i in enumerate(order):
+                health = self.health[i]
+                if not health.is_down(now) and now - health.last_used > PROBE_INTERVAL:
+                    order.insert(0, order.pop(n))
+                    break
+        self.health[order[0]].last_used = now
+        return order
+
+    def attempts_for(self, method:RPCEndpoint) -> List[int]:
+        if method in IDEMPOTENT_METHODS:
+            return self.ranked(probe=True)[:self.max_attempts]
+        return self.ranked(probe=False)[:1]
+
+    def hedge_delay(self, i:int) -> float:
+        p95 = self.health[i].p95()
+        return DEFAULT_HEDGE_DELAY if p95 is None else max(p95, MIN_HEDGE_DELAY)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'endpoints': {url: h.stats() for url, h in zip(self.urls, self.health)},
+        }
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    def __init__(self,
+                 urls:Sequence[str],
+                 make_provider:Callable[[str], JSONBaseProvider],
+                 hedged_reads:bool = False,
+                 max_attempts:int = DEFAULT_MAX_ATTEMPTS):
+        # make_provider builds the provider for one URL, e.g. provider_registry.make_provider,
+        # so each endpoint keeps its own connection pool & settings
+        super().__init__()
+        self.router = _Router(urls, hedged_reads, max_attempts)
+        self.endpoint_uri = ' '.join(self.router.urls)
+        self.providers = [make_provider(url) for url in self.router.urls]
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    def __str__(self):
+        return f'FailoverHTTPProvider({self.router.urls})'
+
+    def make_request(self, method:RPCEndpoint, params:Any) -> RPCResponse:
+        attempts = self.router.attempts_for(method)
+        if self.router.hedged_reads and len(attempts) > 1:
+            return self._hedged_request(method, params, attempts)
+
+        response: RPCResponse | None = None
+        error: Exception | None = None
+        for n, i in enumerate(attempts):
+            if n > 0:
+                self.router.retries += 1
+            try:
+                response = self._request(i, method, params)
+            except Exception as e:
+                error = e
+                continue
+            if not is_retryable_response(response):
+                return response
+        if response is not None:
+            return response
+        raise error # type: ignore
+
+    def _request(self, i:int, method:RPCEndpoint, params:Any) -> RPCResponse:
+        # One request to endpoint `i`, timed & recorded in its health
+        health = self.router.health[i]
+        start = time.monotonic()
+        try:
+            response = self.providers[i].make_request(method, params)
+        except Exception:
+            health.record_failure(time.monotonic() - start)
+            raise
+        if is_retryable_response(response):
+            health.record_failure(time.monotonic() - start)
+        else:
+            health.record_success(time.monotonic() - start)
+        return response
+
+    def _hedged_request(self, method:RPCEndpoint, params:Any, attempts:List[int]) -> RPCResponse:
+        # Send to the best endpoint; if it hasn't answered after its p95
+        # latency, or it fails, send to the next one too. Return the first good
+        # response. Requests that lose the race finish in the background,
+        # and still count towards their endpoint's health
+        executor = self._hedge_executor()
+        remaining = list(attempts)
+        hedge_at = time.monotonic() + self.router.hedge_delay(remaining[0])
+        pending: Set[Future] = {executor.submit(self._request, remaining.pop(0), method, params)}
+        response: RPCResponse | None = None
+        error: Exception | None = None
+        while pending:
+            timeout = max(0.0, hedge_at - time.monotonic()) if remaining and len(pending) == 1 else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                else:
+                    if not is_retryable_response(response):
+                        return response
+                if remaining:
+                    self.router.retries += 1
+                    pending.add(executor.submit(self._request, remaining.pop(0), method, params))
+            if not done and remaining:
+                self.router.hedges += 1
+                pending.add(executor.submit(self._request, remaining.pop(0), method, params))
+        if response is not None:
+            return response
+        raise error # type: ignore
+
+    def _hedge_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=8 * len(self.providers),
+                                                        thread_name_prefix='rpc_hedge')
+        return self._executor
+
+    def close(self) -> None:
+        # Stop the hedging threads & close each endpoint's connections. 
+        # Requests that lost a hedge race are left to finish
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        for provider in self.providers:
+            close = getattr(provider, 'close', None)
+            if close is not None:
+                close()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.router.stats()
+
+class AsyncFailoverHTTPProvider(AsyncJSONBaseProvider):
+    # Async counterpart of FailoverHTTPProvider. Requests that lose a hedge
+    # race are cancelled
+    def __init__(self,
+                 urls:Sequence[str],
+                 make_provider:Callable[[str], AsyncJSONBaseProvider],
+                 hedged_reads:bool = False,
+                 max_attempts:int = DEFAULT_MAX_ATTEMPTS):
+        super().__init__()
+        self.router = _Router(urls, hedged_reads, max_attempts)
+        self.endpoint_uri = ' '.join(self.router.urls)
+        self.providers = [make_provider(url) for url in self.router.urls]
+
+    def __str__(self):
+        return f'AsyncFailoverHTTPProvider({self.router.urls})'
+
+    async def make_request(self, method:RPCEndpoint, params:Any) -> RPCResponse:
+        attempts = self.router.attempts_for(method)
+        remaining = list(attempts)
+        hedge_at = None
+        if self.router.hedged_reads and len(attempts) > 1:
+            hedge_at = time.monotonic() + self.router.hedge_delay(remaining[0])
+        pending = {asyncio.ensure_future(self._request(remaining.pop(0), method, params))}
+        response: RPCResponse | None = None
+        error: Exception | None = None
+        try:
+            while pending:
+                timeout = None
+                if hedge_at is not None and remaining and len(pending) == 1:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        error = e
+                    else:
+                        if not is_retryable_response(response):
+                            return response
+                    if remaining:
+                        self.router.retries += 1
+                        pending.add(asyncio.ensure_future(self._request(remaining.pop(0), method, params)))
+                if not done and remaining:
+                    self.router.hedges += 1
+                    pending.add(asyncio.ensure_future(self._request(remaining.pop(0), method, params)))
+        finally:
+            for task in pending:
+                task.cancel()
+        if response is not None:
+            return response
+        raise error # type: ignore
+
+    async def _request(self, i:int, method:RPCEndpoint, params:Any) -> RPCResponse:
+        health = self.router.health[i]
+        start = time.monotonic()
+        try:
+            response = await self.providers[i].make_request(method, params)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            health.record_failure(time.monotonic() - start)
+            raise
+        if is_retryable_response(response):
+            health.record_failure(time.monotonic() - start)
+        else:
+            health.record_success(time.monotonic() - start)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return self.router.stats()
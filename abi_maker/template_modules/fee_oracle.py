@@ -0,0 +1,189 @@
+#! /usr/bin/env python
+from concurrent.futures import Future
+import threading
+import time
+
+from web3 import Web3
+from web3.exceptions import MethodUnavailable
+
+from . import provider_registry
+from typing import Dict, List
+
+# Transaction fees, fetched at most once per `ttl` seconds per RPC and shared by
+# every wrapper on that RPC, so no fee queries happen on the transaction path.
+#
+# After `ttl` seconds, cached fees are still returned while a background thread
+# fetches new ones. Only fees older than MAX_STALENESS * ttl (or none at all)
+# make a caller wait for a fetch, and callers that need one at the same time 
+# all wait for the same fetch.
+#
+# For a different strategy, subclass FeeOracle, override fetch_fees(), and
+# install it with set_fee_oracle()
+
+DEFAULT_TTL = 15
+MAX_STALENESS = 4
+# Blocks of eth_feeHistory to look at
+DEFAULT_HISTORY_BLOCKS = 10
+# Priority fee: this percentile of each block's tips, then the median of those
+DEFAULT_PERCENTILE = 50
+# maxFeePerGas = next block's base fee * this + priority fee. 2x survives six
+# consecutive full blocks
+DEFAULT_BASE_FEE_MULTIPLIER = 2
+
+# JSON-RPC error codes & messages that mean a node doesn't have eth_feeHistory
+# at all (so the chain gets legacy gasPrice fees), rather than that this one
+# request failed
+UNSUPPORTED_METHOD_CODES = (-32601, -32004)
+UNSUPPORTED_METHOD_ERRORS = (
+    'method not found',
+    'does not exist',
+    'not supported',
+    'not implemented',
+)
+
+def is_unsupported_method_error(e:Exception) -> bool:
+    if isinstance(e, (MethodUnavailable, NotImplementedError)):
+        return True
+    error = e.args[0] if e.args else None
+    if isinstance(error, dict):
+        if error.get('code') in UNSUPPORTED_METHOD_CODES:
+            return True
+        error = error.get('message', '')
+    message = str(error).lower()
+    return any(m in message for m in UNSUPPORTED_METHOD_ERRORS)
+
+class FeeOracle:
+    def __init__(self,
+                 w3:Web3,
+                 ttl:float = DEFAULT_TTL,
+                 percentile:float = DEFAULT_PERCENTILE,
+                 history_blocks:int = DEFAULT_HISTORY_BLOCKS,
+                 base_fee_multiplier:float = DEFAULT_BASE_FEE_MULTIPLIER,
+                 background_refresh:bool = True):
+        self.w3 = w3
+        self.ttl = ttl
+        self.percentile = percentile
+        self.history_blocks = history_blocks
+        self.base_fee_multiplier = base_fee_multiplier
+        self.background_refresh = background_refresh
+        self.fetch_count = 0
+        self._fees: Dict[str, int] | None = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # The fetch in progress, if any, for refresh() callers to share
+        self._pending: Future | None = None
+
+    def fees(self) -> Dict[str, int]:
+        # Either {'maxFeePerGas', 'maxPriorityFeePerGas'} or, on chains without
+        # EIP-1559, {'gasPrice'}
+        return self.cached_fees() or self.refresh()
+
+    def cached_fees(self) -> Dict[str, int] | None:
+        # Cached fees if they're usable, starting a background refresh if
+        # they're getting old. None if the caller needs to refresh()
+        age = time.monotonic() - self._fetched_at
+        if self._fees is None or age > self.ttl * MAX_STALENESS:
+            return None
+        if age > self.ttl:
+            if not self.background_refresh:
+                return None
+            self._refresh_in_background()
+        return self._fees
+
+    def refresh(self) -> Dict[str, int]:
+        # Fetch & cache fees. If a fetch is already under way, wait for its result
+        with self._lock:
+            pending = self._pending
+            fetching = pending is None
+            if fetching:
+                pending = self._pending = Future()
+        if not fetching:
+            return pending.result()
+
+        try:
+            fees = self.fetch_fees()
+        except BaseException as e:
+            with self._lock:
+                self._pending = None
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            self._fees = fees
+            self._fetched_at = time.monotonic()
+            self.fetch_count += 1
+            self._pending = None
+        pending.set_result(fees)
+        return fees
+
+    def fetch_fees(self) -> Dict[str, int]:
+        # Chains without EIP-1559 get {'gasPrice'}: those whose nodes don't
+        # know eth_feeHistory, or give no base fee. Any other error (timeouts, 
+        # rate limits...) is raised, so a transient failure isn't taken for a 
+        # legacy chain & cached as such. See _refresh_in_background()
+        try:
+            history = self.w3.eth.fee_history(self.history_blocks, 'latest', [self.percentile])
+        except Exception as e:
+            if not is_unsupported_method_error(e):
+                raise
+            history = {}
+        # The last base fee is for the next block
+        base_fees = history.get('baseFeePerGas') or [0]
+        next_base_fee = base_fees[-1]
+        if not next_base_fee:
+            return {'gasPrice': self.w3.eth.gas_price}
+
+        tips = sorted(r[0] for r in history.get('reward', []) if r)
+        priority_fee = median(tips) if tips else self.w3.eth.max_priority_fee
+        return {
+            'maxFeePerGas': int(next_base_fee * self.base_fee_multiplier + priority_fee),
+            'maxPriorityFeePerGas': int(priority_fee),
+        }
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep the old fees; once they're too old, callers refresh themselves
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+        threading.Thread(target=run, name='FeeOracle', daemon=True).start()
+
+def median(values:List[int]) -> int:
+    return values[len(values) // 2]
+
+def cap_fees(fees:Dict[str, int], max_fee_wei:int, max_priority_wei:int) -> Dict[str, int]:
+    # Limit oracle fees to a wrapper's max_gas_gwei & max_priority_gwei
+    if 'gasPrice' in fees:
+        return {'gasPrice': min(fees['gasPrice'], int(max_fee_wei))}
+    max_fee = min(fees['maxFeePerGas'], int(max_fee_wei))
+    priority_fee = min(fees['maxPriorityFeePerGas'], int(max_priority_wei), max_fee)
+    return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': priority_fee}
+
+# rpc: FeeOracle
+FEE_ORACLES: Dict[str, FeeOracle] = {}
+_LOCK = threading.Lock()
+
+def oracle_for_rpc(rpc:str) -> FeeOracle:
+    oracle = FEE_ORACLES.get(rpc)
+    if oracle is None:
+        with _LOCK:
+            oracle = FEE_ORACLES.get(rpc)
+            if oracle is None:
+                oracle = FeeOracle(provider_registry.get_w3(rpc))
+                FEE_ORACLES[rpc] = oracle
+    return oracle
+
+def set_fee_oracle(rpc:str, oracle:FeeOracle) -> None:
+    # Wrappers created for `rpc` after this use `oracle`. Existing wrappers
+    # keep theirs; assign wrapper.fee_oracle to change them
+    with _LOCK:
+        FEE_ORACLES[rpc] = oracle
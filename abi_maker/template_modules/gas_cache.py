@@ -0,0 +1,97 @@
+#! /usr/bin/env python
+from concurrent.futures import Future
+import threading
+import time
+
+from typing import Dict, Tuple, Any, Hashable, Sequence
+
+# Without a 'gas' entry, web3's build_transaction() runs eth_estimateGas for
+# every transaction, even though repeated calls to the same function on the
+# same contract nearly always need the same gas. With the cache enabled,
+# wrappers estimate once per (chain, contract, function selector, arg shape),
+# pad the estimate by `multiplier`, and reuse it for `ttl` seconds.
+#
+# An entry is dropped as soon as a transaction sent with it runs out of gas.
+# Off by default; see enable_gas_cache()
+
+DEFAULT_MULTIPLIER = 1.25
+DEFAULT_TTL = 600
+# A failed transaction that used at least this fraction of its gas limit is
+# treated as out of gas. (Calls that run out pass on 63/64 of the remaining gas)
+OUT_OF_GAS_FRACTION = 63 / 64
+
+# (chain_id, contract address, selector, arg shape)
+GasKey = Tuple[int, str, str, Hashable]
+
+class GasEstimateCache:
+    def __init__(self, multiplier:float = DEFAULT_MULTIPLIER, ttl:float = DEFAULT_TTL):
+        self.multiplier = multiplier
+        self.ttl = ttl
+        # key: (padded gas limit, expiry time)
+        self.entries: Dict[GasKey, Tuple[int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key:GasKey) -> int | None:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, key:GasKey, estimate:int) -> int:
+        # Store `estimate` padded by self.multiplier, and return the padded value
+        gas_limit = int(estimate * self.multiplier)
+        with self._lock:
+            self.entries[key] = (gas_limit, time.monotonic() + self.ttl)
+        return gas_limit
+
+    def invalidate(self, key:GasKey) -> None:
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def check_receipt(self, key:GasKey, gas_limit:int, receipt:Dict[str, Any]) -> None:
+        # Called with the receipt of every transaction sent with a cached limit
+        if receipt['status'] == 0 and receipt['gasUsed'] >= gas_limit * OUT_OF_GAS_FRACTION:
+            self.invalidate(key)
+
+    def track(self, key:GasKey, gas_limit:int, pending_tx:Future) -> None:
+        # Check the receipt of a transaction sent with a cached limit once it arrives
+        def check(f:Future) -> None:
+            if not f.cancelled() and f.exception() is None:
+                self.check_receipt(key, gas_limit, f.result())
+        pending_tx.add_done_callback(check)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'entries': len(self.entries),
+        }
+
+def arg_shape(args:Sequence[Any]) -> Tuple[int | None, ...]:
+    # Gas usually scales with the length of array arguments, so calls whose
+    # arrays differ in length get separate estimates
+    return tuple(len(a) if isinstance(a, (list, tuple)) else None for a in args)
+
+# The process-wide cache, or None while caching is off
+GAS_CACHE: GasEstimateCache | None = None
+
+def enable_gas_cache(multiplier:float = DEFAULT_MULTIPLIER, ttl:float = DEFAULT_TTL) -> GasEstimateCache:
+    global GAS_CACHE
+    GAS_CACHE = GasEstimateCache(multiplier, ttl)
+    return GAS_CACHE
+
+def disable_gas_cache() -> None:
+    global GAS_CACHE
+    GAS_CACHE = None
@@ -0,0 +1,271 @@
+#! /usr/bin/env python
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import json
+import sqlite3
+import threading
+import time
+
+from web3 import Web3
+
+from .abi_contract_wrapper import ABIContractWrapper
+from .event_decoder import EventDecoder
+from .solidity_types import ChecksumAddress
+from typing import Dict, List, Tuple, Any, Deque, Iterator, Sequence
+
+# Fetches every event a contract has emitted with eth_getLogs, decodes it with
+# the contract's ABI (see event_decoder.py), and stores it in a local SQLite
+# database along with a checkpoint per (chain, contract). Later runs start
+# from the checkpoint, so they only fetch blocks that are new since last time.
+#
+# Block ranges are fetched `max_workers` at a time. Range size adapts to the
+# provider: a range rejected as too large is split in half and the size
+# shrinks; ranges with no logs grow it. Results are written in block order,
+# and the checkpoint only moves past ranges that are fully stored, so an
+# interrupted run loses nothing.
+
+DEFAULT_CHUNK_SIZE = 2_000
+MIN_CHUNK_SIZE = 1
+MAX_CHUNK_SIZE = 100_000
+DEFAULT_WORKERS = 4
+# Blocks behind the head to stop at. Stored logs & the checkpoint are never
+# revisited, so logs from blocks that are later reorged out would stay for good
+DEFAULT_CONFIRMATIONS = 12
+# Attempts for a range that fails for some reason other than its size
+FETCH_RETRIES = 3
+RETRY_DELAY = 1
+
+# Lowercased fragments of provider errors meaning "ask for fewer blocks"
+RANGE_ERRORS = (
+    'range too large',
+    'range is too large',
+    'block range',
+    'too many blocks',
+    'more than 10000 results',
+    'query returned more than',
+    'response size exceeded',
+    'response size should not',
+    'log response size',
+    'exceed maximum block range',
+    'limit exceeded',
+    'query timeout',
+)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkpoints (
+    chain_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    last_block INTEGER NOT NULL,
+    PRIMARY KEY (chain_id, address)
+);
+CREATE TABLE IF NOT EXISTS events (
+    chain_id INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    event TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (chain_id, block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_by_contract ON events (chain_id, address, event, block_number);
+'''
+
+def is_range_error(e:Exception) -> bool:
+    message = str(e).lower()
+    return any(r in message for r in RANGE_ERRORS)
+
+class ChunkSizer:
+    def __init__(self,
+                 size:int = DEFAULT_CHUNK_SIZE,
+                 min_size:int = MIN_CHUNK_SIZE,
+                 max_size:int = MAX_CHUNK_SIZE):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def too_large(self, range_size:int) -> None:
+        # Ranges at least this big fail, so stay below it from now on
+        self.size = max(self.min_size, min(self.size, range_size // 2))
+
+    def fetched(self, range_size:int, log_count:int) -> None:
+        if log_count == 0 and range_size >= self.size:
+            self.size = min(self.max_size, self.size * 2)
+
+def _json_default(value:Any) -> Any:
+    # Decoded args hold bytes/HexBytes and, for structs, AttributeDicts
+    if isinstance(value, (bytes, bytearray)):
+        return Web3.to_hex(value)
+    if hasattr(value, 'items'):
+        return dict(value)
+    raise TypeError(f'Can\'t store {type(value).__name__} value {value!r}')
+
+class LogIndexer:
+    def __init__(self,
+                 db_path:str,
+                 max_workers:int = DEFAULT_WORKERS,
+                 chunk_size:int = DEFAULT_CHUNK_SIZE,
+                 max_chunk_size:int = MAX_CHUNK_SIZE,
+                 confirmations:int = DEFAULT_CONFIRMATIONS):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.confirmations = confirmations
+        # eth_getLogs calls made, for a look at how chunking is doing
+        self.request_count = 0
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # Fetches run in several threads
+        self._count_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.db.close()
+
+    def checkpoint(self, chain_id:int, address:str) -> int | None:
+        # Last block fully indexed for this contract, or None
+        with self._lock:
+            row = self.db.execute('SELECT last_block FROM checkpoints WHERE chain_id = ? AND address = ?',
+                                  (chain_id, Web3.to_checksum_address(address))).fetchone()
+        return row[0] if row else None
+
+    def index_all(self,
+                  wrappers:Sequence[ABIContractWrapper],
+                  start_block:int = 0,
+                  end_block:int | None = None) -> Dict[str, int]:
+        # {contract address: events stored}
+        return {w.contract_address: self.index(w, start_block, end_block) for w in wrappers}
+
+    def index(self,
+              wrapper:ABIContractWrapper,
+              start_block:int = 0,
+              end_block:int | None = None) -> int:
+        # Fetch & store all of `wrapper`'s events from its checkpoint (or
+        # `start_block`, e.g. its deployment block, on a first run) to
+        # `end_block` (default: the head, less self.confirmations).
+        # Returns the number of events stored
+        w3 = wrapper.w3
+        chain_id = wrapper.get_chain_id()
+        address = wrapper.contract_address
+        decoder = wrapper.event_decoder()
+
+        checkpoint = self.checkpoint(chain_id, address)
+        if checkpoint is not None:
+            start_block = max(start_block, checkpoint + 1)
+        if end_block is None:
+            end_block = w3.eth.block_number - self.confirmations
+        if start_block > end_block:
+            return 0
+
+        sizer = ChunkSizer(self.chunk_size, max_size=self.max_chunk_size)
+        # Ranges to retry after being split, fetched before any new ones
+        retry_ranges: Deque[Tuple[int, int]] = deque()
+        in_flight: Dict[Future, Tuple[int, int]] = {}
+        # first block: (last block, logs), for ranges fetched out of order
+        fetched: Dict[int, Tuple[int, List[Any]]] = {}
+        next_block = start_block
+        stored_through = start_block - 1
+        stored = 0
+
+        with ThreadPoolExecutor(self.max_workers, thread_name_prefix='LogIndexer') as executor:
+            while stored_through < end_block:
+                while len(in_flight) < self.max_workers and (retry_ranges or next_block <= end_block):
+                    if retry_ranges:
+                        block_range = retry_ranges.popleft()
+                    else:
+                        block_range = (next_block, min(next_block + sizer.size - 1, end_block))
+                        next_block = block_range[1] + 1
+                    in_flight[executor.submit(self._fetch, w3, address, *block_range)] = block_range
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    lo, hi = in_flight.pop(future)
+                    try:
+                        logs = future.result()
+                    except Exception as e:
+                        if not is_range_error(e) or lo == hi:
+                            for f in in_flight:
+                                f.cancel()
+                            raise
+                        sizer.too_large(hi - lo + 1)
+                        mid = (lo + hi) // 2
+                        retry_ranges.extend(((lo, mid), (mid + 1, hi)))
+                        continue
+                    sizer.fetched(hi - lo + 1, len(logs))
+                    fetched[lo] = (hi, logs)
+
+                # Store everything that's now contiguous with what's stored
+                ready: List[Any] = []
+                advanced = False
+                while stored_through + 1 in fetched:
+                    hi, logs = fetched.pop(stored_through + 1)
+                    ready.extend(logs)
+                    stored_through = hi
+                    advanced = True
+                if advanced:
+                    stored += self._store(chain_id, address, decoder, ready, stored_through)
+
+        return stored
+
+    def _fetch(self, w3:Web3, address:ChecksumAddress, from_block:int, to_block:int) -> List[Any]:
+        filter_params = {'address': address, 'fromBlock': from_block, 'toBlock': to_block}
+        for attempt in range(FETCH_RETRIES):
+            with self._count_lock:
+                self.request_count += 1
+            try:
+                return w3.eth.get_logs(filter_params) # type: ignore
+            except Exception as e:
+                if is_range_error(e) or attempt == FETCH_RETRIES - 1:
+                    raise
+                time.sleep(RETRY_DELAY * (attempt + 1))
+        return []
+
+    def _store(self, chain_id:int, address:ChecksumAddress, decoder:EventDecoder, logs:List[Any], last_block:int) -> int:
+        # Write logs & move the checkpoint in one transaction
+        rows = []
+        for log in logs:
+            if log.get('removed'):
+                continue
+            event_data = decoder.decode_log(log)
+            if event_data is None:
+                continue
+            rows.append((chain_id, address, event_data['event'], log['blockNumber'], log['logIndex'],
+                         Web3.to_hex(log['transactionHash']), json.dumps(event_data['args'], default=_json_default)))
+        with self._lock, self.db:
+            self.db.executemany('INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.execute('INSERT INTO checkpoints VALUES (?, ?, ?) '
+                            'ON CONFLICT (chain_id, address) DO UPDATE SET last_block = excluded.last_block',
+                            (chain_id, address, last_block))
+        return len(rows)
+
+    def events(self,
+               wrapper:ABIContractWrapper,
+               event_name:str | None = None,
+               from_block:int | None = None,
+               to_block:int | None = None) -> Iterator[Dict[str, Any]]:
+        # Stored events for `wrapper`'s contract, in chain order. Args are
+        # as decoded, except bytes values are hex strings and structs are dicts
+        query = 'SELECT event, block_number, log_index, transaction_hash, args FROM events WHERE chain_id = ? AND address = ?'
+        params: List[Any] = [wrapper.get_chain_id(), wrapper.contract_address]
+        if event_name is not None:
+            query += ' AND event = ?'
+            params.append(event_name)
+        if from_block is not None:
+            query += ' AND block_number >= ?'
+            params.append(from_block)
+        if to_block is not None:
+            query += ' AND block_number <= ?'
+            params.append(to_block)
+        query += ' ORDER BY block_number, log_index'
+        with self._lock:
+            rows = self.db.execute(query, params).fetchall()
+        for event, block_number, log_index, tx_hash, args in rows:
+            yield {
+                'event': event,
+                'blockNumber': block_number,
+                'logIndex': log_index,
+                'transactionHash': tx_hash,
+                'address': wrapper.contract_address,
+                'args': json.loads(args),
+            }
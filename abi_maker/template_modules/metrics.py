@@ -0,0 +1,332 @@
+#! /usr/bin/env python
+from bisect import bisect_left
+import contextvars
+import functools
+import inspect
+import json
+import random
+import threading
+import time
+
+from .nonce_manager import CHAIN_IDS, chain_id_for_rpc
+from typing import Any, Callable, ContextManager, Dict, List, Sequence, Tuple
+
+# Counts, errors & latency histograms for wrapper traffic. Off by default;
+# see enable_metrics(). While off, the hooks below cost one global check.
+#
+# Two families of series are kept:
+#   'call': wrapper entry points (view_call, fast_call, send_transaction,
+#       parse_events, and 'receipt', the time from send to receipt), labelled
+#       (chain, contract, method, operation)
+#   'rpc': JSON-RPC requests, labelled (chain, contract, method, rpc_method),
+#       where contract & method are those of the wrapper call that made the
+#       request. Requests made outside wrapper calls (e.g. by the receipt
+#       watcher) have blank contract & method labels
+#
+# `chain` is the chain id, or the RPC for requests made before it's known.
+#
+# Optionally, a profiler hook can be run around a sample of wrapper calls.
+# See set_profiler() and CProfileSampler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (chain, contract, method, operation or rpc_method)
+MetricKey = Tuple[str, str, str, str]
+
+FAMILIES = {
+    # family: (metric name prefix, last label, description)
+    'call': ('abi_wrapper_call', 'operation', 'wrapper calls'),
+    'rpc': ('abi_rpc_request', 'rpc_method', 'JSON-RPC requests'),
+}
+
+class _Series:
+    __slots__ = ('count', 'errors', 'total', 'buckets')
+
+    def __init__(self, bucket_count:int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        # Non-cumulative; the last is for values over every bound
+        self.buckets = [0] * (bucket_count + 1)
+
+class Metrics:
+    def __init__(self, buckets:Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        # (family, key): series
+        self.series: Dict[Tuple[str, MetricKey], _Series] = {}
+        self._lock = threading.Lock()
+
+    def record(self, family:str, key:MetricKey, seconds:float, error:bool = False) -> None:
+        bucket = bisect_left(self.bounds, seconds)
+        with self._lock:
+            series = self.series.get((family, key))
+            if series is None:
+                series = self.series[(family, key)] = _Series(len(self.bounds))
+            series.count += 1
+            series.total += seconds
+            series.buckets[bucket] += 1
+            if error:
+                series.errors += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.series.clear()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        # One dict per series, with cumulative bucket counts keyed by upper bound
+        with self._lock:
+            items = [(family, key, s.count, s.errors, s.total, list(s.buckets))
+                     for (family, key), s in self.series.items()]
+        out = []
+        for family, (chain, contract, method, last), count, errors, total, buckets in sorted(items):
+            cumulative = 0
+            bucket_counts = {}
+            for bound, n in zip(self.bounds + (float('inf'),), buckets):
+                cumulative += n
+                bucket_counts['+Inf' if bound == float('inf') else repr(bound)] = cumulative
+            out.append({
+                'family': family,
+                'chain': chain,
+                'contract': contract,
+                'method': method,
+                FAMILIES[family][1]: last,
+                'count': count,
+                'errors': errors,
+                'seconds': total,
+                'buckets': bucket_counts,
+            })
+        return out
+
+    def to_json(self, **json_kwargs:Any) -> str:
+        return json.dumps(self.snapshot(), **json_kwargs)
+
+    def to_prometheus(self) -> str:
+        # Prometheus text exposition format, e.g. for a /metrics endpoint
+        snapshot = self.snapshot()
+        lines = []
+        for family, (prefix, last_label, description) in FAMILIES.items():
+            series = [s for s in snapshot if s['family'] == family]
+            if not series:
+                continue
+            lines += [f'# HELP {prefix}s_total Count of {description}',
+                      f'# TYPE {prefix}s_total counter']
+            lines += [f'{prefix}s_total{{{_labels(s, last_label)}}} {s["count"]}' for s in series]
+            lines += [f'# HELP {prefix}_errors_total Count of {description} that failed',
+                      f'# TYPE {prefix}_errors_total counter']
+            lines += [f'{prefix}_errors_total{{{_labels(s, last_label)}}} {s["errors"]}' for s in series]
+            lines += [f'# HELP {prefix}_seconds Latency of {description}',
+                      f'# TYPE {prefix}_seconds histogram']
+            for s in series:
+                labels = _labels(s, last_label)
+                for bound, n in s['buckets'].items():
+                    lines.append(f'{prefix}_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'{prefix}_seconds_sum{{{labels}}} {s["seconds"]}')
+                lines.append(f'{prefix}_seconds_count{{{labels}}} {s["count"]}')
+        return '\n'.join(lines) + '\n'
+
+def _labels(series:Dict[str, Any], last_label:str) -> str:
+    def escape(value:str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(str(series[name]))}"' for name in ('chain', 'contract', 'method', last_label))
+
+METRICS: Metrics | None = None
+
+# Called as PROFILER(contract, method) around sampled wrapper calls; returns a context manager
+PROFILER: Callable[[str, str], ContextManager] | None = None
+PROFILE_SAMPLE_RATE = 0.01
+
+# (chain, contract, method) of the wrapper call in progress, if any
+CALL_CONTEXT: contextvars.ContextVar[Tuple[str, str, str] | None] = contextvars.ContextVar('abi_call_context', default=None)
+
+def enable_metrics(buckets:Sequence[float] = DEFAULT_BUCKETS) -> Metrics:
+    global METRICS
+    METRICS = Metrics(buckets)
+    return METRICS
+
+def disable_metrics() -> None:
+    global METRICS
+    METRICS = None
+
+def set_profiler(hook:Callable[[str, str], ContextManager] | None, sample_rate:float = PROFILE_SAMPLE_RATE) -> None:
+    # Run `hook(contract, method)` around `sample_rate` of wrapper calls. Pass
+    # None to stop. For async wrappers the hook also sees whatever else the
+    # event loop runs while the call is waiting
+    global PROFILER, PROFILE_SAMPLE_RATE
+    PROFILER = hook
+    PROFILE_SAMPLE_RATE = sample_rate
+
+class CProfileSampler:
+    # A profiler hook that profiles each sampled call with cProfile & merges
+    # the results:
+    #   sampler = CProfileSampler()
+    #   set_profiler(sampler, sample_rate=0.05)
+    #   ...
+    #   sampler.stats().sort_stats('cumulative').print_stats(20)
+    def __init__(self):
+        self._stats: Any = None
+        self._lock = threading.Lock()
+        self.samples = 0
+
+    def __call__(self, contract:str, method:str) -> ContextManager:
+        return _CProfileSample(self)
+
+    def add(self, profile:Any) -> None:
+        import pstats
+        with self._lock:
+            self.samples += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def stats(self) -> Any:
+        # A pstats.Stats, or None before the first sample
+        return self._stats
+
+class _CProfileSample:
+    def __init__(self, sampler:CProfileSampler):
+        import cProfile
+        self.sampler = sampler
+        self.profile = cProfile.Profile()
+        self.running = False
+
+    def __enter__(self):
+        try:
+            self.profile.enable()
+            self.running = True
+        except ValueError:
+            # Another profiler is already running in this thread
+            pass
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.running:
+            self.profile.disable()
+            self.sampler.add(self.profile)
+        return False
+
+def chain_label(rpc:str) -> str:
+    chain_id = CHAIN_IDS.get(rpc)
+    return rpc if chain_id is None else str(chain_id)
+
+def _wrapper_chain_label(wrapper:Any) -> str:
+    # Sync wrappers can look the chain id up on the spot. Async wrappers have
+    # it fetched by the async hook before this is called
+    from web3 import Web3
+    if wrapper.rpc not in CHAIN_IDS and isinstance(wrapper.w3, Web3):
+        chain_id_for_rpc(wrapper.w3, wrapper.rpc)
+    return chain_label(wrapper.rpc)
+
+def instrumented(operation:str, name_of:Callable[[Any], str] | None = None) -> Callable:
+    # Decorates a wrapper method (sync or async) to be timed & counted as
+    # `operation`. `name_of` gets the contract method's name from the first
+    # argument. Calls made inside another instrumented call, e.g. view_call()
+    # going through fast_call(), are counted only once
+    def decorate(func:Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_instrumented(self, *args, **kwargs):
+                if (METRICS is None and PROFILER is None) or CALL_CONTEXT.get() is not None:
+                    return await func(self, *args, **kwargs)
+                if self.rpc not in CHAIN_IDS:
+                    await self.get_chain_id()
+                context, token, start = _start(self, name_of, args)
+                error = False
+                try:
+                    if _sampled():
+                        with PROFILER(context[1], context[2]): # type: ignore
+                            return await func(self, *args, **kwargs)
+                    return await func(self, *args, **kwargs)
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    _finish(context, operation, token, start, error)
+            return async_instrumented
+
+        @functools.wraps(func)
+        def sync_instrumented(self, *args, **kwargs):
+            if (METRICS is None and PROFILER is None) or CALL_CONTEXT.get() is not None:
+                return func(self, *args, **kwargs)
+            context, token, start = _start(self, name_of, args)
+            error = False
+            try:
+                if _sampled():
+                    with PROFILER(context[1], context[2]): # type: ignore
+                        return func(self, *args, **kwargs)
+                return func(self, *args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                _finish(context, operation, token, start, error)
+        return sync_instrumented
+    return decorate
+
+def _sampled() -> bool:
+    return PROFILER is not None and random.random() < PROFILE_SAMPLE_RATE
+
+def _start(wrapper:Any, name_of:Callable[[Any], str] | None, args:Tuple) -> Tuple[Tuple[str, str, str], Any, float]:
+    method = name_of(args[0]) if (name_of and args) else ''
+    context = (_wrapper_chain_label(wrapper), type(wrapper).__name__, method)
+    return context, CALL_CONTEXT.set(context), time.perf_counter()
+
+def _finish(context:Tuple[str, str, str], operation:str, token:Any, start:float, error:bool) -> None:
+    CALL_CONTEXT.reset(token)
+    metrics = METRICS
+    if metrics is not None:
+        metrics.record('call', (*context, operation), time.perf_counter() - start, error)
+
+def track_receipt(pending_tx:Any) -> None:
+    # Record the time from now until `pending_tx` (a PendingTransaction)
+    # resolves, as the current wrapper call's 'receipt' operation
+    metrics = METRICS
+    context = CALL_CONTEXT.get()
+    if metrics is None or context is None:
+        return
+    start = time.perf_counter()
+    def record(future:Any) -> None:
+        metrics.record('call', (*context, 'receipt'), time.perf_counter() - start, future.exception() is not None)
+    pending_tx.add_done_callback(record)
+
+def _record_request(rpc:str, method:str, start:float, error:bool) -> None:
+    metrics = METRICS
+    if metrics is None:
+        return
+    context = CALL_CONTEXT.get()
+    if context is None:
+        context = (chain_label(rpc), '', '')
+    metrics.record('rpc', (*context, method), time.perf_counter() - start, error)
+
+def metrics_middleware(rpc:str) -> Callable:
+    # web3 middleware timing every request made through a Web3 instance for `rpc`
+    def middleware(make_request:Callable, w3:Any) -> Callable:
+        def timed_request(method:str, params:Any) -> Any:
+            if METRICS is None:
+                return make_request(method, params)
+            start = time.perf_counter()
+            try:
+                response = make_request(method, params)
+            except BaseException:
+                _record_request(rpc, method, start, True)
+                raise
+            _record_request(rpc, method, start, 'error' in response)
+            return response
+        return timed_request
+    return middleware
+
+def async_metrics_middleware(rpc:str) -> Callable:
+    async def middleware(make_request:Callable, w3:Any) -> Callable:
+        async def timed_request(method:str, params:Any) -> Any:
+            if METRICS is None:
+                return await make_request(method, params)
+            start = time.perf_counter()
+            try:
+                response = await make_request(method, params)
+            except BaseException:
+                _record_request(rpc, method, start, True)
+                raise
+            _record_request(rpc, method, start, 'error' in response)
+            return response
+        return timed_request
+    return middleware
@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+from concurrent.futures import Future
+
+from web3 import Web3
+
+from .solidity_types import ChecksumAddress, BlockIdentifier, HexStr
+from typing import Dict, List, Tuple, Any, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .abi_contract_wrapper import ABIContractWrapper
+
+# Multicall3 is deployed at the same address on most EVM chains.
+# See: https://github.com/mds1/multicall
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+# aggregate3((address target, bool allowFailure, bytes callData)[]) returns ((bool success, bytes returnData)[])
+AGGREGATE3_SELECTOR = '0x82ad56cb'
+AGGREGATE3_INPUT_TYPES = ('(address,bool,bytes)[]',)
+AGGREGATE3_OUTPUT_TYPES = ('(bool,bytes)[]',)
+
+# Calls per aggregate3 eth_call. Large enough to save lots of round trips, small
+# enough to stay under most providers' eth_call gas & response size limits
+DEFAULT_CHUNK_SIZE = 200
+
+class MulticallError(Exception):
+    # Set on the future of a single call that reverted inside a batch
+    def __init__(self, function_name:str, target:ChecksumAddress, return_data:bytes):
+        self.function_name = function_name
+        self.target = target
+        self.return_data = return_data
+        super().__init__(f'Call to {function_name} on {target} failed in multicall batch. Return data: {return_data!r}')
+
+class CallBatch:
+    '''
+    Collects view calls and runs them through Multicall3's aggregate3,
+    `chunk_size` calls per eth_call. Generated view methods accept a batch
+    and return a concurrent.futures.Future instead of a result:
+
+        with contracts.batch() as b:
+            futures = [contracts.hero_core.get_hero(h, batch=b) for h in hero_ids]
+        heroes = [f.result() for f in futures]
+
+    Calls run when the `with` block exits (or when execute() is called).
+    A call that reverts sets a MulticallError on its own future without
+    affecting the rest of the batch.
+    '''
+    def __init__(self,
+                 block_identifier:BlockIdentifier = 'latest',
+                 multicall_address:str = MULTICALL3_ADDRESS,
+                 chunk_size:int = DEFAULT_CHUNK_SIZE):
+        self.block_identifier = block_identifier
+        self.multicall_address = Web3.to_checksum_address(multicall_address)
+        self.chunk_size = chunk_size
+        # (wrapper, target address, function name, calldata, future)
+        self.calls: List[Tuple['ABIContractWrapper', ChecksumAddress, str, HexStr, Future]] = []
+
+    def __enter__(self) -> 'CallBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.execute()
+        else:
+            for *_, future in self.calls:
+                future.cancel()
+            self.calls = []
+
+    def __len__(self) -> int:
+        return len(self.calls)
+
+    def queue(self,
+              wrapper:'ABIContractWrapper',
+              function_name:str,
+              args:Sequence[Any],
+              contract_address:str | None = None) -> Future:
+        if contract_address is None:
+            target = wrapper.contract_address
+        else:
+            target = wrapper.w3.to_checksum_address(contract_address)
+        future: Future = Future()
+        self.calls.append((wrapper, target, function_name, wrapper.encode_call(function_name, args), future))
+        return future
+
+    def execute(self) -> None:
+        calls, self.calls = self.calls, []
+        # Wrappers on different RPCs (i.e., different chains) go to their own chain's Multicall3
+        calls_by_w3: Dict[int, List] = {}
+        for call in calls:
+            calls_by_w3.setdefault(id(call[0].w3), []).append(call)
+
+        for w3_calls in calls_by_w3.values():
+            w3 = w3_calls[0][0].w3
+            block_identifier = self.block_identifier
+            # Pin 'latest' to one block so every chunk sees the same state
+            if block_identifier == 'latest' and len(w3_calls) > self.chunk_size:
+                block_identifier = w3.eth.block_number
+            for i in range(0, len(w3_calls), self.chunk_size):
+                self._execute_chunk(w3, w3_calls[i:i + self.chunk_size], block_identifier)
+
+    def _execute_chunk(self, w3:Web3, chunk:Sequence, block_identifier:BlockIdentifier) -> None:
+        call_structs = [(target, True, bytes.fromhex(calldata[2:])) for _, target, _, calldata, _ in chunk]
+        data = AGGREGATE3_SELECTOR + w3.codec.encode(AGGREGATE3_INPUT_TYPES, [call_structs]).hex()
+        try:
+            return_data = w3.eth.call({'to': self.multicall_address, 'data': HexStr(data)}, block_identifier) # type: ignore
+            (results,) = w3.codec.decode(AGGREGATE3_OUTPUT_TYPES, return_data)
+        except Exception as e:
+            # The whole chunk failed (e.g. provider gas limits); report it on each call
+            for *_, future in chunk:
+                future.set_exception(e)
+            return
+
+        for (wrapper, target, function_name, _, future), (success, call_return) in zip(chunk, results):
+            if not success:
+                future.set_exception(MulticallError(function_name, target, call_return))
+                continue
+            try:
+                future.set_result(wrapper.decode_output(function_name, call_return))
+            except Exception as e:
+                future.set_exception(e)
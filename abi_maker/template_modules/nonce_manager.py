@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+import threading
+
+from typing import TYPE_CHECKING, Dict, Tuple
+
+if TYPE_CHECKING:
+    from eth_typing.evm import ChecksumAddress
+    from web3 import Web3
+
+# Nonces are handed out locally, per (chain id, address), for every wrapper in
+# the process. Only the first transaction from an address costs an
+# eth_getTransactionCount; after that, sequential nonces come from here, so
+# many transactions from one account can be sent back-to-back without waiting
+# for receipts.
+#
+# The count is refetched from the node only when it stops agreeing with us:
+# a 'nonce too low/too high' error, a transaction that was never sent, or
+# one that may have been dropped (no receipt before the timeout).
+
+# Substrings of node errors that mean our nonce for an address is out of date
+NONCE_ERRORS = (
+    'nonce too low',
+    'nonce too high',
+    'nonce is too low',
+    'replacement transaction underpriced',
+    'invalid nonce',
+    'invalid transaction nonce',
+    'oldnonce',
+)
+
+# rpc: chain id. Different RPCs for the same chain share nonces
+CHAIN_IDS: Dict[str, int] = {}
+
+def is_nonce_error(e:Exception) -> bool:
+    message = str(e).lower()
+    return any(n in message for n in NONCE_ERRORS)
+
+def chain_id_for_rpc(w3:'Web3', rpc:str) -> int:
+    chain_id = CHAIN_IDS.get(rpc)
+    if chain_id is None:
+        chain_id = w3.eth.chain_id
+        CHAIN_IDS[rpc] = chain_id
+    return chain_id
+
+class NonceManager:
+    def __init__(self):
+        # (chain_id, address): next nonce to hand out, or None if it must be refetched
+        self.next_nonces: Dict[Tuple[int, str], int | None] = {}
+        self._lock = threading.Lock()
+
+    def needs_fetch(self, chain_id:int, address:'ChecksumAddress') -> bool:
+        return self.next_nonces.get((chain_id, address)) is None
+
+    def take(self, chain_id:int, address:'ChecksumAddress', fetched_nonce:int | None = None) -> int:
+        # Return the next nonce for `address` and advance past it. If we have no
+        # nonce for it (see needs_fetch()), use `fetched_nonce`, the node's
+        # 'pending' transaction count. Fetching happens outside the lock, so
+        # two threads may both fetch; only the first result is used.
+        nonce = self.try_take(chain_id, address, fetched_nonce)
+        if nonce is None:
+            raise ValueError(f'No nonce known for {address} on chain {chain_id}; fetch one first')
+        return nonce
+
+    def try_take(self, chain_id:int, address:'ChecksumAddress', fetched_nonce:int | None = None) -> int | None:
+        # take(), but returns None if there's no nonce for `address` & no
+        # `fetched_nonce`. That happens when a resync() lands between 
+        # needs_fetch() & this; the caller should fetch and try again
+        key = (chain_id, address)
+        with self._lock:
+            nonce = self.next_nonces.get(key)
+            if nonce is None:
+                if fetched_nonce is None:
+                    return None
+                nonce = fetched_nonce
+            self.next_nonces[key] = nonce + 1
+            return nonce
+
+    def release(self, chain_id:int, address:'ChecksumAddress', nonce:int) -> None:
+        # Call when a transaction with a nonce from take() was never sent.
+        # If nothing was handed out after it, just step back. Otherwise later
+        # transactions are waiting on this nonce, so let the node tell us where
+        # things stand.
+        key = (chain_id, address)
+        with self._lock:
+            if self.next_nonces.get(key) == nonce + 1:
+                self.next_nonces[key] = nonce
+            else:
+                self.next_nonces[key] = None
+
+    def resync(self, chain_id:int, address:'ChecksumAddress') -> None:
+        # Forget our nonce for `address`; the next take() uses a fresh fetch
+        with self._lock:
+            self.next_nonces[(chain_id, address)] = None
+
+    def next_nonce(self, w3:'Web3', chain_id:int, address:'ChecksumAddress') -> int:
+        # take(), fetching the pending transaction count from `w3` if needed.
+        # If another thread resyncs the address in between, fetch again
+        while True:
+            fetched = None
+            if self.needs_fetch(chain_id, address):
+                fetched = w3.eth.get_transaction_count(address, 'pending')
+            nonce = self.try_take(chain_id, address, fetched)
+            if nonce is not None:
+                return nonce
+
+    def clear(self) -> None:
+        with self._lock:
+            self.next_nonces.clear()
+
+NONCE_MANAGER = NonceManager()
@@ -0,0 +1,421 @@
+#! /usr/bin/env python
+import asyncio
+import atexit
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3, AsyncWeb3, HTTPProvider, AsyncHTTPProvider
+from web3.middleware.geth_poa import geth_poa_middleware, async_geth_poa_middleware
+from web3.types import RPCEndpoint, RPCResponse
+
+from .metrics import metrics_middleware, async_metrics_middleware
+from .rate_limiter import (RateLimiter, RATE_LIMIT_RETRIES, PRIORITY_NORMAL,
+                           priority_for_method, parse_retry_after, is_rate_limit_response)
+
+from typing import AsyncIterator, Dict, List, Tuple, Any, Sequence
+
+# One Web3 (and one AsyncWeb3) instance per RPC, shared by every wrapper in
+# the process. Each sync provider posts through a single requests.Session
+# whose connection pool is bounded, so socket counts & TLS handshakes stay
+# flat no matter how many threads make calls.
+#
+# Settings for an RPC can be changed with configure_rpc(), before the first
+# wrapper for that RPC is created, or after close_rpc().
+#
+# Requests to each RPC URL also go through a RateLimiter shared by the sync &
+# async providers for it. It's unlimited unless configured, but always backs
+# off when the server returns rate limit errors. See rate_limiter.py
+#
+# Wrappers can also be given a list of RPC URLs for a chain, which are then
+# used with failover (see failover_provider.py). A list is stored under one
+# key, its URLs joined with spaces, which stands in for a single RPC URL
+# everywhere else (nonces, receipt watchers, fee oracles etc.)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_REQUEST_TIMEOUT = 30
+
+# rpc: Web3
+W3_INSTANCES: Dict[str, Web3] = {}
+# rpc: AsyncWeb3
+ASYNC_W3_INSTANCES: Dict[str, AsyncWeb3] = {}
+# rpc: settings passed to configure_rpc()
+RPC_CONFIGS: Dict[str, Dict[str, Any]] = {}
+# rpc key: URLs in the group
+RPC_GROUPS: Dict[str, List[str]] = {}
+# rpc key: settings passed to configure_failover()
+FAILOVER_CONFIGS: Dict[str, Dict[str, Any]] = {}
+# rpc: RateLimiter
+RATE_LIMITERS: Dict[str, RateLimiter] = {}
+
+_LOCK = threading.Lock()
+_LIMITER_LOCK = threading.Lock()
+
+def configure_rpc(rpc:str,
+                  pool_size:int = DEFAULT_POOL_SIZE,
+                  timeout:float = DEFAULT_REQUEST_TIMEOUT,
+                  headers:Dict[str, str] | None = None,
+                  block_when_pool_full:bool = True,
+                  batch_requests:bool = False,
+                  max_requests_per_second:float | None = None,
+                  max_in_flight:int | None = None,
+                  **batch_kwargs:Any) -> None:
+    # pool_size: maximum keep-alive connections to this RPC. With
+    #   block_when_pool_full, threads wait for a free connection rather than
+    #   opening (and then throwing away) extra ones
+    # headers: added to every request, e.g. API keys
+    # batch_requests: coalesce concurrent requests into JSON-RPC batches.
+    #   `batch_kwargs` (max_batch_size, flush_interval) go to BatchingHTTPProvider
+    # max_requests_per_second, max_in_flight: client-side limits. These can 
+    #   also be changed later with set_rate_limit()
+    with _LOCK:
+        if rpc in W3_INSTANCES or rpc in ASYNC_W3_INSTANCES:
+            raise ValueError(f'RPC {rpc} is already in use. Call configure_rpc() before creating any wrappers for it')
+        RPC_CONFIGS[rpc] = {
+            'pool_size': pool_size,
+            'timeout': timeout,
+            'headers': headers or {},
+            'block_when_pool_full': block_when_pool_full,
+            'batch_requests': batch_requests,
+            'batch_kwargs': batch_kwargs,
+        }
+        if max_requests_per_second is not None or max_in_flight is not None:
+            set_rate_limit(rpc, max_requests_per_second, max_in_flight)
+
+def limiter_for_rpc(rpc:str) -> RateLimiter:
+    limiter = RATE_LIMITERS.get(rpc)
+    if limiter is None:
+        with _LIMITER_LOCK:
+            limiter = RATE_LIMITERS.setdefault(rpc, RateLimiter())
+    return limiter
+
+def set_rate_limit(rpc:str, 
+                   max_requests_per_second:float | None = None, 
+                   max_in_flight:int | None = None,
+                   burst:float | None = None) -> RateLimiter:
+    # Limits for one RPC URL, shared by every wrapper using it. May be called
+    # at any time; None means unlimited
+    limiter = limiter_for_rpc(rpc)
+    limiter.configure(max_requests_per_second, max_in_flight, burst)
+    return limiter
+
+def rpc_key(rpc:str | Sequence[str]) -> str:
+    # The key wrappers use for `rpc`: a URL as is, or a registered key for a
+    # list of URLs
+    if isinstance(rpc, str):
+        return rpc
+    urls = list(dict.fromkeys(rpc))
+    if len(urls) == 1:
+        return urls[0]
+    key = ' '.join(urls)
+    if key not in RPC_GROUPS:
+        with _LOCK:
+            RPC_GROUPS.setdefault(key, urls)
+    return key
+
+def configure_failover(rpcs:Sequence[str], 
+                       hedged_reads:bool = False, 
+                       max_attempts:int | None = None) -> str:
+    # Settings for a list of RPC URLs used together; returns its key. 
+    # hedged_reads: send slow reads to a second endpoint too. See failover_provider.py
+    # max_attempts: endpoints to try for a read before giving up
+    # Each URL's own settings still come from configure_rpc()
+    key = rpc_key(rpcs)
+    if key not in RPC_GROUPS:
+        raise ValueError(f'Failover needs at least 2 RPC URLs, got {rpcs}')
+    with _LOCK:
+        if key in W3_INSTANCES or key in ASYNC_W3_INSTANCES:
+            raise ValueError(f'RPCs {rpcs} are already in use. Call configure_failover() before creating any wrappers for them')
+        FAILOVER_CONFIGS[key] = {'hedged_reads': hedged_reads}
+        if max_attempts is not None:
+            FAILOVER_CONFIGS[key]['max_attempts'] = max_attempts
+    return key
+
+def close_rpc(rpc:str) -> None:
+    # Drop the Web3 instances for `rpc` (a URL or failover key) and close the
+    # sync one's connections & threads, so the RPC can be configured again.
+    # Wrappers already created for it should be created again too. Async
+    # sessions close with their event loops; see close_async_sessions()
+    with _LOCK:
+        w3 = W3_INSTANCES.pop(rpc, None)
+        ASYNC_W3_INSTANCES.pop(rpc, None)
+    close = getattr(w3.provider, 'close', None) if w3 is not None else None
+    if close is not None:
+        close()
+
+def rpc_config(rpc:str) -> Dict[str, Any]:
+    return RPC_CONFIGS.get(rpc) or {
+        'pool_size': DEFAULT_POOL_SIZE,
+        'timeout': DEFAULT_REQUEST_TIMEOUT,
+        'headers': {},
+        'block_when_pool_full': True,
+        'batch_requests': False,
+        'batch_kwargs': {},
+    }
+
+def get_w3(rpc:str) -> Web3:
+    w3 = W3_INSTANCES.get(rpc)
+    if w3 is None:
+        with _LOCK:
+            w3 = W3_INSTANCES.get(rpc)
+            if w3 is None:
+                w3 = Web3(make_provider(rpc))
+                w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+                # Innermost, so only time on the wire is measured. See metrics.py
+                w3.middleware_onion.inject(metrics_middleware(rpc), name='abi_metrics', layer=0)
+                W3_INSTANCES[rpc] = w3
+    return w3
+
+def get_async_w3(rpc:str) -> AsyncWeb3:
+    w3 = ASYNC_W3_INSTANCES.get(rpc)
+    if w3 is None:
+        with _LOCK:
+            w3 = ASYNC_W3_INSTANCES.get(rpc)
+            if w3 is None:
+                w3 = AsyncWeb3(make_async_provider(rpc))
+                w3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+                w3.middleware_onion.inject(async_metrics_middleware(rpc), name='abi_metrics', layer=0)
+                ASYNC_W3_INSTANCES[rpc] = w3
+    return w3
+
+def make_provider(rpc:str) -> Any:
+    if rpc in RPC_GROUPS:
+        from .failover_provider import FailoverHTTPProvider
+        return FailoverHTTPProvider(RPC_GROUPS[rpc], make_provider, **FAILOVER_CONFIGS.get(rpc, {}))
+    config = rpc_config(rpc)
+    pool_kwargs = {k: config[k] for k in ('pool_size', 'timeout', 'headers', 'block_when_pool_full')}
+    if config['batch_requests']:
+        # Imported here because batching_provider builds on PooledHTTPProvider
+        from .batching_provider import BatchingHTTPProvider
+        return BatchingHTTPProvider(rpc, **pool_kwargs, **config['batch_kwargs'])
+    return PooledHTTPProvider(rpc, **pool_kwargs)
+
+def make_async_provider(rpc:str) -> Any:
+    if rpc in RPC_GROUPS:
+        from .failover_provider import AsyncFailoverHTTPProvider
+        return AsyncFailoverHTTPProvider(RPC_GROUPS[rpc], make_async_provider, **FAILOVER_CONFIGS.get(rpc, {}))
+    config = rpc_config(rpc)
+    return PooledAsyncHTTPProvider(rpc, config['pool_size'], config['timeout'], config['headers'])
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    # url: {'requests', 'errors', 'pool_size', 'connections_opened', 'idle_connections', 
+    #       'rate_limiter', 'async'}
+    # 'async' is there if the URL has an async provider too: its 
+    # {'requests', 'errors', 'pool_size', 'sessions', 'active_connections', 'idle_connections'}
+    stats: Dict[str, Dict[str, Any]] = {}
+    for provider in _pooled_providers(W3_INSTANCES):
+        stats[provider.endpoint_uri] = provider.stats()
+    for provider in _pooled_providers(ASYNC_W3_INSTANCES):
+        stats.setdefault(provider.endpoint_uri, {})['async'] = provider.stats()
+    return stats
+
+def _pooled_providers(instances:Dict[str, Any]) -> List[Any]:
+    # Failover groups have a provider for each of their endpoints
+    providers = []
+    for w3 in list(instances.values()):
+        for provider in getattr(w3.provider, 'providers', [w3.provider]):
+            if isinstance(provider, (PooledHTTPProvider, PooledAsyncHTTPProvider)):
+                providers.append(provider)
+    return providers
+
+async def close_async_sessions() -> None:
+    # Close every async provider's session for the running event loop. 
+    # Sessions are closed anyway when their loop shuts down (see 
+    # PooledAsyncHTTPProvider), so this is only needed to let go of 
+    # connections sooner, or for loops that aren't shut down properly
+    for provider in _pooled_providers(ASYNC_W3_INSTANCES):
+        await provider.close()
+
+@atexit.register
+def _close_sessions_at_exit() -> None:
+    for provider in _pooled_providers(ASYNC_W3_INSTANCES):
+        provider.close_idle_loops()
+
+class PooledHTTPProvider(HTTPProvider):
+    # web3's HTTPProvider keeps a requests.Session per thread, with default
+    # pool settings. This one posts every request, from every thread, through
+    # one session with a bounded connection pool
+    def __init__(self,
+                 endpoint_uri:str,
+                 pool_size:int = DEFAULT_POOL_SIZE,
+                 timeout:float = DEFAULT_REQUEST_TIMEOUT,
+                 headers:Dict[str, str] | None = None,
+                 block_when_pool_full:bool = True):
+        super().__init__(endpoint_uri, request_kwargs={'timeout': timeout})
+        self.pool_size = pool_size
+        self.extra_headers = headers or {}
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=block_when_pool_full)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._adapter = adapter
+        self._stats_lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.limiter = limiter_for_rpc(endpoint_uri)
+
+    def get_request_headers(self) -> Dict[str, str]:
+        headers = super().get_request_headers()
+        headers.update(self.extra_headers)
+        return headers
+
+    def close(self) -> None:
+        self.session.close()
+
+    def post(self, request_data:bytes, priority:int = PRIORITY_NORMAL, cost:int = 1) -> bytes:
+        return self._post(request_data, priority, cost)[0]
+
+    def _post(self, request_data:bytes, priority:int, cost:int) -> Tuple[bytes, float]:
+        # Returns the response body & when the rate limiter let the request
+        # through. `cost`: requests in the body, for the rate limiter. HTTP 429s
+        # are retried once the limiter lets us, up to RATE_LIMIT_RETRIES times
+        retries = RATE_LIMIT_RETRIES
+        while True:
+            with self._stats_lock:
+                self.request_count += 1
+            sent_at = self.limiter.acquire(priority, cost)
+            try:
+                response = self.session.post(self.endpoint_uri, data=request_data, **self.get_request_kwargs()) # type: ignore
+                if response.status_code == 429:
+                    self.limiter.rate_limited(parse_retry_after(response.headers.get('Retry-After')), sent_at)
+                    if retries > 0:
+                        retries -= 1
+                        continue
+                response.raise_for_status()
+            except Exception:
+                with self._stats_lock:
+                    self.error_count += 1
+                raise
+            finally:
+                self.limiter.release()
+            return response.content, sent_at
+
+    def make_request(self, method:RPCEndpoint, params:Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+        priority = priority_for_method(method)
+        retries = RATE_LIMIT_RETRIES
+        while True:
+            raw_response, sent_at = self._post(request_data, priority, 1)
+            response = self.decode_rpc_response(raw_response)
+            if retries == 0 or not is_rate_limit_response(response):
+                return response
+            self.limiter.rate_limited(None, sent_at)
+            retries -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        pools = self._adapter.poolmanager.pools
+        pools = [pools[key] for key in pools.keys()]
+        return {
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'pool_size': self.pool_size,
+            'connections_opened': sum(p.num_connections for p in pools),
+            'idle_connections': sum(p.pool.qsize() for p in pools if p.pool is not None),
+            'rate_limiter': self.limiter.stats(),
+        }
+
+async def _close_at_loop_shutdown(session:Any) -> AsyncIterator[None]:
+    # Parked on a session's event loop until the loop shuts down. asyncio.run()
+    # (like anything calling loop.shutdown_asyncgens()) closes unfinished 
+    # async generators while the loop can still run, which closes the session
+    try:
+        yield
+    finally:
+        await session.close()
+
+class PooledAsyncHTTPProvider(AsyncHTTPProvider):
+    # Async counterpart of PooledHTTPProvider. aiohttp sessions belong to an
+    # event loop, so we keep one per loop, each limited to `pool_size` 
+    # connections. A session is closed when its loop shuts down, or by close()
+    def __init__(self,
+                 endpoint_uri:str,
+                 pool_size:int = DEFAULT_POOL_SIZE,
+                 timeout:float = DEFAULT_REQUEST_TIMEOUT,
+                 headers:Dict[str, str] | None = None):
+        super().__init__(endpoint_uri)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.extra_headers = headers or {}
+        # loop: (session, generator that closes it when the loop shuts down)
+        self._sessions: Dict[asyncio.AbstractEventLoop, Tuple[Any, AsyncIterator[None]]] = {}
+        self.request_count = 0
+        self.error_count = 0
+        self.limiter = limiter_for_rpc(endpoint_uri)
+
+    def get_request_headers(self) -> Dict[str, str]:
+        headers = super().get_request_headers()
+        headers.update(self.extra_headers)
+        return headers
+
+    async def _session(self) -> Any:
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        entry = self._sessions.get(loop)
+        if entry is not None and not entry[0].closed:
+            return entry[0]
+        # Sessions on loops that have since closed were closed with them
+        for old_loop in [l for l in list(self._sessions) if l.is_closed()]:
+            self._sessions.pop(old_loop, None)
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                        timeout=aiohttp.ClientTimeout(total=self.timeout))
+        closer = _close_at_loop_shutdown(session)
+        self._sessions[loop] = (session, closer)
+        # Runs to the yield; the loop keeps track of the generator from here
+        await closer.__anext__()
+        return session
+
+    async def close(self) -> None:
+        # Close the running loop's session, if there is one
+        entry = self._sessions.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+    def close_idle_loops(self) -> None:
+        # Close sessions on loops that stopped without being shut down (e.g. 
+        # run_until_complete() without shutdown_asyncgens()). Not for running loops
+        for loop, (session, closer) in list(self._sessions.items()):
+            if not loop.is_closed() and not loop.is_running() and not session.closed:
+                loop.run_until_complete(closer.aclose())
+            self._sessions.pop(loop, None)
+
+    async def make_request(self, method:RPCEndpoint, params:Any) -> RPCResponse:
+        request_data = self.encode_rpc_request(method, params)
+        priority = priority_for_method(method)
+        retries = RATE_LIMIT_RETRIES
+        while True:
+            self.request_count += 1
+            sent_at = await self.limiter.acquire_async(priority)
+            try:
+                session = await self._session()
+                async with session.post(self.endpoint_uri, data=request_data,
+                                        headers=self.get_request_headers()) as response:
+                    if response.status == 429:
+                        self.limiter.rate_limited(parse_retry_after(response.headers.get('Retry-After')), sent_at)
+                        if retries > 0:
+                            retries -= 1
+                            continue
+                    response.raise_for_status()
+                    raw_response = await response.read()
+            except Exception:
+                self.error_count += 1
+                raise
+            finally:
+                self.limiter.release()
+            decoded = self.decode_rpc_response(raw_response)
+            if retries == 0 or not is_rate_limit_response(decoded):
+                return decoded
+            self.limiter.rate_limited(None, sent_at)
+            retries -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = [session for session, _ in list(self._sessions.values()) if not session.closed]
+        connectors = [session.connector for session in sessions]
+        return {
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'pool_size': self.pool_size,
+            'sessions': len(sessions),
+            'active_connections': sum(len(c._acquired) for c in connectors),
+            'idle_connections': sum(len(conns) for c in connectors for conns in c._conns.values()),
+            'rate_limiter': self.limiter.stats(),
+        }
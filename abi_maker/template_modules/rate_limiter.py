@@ -0,0 +1,278 @@
+#! /usr/bin/env python
+import asyncio
+from email.utils import parsedate_to_datetime
+import heapq
+import itertools
+import threading
+import time
+
+from typing import Any, Dict, List
+
+# Client-side throttling for one RPC endpoint, shared by every wrapper (sync
+# and async) that uses it. See provider_registry.limiter_for_rpc().
+#
+# A request waits for:
+#   - a token from a bucket refilled at `rate` requests/sec, holding up to
+#     `burst` tokens (a JSON-RPC batch costs one token per request in it)
+#   - a free slot, if in-flight requests are capped at `max_in_flight`
+# Waiting requests are served by priority, then in arrival order, so
+# transaction sends & nonce fetches go ahead of bulk view reads.
+#
+# When the server says we're going too fast (HTTP 429, or a JSON-RPC
+# rate-limit error) everything pauses for its Retry-After (or
+# DEFAULT_PAUSE) and the rate is halved. The rate then climbs back by
+# RECOVERY_PER_SECOND of the configured rate each second. An endpoint with
+# no configured rate starts unlimited; its first rate limit error sets a
+# rate of half what we were sending, which is lifted again after
+# UNLIMITED_AFTER quiet seconds.
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+METHOD_PRIORITIES: Dict[str, int] = {
+    'eth_sendRawTransaction': PRIORITY_HIGH,
+    'eth_sendTransaction': PRIORITY_HIGH,
+    'eth_getTransactionCount': PRIORITY_HIGH,
+    'eth_call': PRIORITY_BULK,
+    'eth_getLogs': PRIORITY_BULK,
+    'eth_getBalance': PRIORITY_BULK,
+    'eth_getCode': PRIORITY_BULK,
+    'eth_getStorageAt': PRIORITY_BULK,
+}
+
+# Substrings of JSON-RPC errors that mean "slow down"
+RATE_LIMIT_ERRORS = (
+    'rate limit',
+    'too many requests',
+    'exceeded the quota',
+    'request limit',
+    'capacity exceeded',
+)
+
+# Times a request that was rate limited is re-queued before giving up
+RATE_LIMIT_RETRIES = 3
+# Seconds to pause after a rate limit error with no Retry-After
+DEFAULT_PAUSE = 1.0
+MAX_PAUSE = 60.0
+BACKOFF_FACTOR = 0.5
+RECOVERY_PER_SECOND = 0.05
+MIN_RATE = 1.0
+UNLIMITED_AFTER = 60.0
+# Seconds between checks by an async request waiting for a free slot or its turn
+ASYNC_POLL_INTERVAL = 0.01
+
+def priority_for_method(method:str) -> int:
+    return METHOD_PRIORITIES.get(method, PRIORITY_NORMAL)
+
+def parse_retry_after(value:str | None) -> float | None:
+    # Retry-After is either seconds or an HTTP date
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_rate_limit_response(response:Any) -> bool:
+    if not isinstance(response, dict):
+        return False
+    error = response.get('error')
+    if not error:
+        return False
+    if isinstance(error, dict):
+        if error.get('code') == 429:
+            return True
+        error = error.get('message', '')
+    message = str(error).lower()
+    return any(e in message for e in RATE_LIMIT_ERRORS)
+
+class RateLimiter:
+    def __init__(self,
+                 max_requests_per_second:float | None = None,
+                 max_in_flight:int | None = None,
+                 burst:float | None = None):
+        # burst: tokens the bucket holds, i.e. requests that can go at once
+        #   after a quiet spell. Defaults to one second's worth
+        self.max_rate = max_requests_per_second
+        self.rate = max_requests_per_second
+        self.max_in_flight = max_in_flight
+        self.burst = burst
+        self.tokens = self._capacity()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_limited = 0.0
+        self._last_refill = time.monotonic()
+        # Waiting requests: [priority, arrival, cancelled, time let through]
+        self._waiting: List[List[Any]] = []
+        self._arrivals = itertools.count()
+        self._cond = threading.Condition(threading.Lock())
+        # Requests started in the current & previous second, to estimate our
+        # rate when we've no configured one
+        self._window_start = self._last_refill
+        self._window_count = 0
+        self._last_window_count = 0
+        self.requests = 0
+        self.waits = 0
+        self.rate_limit_errors = 0
+
+    def configure(self, max_requests_per_second:float | None = None, max_in_flight:int | None = None, burst:float | None = None) -> None:
+        with self._cond:
+            self.max_rate = self.rate = max_requests_per_second
+            self.max_in_flight = max_in_flight
+            self.burst = burst
+            self.tokens = min(self.tokens, self._capacity())
+            self._cond.notify_all()
+
+    def _capacity(self) -> float:
+        if self.rate is None:
+            return float('inf')
+        return max(1.0, self.burst if self.burst is not None else self.rate)
+
+    def _refill(self, now:float) -> None:
+        # Call with the lock held
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if now - self._window_start >= 1:
+            self._last_window_count = self._window_count if now - self._window_start < 2 else 0
+            self._window_count = 0
+            self._window_start = now
+        if self.rate is None:
+            return
+        quiet = now - self.last_limited
+        if self.max_rate is None:
+            if quiet > UNLIMITED_AFTER:
+                self.rate = None
+                self.tokens = float('inf')
+                return
+            # Like a configured rate, it doesn't recover while we're paused
+            if now >= self.paused_until:
+                self.rate += self.rate * RECOVERY_PER_SECOND * elapsed
+        elif self.rate < self.max_rate and now >= self.paused_until:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_PER_SECOND * elapsed)
+        self.tokens = min(self._capacity(), self.tokens + elapsed * self.rate)
+
+    def _recent_rate(self, now:float) -> float:
+        # Requests/sec let through over the last second or two. Call with the lock held
+        elapsed = now - self._window_start
+        if self._last_window_count and elapsed < 1:
+            return (self._window_count + self._last_window_count) / (1 + elapsed)
+        return self._window_count / max(elapsed, 0.1)
+
+    def _try_take(self, entry:List[Any], cost:float, now:float) -> float:
+        # Call with the lock held. Take a token & slot for `entry` if it's first
+        # in line and they're available, and return 0. Otherwise return seconds
+        # until it's worth checking again (-1 for "when something's released")
+        while self._waiting and self._waiting[0][2]:
+            heapq.heappop(self._waiting)
+        if self._waiting and self._waiting[0] is not entry:
+            return -1
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return -1
+        self._refill(now)
+        # A batch bigger than the bucket waits for a full bucket
+        needed = min(cost, self._capacity())
+        if self.tokens < needed:
+            return (needed - self.tokens) / self.rate # type: ignore
+        self.tokens -= cost
+        self.in_flight += 1
+        entry[3] = now
+        self.requests += 1
+        self._window_count += cost
+        heapq.heappop(self._waiting)
+        return 0
+
+    def _enqueue(self, priority:int) -> List[Any]:
+        entry = [priority, next(self._arrivals), False, 0.0]
+        heapq.heappush(self._waiting, entry)
+        return entry
+
+    def acquire(self, priority:int = PRIORITY_NORMAL, cost:float = 1) -> float:
+        # Block until a request may be sent. Call release() when it's done.
+        # Returns the time it was let through, for rate_limited()
+        with self._cond:
+            entry = self._enqueue(priority)
+            wait = self._try_take(entry, cost, time.monotonic())
+            if wait:
+                self.waits += 1
+            try:
+                while wait:
+                    self._cond.wait(None if wait < 0 else wait)
+                    wait = self._try_take(entry, cost, time.monotonic())
+            except BaseException:
+                # e.g. KeyboardInterrupt. Leave the queue so we don't hold up those behind us
+                entry[2] = True
+                self._cond.notify_all()
+                raise
+            # The next in line may be able to go too
+            self._cond.notify_all()
+            return entry[3]
+
+    async def acquire_async(self, priority:int = PRIORITY_NORMAL, cost:float = 1) -> float:
+        # acquire() for coroutines, which can't block on the condition. Waits
+        # in the same queue, so sync & async requests keep their order
+        with self._cond:
+            entry = self._enqueue(priority)
+            wait = self._try_take(entry, cost, time.monotonic())
+            if wait:
+                self.waits += 1
+        try:
+            while wait:
+                # A known wait (for tokens, or a pause) is slept through. Waits on
+                # a slot or our turn in line end with a release(), which can't 
+                # wake a coroutine, so those poll
+                await asyncio.sleep(ASYNC_POLL_INTERVAL if wait < 0 else wait)
+                with self._cond:
+                    wait = self._try_take(entry, cost, time.monotonic())
+        except BaseException:
+            with self._cond:
+                entry[2] = True
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._cond.notify_all()
+            return entry[3]
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def rate_limited(self, retry_after:float | None = None, sent_at:float | None = None) -> None:
+        # The server rejected a request for going too fast. `sent_at` is the 
+        # time acquire() returned for it. A burst usually gets several of
+        # these; only the first slows us down. Requests sent before that one
+        # was answered were part of the same burst, so they're ignored
+        now = time.monotonic()
+        with self._cond:
+            self.rate_limit_errors += 1
+            if sent_at is not None and sent_at < self.last_limited:
+                return
+            pause = min(retry_after if retry_after is not None else DEFAULT_PAUSE, MAX_PAUSE)
+            if self.rate is None:
+                self.rate = max(MIN_RATE, self._recent_rate(now) * BACKOFF_FACTOR)
+            else:
+                self.rate = max(MIN_RATE, self.rate * BACKOFF_FACTOR)
+            self.tokens = 0.0
+            self.last_limited = now
+            self.paused_until = max(self.paused_until, now + pause)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'rate': self.rate,
+            'max_rate': self.max_rate,
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'waiting': sum(1 for e in self._waiting if not e[2]),
+            'requests': self.requests,
+            'waits': self.waits,
+            'rate_limit_errors': self.rate_limit_errors,
+            'paused_for': max(0.0, self.paused_until - time.monotonic()),
+        }
@@ -0,0 +1,233 @@
+#! /usr/bin/env python
+from collections import OrderedDict
+from concurrent.futures import Future
+import threading
+import time
+
+from web3 import Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from . import provider_registry, view_cache
+from .nonce_manager import NONCE_MANAGER, chain_id_for_rpc
+from .solidity_types import ChecksumAddress, HexBytes, TxReceipt
+from typing import Dict, List, Set, Tuple
+
+# One background thread per RPC tracks every transaction sent without waiting
+# for its receipt. Instead of each transaction polling for its own receipt, the
+# watcher checks the block number every `poll_interval` seconds and, for each
+# new block, fetches the block once and looks for all pending transactions in
+# it. Receipts are only requested for transactions that were actually mined.
+#
+# With fewer than FULL_SCAN_MIN_PENDING transactions pending (e.g. one
+# send_transaction() waiting on its receipt), a full block costs more than 
+# asking for each receipt, so the watcher asks for those instead, plus each 
+# sender's mined nonce to spot replacements.
+#
+# The thread exits when nothing is pending. The first watch() after that
+# starts again from the head, since blocks mined while nothing was pending 
+# can't hold anything sent since
+
+# Seconds between eth_blockNumber checks
+DEFAULT_POLL_INTERVAL = 1
+# If the watcher falls further behind than this, it asks for each pending
+# receipt directly rather than fetching every block it missed
+MAX_BLOCKS_PER_POLL = 20
+# Transactions in this many recently scanned blocks are remembered, in case
+# one is watched after the block it was mined in has been scanned
+RECENT_BLOCKS = 32
+# Below this many pending transactions, look up receipts rather than fetch blocks
+FULL_SCAN_MIN_PENDING = 4
+
+class TransactionReplaced(Exception):
+    # Another transaction with the same sender & nonce was mined instead. 
+    # replacement_hash is None if it was found by nonce rather than in a block scan
+    def __init__(self, tx_hash:HexBytes, replacement_hash:HexBytes | None):
+        self.tx_hash = tx_hash
+        self.replacement_hash = replacement_hash
+        replacement = replacement_hash.hex() if replacement_hash is not None else 'another transaction with its nonce'
+        super().__init__(f'Transaction {tx_hash.hex()} was replaced by {replacement}')
+
+class PendingTransaction(Future):
+    '''
+    A concurrent.futures.Future for a sent transaction. `result()` blocks until
+    the transaction is mined and returns its receipt, or raises TimeExhausted
+    (no receipt before the timeout) or TransactionReplaced.
+    '''
+    def __init__(self, tx_hash:HexBytes, sender:ChecksumAddress, nonce:int, timeout:float):
+        super().__init__()
+        self.tx_hash = HexBytes(tx_hash)
+        self.sender = sender
+        self.nonce = nonce
+        self.deadline = time.monotonic() + timeout
+
+    def __repr__(self) -> str:
+        return f'<PendingTransaction {self.tx_hash.hex()} nonce={self.nonce} done={self.done()}>'
+
+class ReceiptWatcher:
+    def __init__(self,
+                 w3:Web3,
+                 chain_id:int,
+                 poll_interval:float = DEFAULT_POLL_INTERVAL,
+                 max_blocks_per_poll:int = MAX_BLOCKS_PER_POLL):
+        self.w3 = w3
+        self.chain_id = chain_id
+        self.poll_interval = poll_interval
+        self.max_blocks_per_poll = max_blocks_per_poll
+        # tx hash: PendingTransaction
+        self.pending: Dict[HexBytes, PendingTransaction] = {}
+        # (sender, nonce): tx hash, to spot replacements
+        self.pending_nonces: Dict[Tuple[str, int], HexBytes] = {}
+        # Hashes found in a block, waiting for their receipts
+        self.mined: Set[HexBytes] = set()
+        # block number: tx hashes in that block
+        self.recent_blocks: OrderedDict[int, Set[HexBytes]] = OrderedDict()
+        self.last_block: int | None = None
+        # Whether blocks up to last_block were scanned, rather than receipts looked up
+        self._scanned = False
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def watch(self, tx_hash:HexBytes, sender:ChecksumAddress, nonce:int, timeout:float) -> PendingTransaction:
+        pending_tx = PendingTransaction(tx_hash, sender, nonce, timeout)
+        with self._lock:
+            if not self.pending:
+                # Start from the current head; see _poll()
+                self.last_block = None
+            self.pending[pending_tx.tx_hash] = pending_tx
+            self.pending_nonces[(sender, nonce)] = pending_tx.tx_hash
+            if any(pending_tx.tx_hash in hashes for hashes in self.recent_blocks.values()):
+                self.mined.add(pending_tx.tx_hash)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ReceiptWatcher', daemon=True)
+                self._thread.start()
+        return pending_tx
+
+    def pending_count(self) -> int:
+        return len(self.pending)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self.pending:
+                    self._thread = None
+                    return
+            try:
+                self._poll()
+            except Exception:
+                # RPC hiccups are retried next time around. Transactions
+                # that never resolve still time out below
+                pass
+            self._expire()
+            time.sleep(self.poll_interval)
+
+    def _poll(self) -> None:
+        head = self.w3.eth.block_number
+        # Let the view cache drop results for 'latest' without asking itself
+        if view_cache.VIEW_CACHE is not None:
+            view_cache.VIEW_CACHE.new_block(self.chain_id, head)
+        if self.last_block is not None and head == self.last_block:
+            # Nothing new, except transactions watched after their block was scanned
+            self._fetch_receipts()
+            return
+        if self.pending_count() < FULL_SCAN_MIN_PENDING:
+            self._poll_receipts()
+            self._scanned = False
+        elif self.last_block is None or head - self.last_block > self.max_blocks_per_poll:
+            # Nothing scanned yet, or too far behind: look each receipt up once.
+            # Anything mined after `head` turns up in the next block scans
+            with self._lock:
+                self.mined.update(self.pending)
+            self._fetch_receipts()
+            self._scanned = False
+        else:
+            if not self._scanned:
+                # Blocks up to last_block weren't scanned, so a transaction 
+                # watched since it was read may already be in one of them
+                with self._lock:
+                    self.mined.update(self.pending)
+            for block_number in range(self.last_block + 1, head + 1):
+                self._scan_block(block_number)
+            self._fetch_receipts()
+            self._scanned = True
+        self.last_block = head
+
+    def _poll_receipts(self) -> None:
+        # Ask for every pending receipt. One that's missing although its
+        # sender's nonce has been used was replaced. Nonces are fetched first, 
+        # so a transaction mined in between has its receipt found
+        with self._lock:
+            pending = list(self.pending.values())
+            self.mined.update(self.pending)
+        mined_nonces = {sender: self.w3.eth.get_transaction_count(sender, 'latest')
+                        for sender in {p.sender for p in pending}}
+        self._fetch_receipts()
+        for p in pending:
+            if p.nonce < mined_nonces[p.sender] and not p.done():
+                self._resolve(p.tx_hash, error=TransactionReplaced(p.tx_hash, None))
+
+    def _scan_block(self, block_number:int) -> None:
+        block = self.w3.eth.get_block(block_number, full_transactions=True)
+        hashes = set()
+        replaced: List[Tuple[HexBytes, HexBytes]] = []
+        with self._lock:
+            for tx in block['transactions']:
+                tx_hash = HexBytes(tx['hash'])
+                hashes.add(tx_hash)
+                if tx_hash in self.pending:
+                    self.mined.add(tx_hash)
+                    continue
+                pending_hash = self.pending_nonces.get((tx['from'], tx['nonce']))
+                if pending_hash is not None:
+                    replaced.append((pending_hash, tx_hash))
+            self.recent_blocks[block_number] = hashes
+            while len(self.recent_blocks) > RECENT_BLOCKS:
+                self.recent_blocks.popitem(last=False)
+
+        for tx_hash, replacement_hash in replaced:
+            self._resolve(tx_hash, error=TransactionReplaced(tx_hash, replacement_hash))
+
+    def _fetch_receipts(self) -> None:
+        with self._lock:
+            mined, self.mined = self.mined, set()
+        for tx_hash in mined:
+            try:
+                receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            self._resolve(tx_hash, receipt=receipt)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            expired = [p for p in self.pending.values() if p.deadline < now]
+        for p in expired:
+            # A transaction that never made it into a block may have been
+            # dropped, leaving a gap in the sender's nonces
+            NONCE_MANAGER.resync(self.chain_id, p.sender)
+            self._resolve(p.tx_hash, error=TimeExhausted(f'Transaction {p.tx_hash.hex()} is not in the chain '
+                                                         f'after waiting past its timeout'))
+
+    def _resolve(self, tx_hash:HexBytes, receipt:TxReceipt | None = None, error:Exception | None = None) -> None:
+        with self._lock:
+            pending_tx = self.pending.pop(tx_hash, None)
+            if pending_tx is None:
+                return
+            self.pending_nonces.pop((pending_tx.sender, pending_tx.nonce), None)
+            self.mined.discard(tx_hash)
+        if error is not None:
+            pending_tx.set_exception(error)
+        else:
+            pending_tx.set_result(receipt)
+
+# rpc: ReceiptWatcher
+WATCHERS: Dict[str, ReceiptWatcher] = {}
+_LOCK = threading.Lock()
+
+def watcher_for_rpc(rpc:str) -> ReceiptWatcher:
+    watcher = WATCHERS.get(rpc)
+    if watcher is None:
+        w3 = provider_registry.get_w3(rpc)
+        chain_id = chain_id_for_rpc(w3, rpc)
+        with _LOCK:
+            watcher = WATCHERS.setdefault(rpc, ReceiptWatcher(w3, chain_id))
+    return watcher
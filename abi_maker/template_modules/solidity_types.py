@@ -1,8 +1,10 @@
 
-from typing import Sequence, Dict, Tuple, List
+from typing import Sequence, Dict, Tuple, List, NamedTuple
 from web3.datastructures import AttributeDict
 from web3.types import TxReceipt, BlockIdentifier
 from eth_typing.evm import ChecksumAddress
+from eth_typing.encoding import HexStr
+from hexbytes import HexBytes
 
 HexAddress = ChecksumAddress
 # We lose some detail here; Python doesnt have signed/unsigned int differentions
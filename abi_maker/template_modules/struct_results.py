@@ -0,0 +1,35 @@
+#! /usr/bin/env python
+from typing import Dict, List, Any, Sequence, Tuple
+
+# Views that return Solidity structs give instances of NamedTuple classes
+# generated from the ABI, e.g. hero_core.Hero. These helpers work on lists of
+# those results.
+
+def to_columns(results:Sequence[Tuple], flatten:bool = True) -> Dict[str, List[Any]]:
+    # One list per field, e.g. for 100k heroes:
+    #   columns = to_columns(heroes)
+    #   columns['id'], columns['stats.strength'], ...
+    # With `flatten`, nested structs become dotted columns rather than lists
+    # of struct instances. The result can be passed straight to
+    # pandas.DataFrame() or numpy.array() per column
+    if not results:
+        return {}
+    columns: Dict[str, List[Any]] = {}
+    for name, column in zip(results[0]._fields, zip(*results)): # type: ignore
+        if flatten and hasattr(column[0], '_fields'):
+            for sub_name, sub_column in to_columns(column, flatten).items():
+                columns[f'{name}.{sub_name}'] = sub_column
+        else:
+            columns[name] = list(column)
+    return columns
+
+def to_dict(result:Tuple) -> Dict[str, Any]:
+    # A nested dict for one result, e.g. for JSON
+    return {name: _to_plain(value) for name, value in zip(result._fields, result)} # type: ignore
+
+def _to_plain(value:Any) -> Any:
+    if hasattr(value, '_fields'):
+        return to_dict(value)
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    return value
@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+from collections import OrderedDict
+import threading
+import time
+
+from typing import TYPE_CHECKING, Dict, Set, Tuple, Hashable
+
+if TYPE_CHECKING:
+    from .solidity_types import BlockIdentifier
+
+# A read-through cache for view calls, shared by every wrapper in the process.
+# Entries hold raw eth_call return data, keyed by
+# (chain id, contract address, calldata (selector + encoded args), block).
+#
+# Calls pinned to a block number or hash can't change, so they stay cached
+# until they're the least recently used entry and the cache is full. Calls at
+# 'latest' are dropped as soon as a new block is seen, either by checking
+# eth_blockNumber (at most once per `head_ttl` seconds per chain) or from a
+# ReceiptWatcher scanning blocks. 'pending', 'safe' & 'finalized' calls aren't cached.
+#
+# Off by default; see enable_view_cache()
+
+DEFAULT_MAX_ENTRIES = 10_000
+# Seconds a known head block is trusted before checking for a new one
+DEFAULT_HEAD_TTL = 1.0
+
+# (chain_id, contract address, calldata, block number / hash / 'latest')
+ViewKey = Tuple[int, str, str, Hashable]
+
+LATEST = 'latest'
+
+def resolve_block(block_identifier:'BlockIdentifier') -> Hashable | None:
+    # What a call at `block_identifier` is cached under, or None if it can't be
+    if isinstance(block_identifier, int):
+        return block_identifier
+    if isinstance(block_identifier, bytes):
+        return '0x' + block_identifier.hex() if len(block_identifier) == 32 else None
+    if block_identifier == LATEST:
+        return LATEST
+    if block_identifier == 'earliest':
+        return 0
+    if isinstance(block_identifier, str) and block_identifier.startswith('0x'):
+        # A block hash, or a block number in hex
+        if len(block_identifier) == 66:
+            return block_identifier.lower()
+        return int(block_identifier, 16)
+    return None
+
+class ViewCache:
+    def __init__(self, max_entries:int = DEFAULT_MAX_ENTRIES, head_ttl:float = DEFAULT_HEAD_TTL):
+        self.max_entries = max_entries
+        self.head_ttl = head_ttl
+        self.entries: OrderedDict[ViewKey, bytes] = OrderedDict()
+        # chain_id: keys of 'latest' entries, to drop on a new block
+        self.latest_keys: Dict[int, Set[ViewKey]] = {}
+        # chain_id: (head block number, monotonic time it was checked)
+        self.heads: Dict[int, Tuple[int, float]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def head_is_stale(self, chain_id:int) -> bool:
+        # True if the caller should check the chain's block number & call new_block()
+        head = self.heads.get(chain_id)
+        return head is None or time.monotonic() - head[1] > self.head_ttl
+
+    def head(self, chain_id:int) -> int | None:
+        head = self.heads.get(chain_id)
+        return head[0] if head else None
+
+    def new_block(self, chain_id:int, block_number:int) -> None:
+        # Record the chain's head, dropping 'latest' entries if it's moved on
+        with self._lock:
+            head = self.heads.get(chain_id)
+            self.heads[chain_id] = (block_number, time.monotonic())
+            if head is None or block_number <= head[0]:
+                return
+            stale = self.latest_keys.pop(chain_id, set())
+            for key in stale:
+                if self.entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def get(self, key:ViewKey) -> bytes | None:
+        with self._lock:
+            data = self.entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key:ViewKey, data:bytes, head:int | None = None) -> None:
+        # `head`: for 'latest' calls, the head block when the call was made.
+        # If a new block has been seen since, the result may already be stale,
+        # so it isn't stored
+        chain_id = key[0]
+        with self._lock:
+            if key[3] == LATEST:
+                if head != self.head(chain_id):
+                    return
+                self.latest_keys.setdefault(chain_id, set()).add(key)
+            self.entries[key] = bytes(data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                old_key, _ = self.entries.popitem(last=False)
+                if old_key[3] == LATEST:
+                    self.latest_keys.get(old_key[0], set()).discard(old_key)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.latest_keys.clear()
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, int | float]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'entries': len(self.entries),
+        }
+
+# The process-wide cache, or None while caching is off
+VIEW_CACHE: ViewCache | None = None
+
+def enable_view_cache(max_entries:int = DEFAULT_MAX_ENTRIES, head_ttl:float = DEFAULT_HEAD_TTL) -> ViewCache:
+    global VIEW_CACHE
+    VIEW_CACHE = ViewCache(max_entries, head_ttl)
+    return VIEW_CACHE
+
+def disable_view_cache() -> None:
+    global VIEW_CACHE
+    VIEW_CACHE = None
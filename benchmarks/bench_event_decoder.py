@@ -0,0 +1,118 @@
+#! /usr/bin/env python
+# Times parse_events() against web3's process_receipt() on DFK receipts.
+#
+# A DFK transaction receipt usually holds logs from several contracts: a
+# quest completion, say, has the QuestCore events alongside token Transfers
+# from each reward item. Callers then run process_receipt(errors=DISCARD) for
+# every event they care about, decoding the whole receipt each time.
+# parse_events() looks each log's topic0 up once and decodes only matches.
+#
+# Usage: python benchmarks/bench_event_decoder.py [--logs 40] [--repeat 200]
+import argparse
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+from eth_abi import encode
+from eth_abi.grammar import parse
+from eth_utils.abi import collapse_if_tuple
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from web3.logs import DISCARD
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+from abi_maker import make_wrapper
+
+CONTRACTS = ['quest_core', 'hero_core', 'jewel_token', 'assisting_auction']
+# Any URL will do; nothing here touches the network
+RPC = 'http://localhost:8545'
+
+def fake_value(abi_type, n:int):
+    if abi_type.is_array:
+        dim = abi_type.arrlist[-1]
+        return [fake_value(abi_type.item_type, n + i) for i in range(dim[0] if dim else 2)]
+    if getattr(abi_type, 'components', None):
+        return tuple(fake_value(c, n + i) for i, c in enumerate(abi_type.components))
+    base, sub = abi_type.base, abi_type.sub
+    if base in ('uint', 'int'):
+        return n
+    if base == 'bool':
+        return n % 2 == 0
+    if base == 'address':
+        return f'0x{n + 1:040x}'
+    if base == 'string':
+        return 'hero'
+    return bytes(sub) if sub else b'hero'
+
+def fake_log(event_abi, topic0:str, address:str, log_index:int) -> AttributeDict:
+    topics = [HexBytes(topic0)]
+    data_types, data_values = [], []
+    for i in event_abi['inputs']:
+        abi_type = parse(collapse_if_tuple(i))
+        value = fake_value(abi_type, log_index)
+        if not i['indexed']:
+            data_types.append(abi_type.to_type_str())
+            data_values.append(value)
+        elif abi_type.is_dynamic:
+            topics.append(HexBytes(bytes(32)))
+        else:
+            topics.append(HexBytes(encode([abi_type.to_type_str()], [value])))
+    return AttributeDict({
+        'address': address,
+        'topics': topics,
+        'data': HexBytes(encode(data_types, data_values)),
+        'logIndex': log_index,
+        'transactionIndex': 0,
+        'transactionHash': HexBytes(bytes(32)),
+        'blockHash': HexBytes(bytes(32)),
+        'blockNumber': 1,
+    })
+
+def dfk_receipt(wrappers, num_logs:int) -> AttributeDict:
+    # `num_logs` logs, cycling through the events of every contract in `wrappers`
+    events = [(w, topic, abi) for w in wrappers for topic, abi in w.EVENT_TOPICS.items()]
+    logs = []
+    for i in range(num_logs):
+        wrapper, topic, event_abi = events[i % len(events)]
+        logs.append(fake_log(event_abi, topic, wrapper.contract_address, i))
+    return AttributeDict({'logs': logs, 'transactionHash': HexBytes(bytes(32))})
+
+def process_receipt_events(wrapper, receipt):
+    # The usual web3 approach: every event class decodes the whole receipt
+    events = {}
+    for event_abi in wrapper.EVENT_TOPICS.values():
+        decoded = wrapper.contract.events[event_abi['name']]().process_receipt(receipt, errors=DISCARD)
+        if decoded:
+            events[event_abi['name']] = list(decoded)
+    return events
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logs', type=int, default=40, help='Logs per receipt')
+    parser.add_argument('--repeat', type=int, default=200, help='Receipts parsed per timing')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        make_wrapper.write_project_wrapper('DFK', REPO_DIR / 'abi_maker' / 'demo_abis' / 'DFK_ABIS.json',
+                                           Path(out_dir) / 'DFK', overwrite_ok=True)
+        sys.path.insert(0, out_dir)
+        import DFK
+
+        contracts = DFK.AllDfkContracts('cv', rpc=RPC)
+        wrappers = [getattr(contracts, name) for name in CONTRACTS]
+        receipt = dfk_receipt(wrappers, args.logs)
+
+        print(f'{args.logs} logs per receipt, {args.repeat} receipts; ms per receipt')
+        print(f'{"contract":<20}{"events":>8}{"process_receipt":>18}{"parse_events":>15}{"speedup":>10}')
+        for name, wrapper in zip(CONTRACTS, wrappers):
+            assert wrapper.parse_events(receipt) == process_receipt_events(wrapper, receipt)
+            web3_time = min(timeit.repeat(lambda: process_receipt_events(wrapper, receipt), number=args.repeat, repeat=3))
+            decoder_time = min(timeit.repeat(lambda: wrapper.parse_events(receipt), number=args.repeat, repeat=3))
+            print(f'{name:<20}{len(wrapper.EVENT_TOPICS):>8}'
+                  f'{web3_time / args.repeat * 1000:>18.3f}{decoder_time / args.repeat * 1000:>15.3f}'
+                  f'{web3_time / decoder_time:>9.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+# Times the startup stages of a generated package, each in a fresh interpreter.
+#
+# Importing the package and building an aggregator import only the stdlib &
+# the light template modules. web3 is imported with the first contract,
+# since every wrapper needs a web3 instance, so that stage is compared with
+# `import web3` on its own.
+#
+# Usage: python benchmarks/bench_import_time.py [--runs 5] [--importtime]
+#   --importtime: also show each stage's slowest imports from `python -X importtime`
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+from abi_maker import make_wrapper
+
+# Any URL will do; nothing here touches the network
+RPC = 'http://localhost:8545'
+# Written to stderr after a stage's setup, so -X importtime output can be split
+MARKER = '--- timed ---'
+
+# name: (setup, timed statement)
+STAGES = {
+    'import web3': ('', 'import web3'),
+    'import DFK': ('', 'import DFK'),
+    'AllDfkContracts()': ('', f"from DFK import AllDfkContracts; contracts = AllDfkContracts('cv', rpc={RPC!r})"),
+    'first contract': (f"from DFK import AllDfkContracts; contracts = AllDfkContracts('cv', rpc={RPC!r})",
+                       'contracts.hero_core'),
+    'second contract': (f"from DFK import AllDfkContracts; contracts = AllDfkContracts('cv', rpc={RPC!r}); contracts.hero_core",
+                        'contracts.jewel_token'),
+}
+
+RUNNER = '''
+import sys, time
+sys.path.insert(0, {path!r})
+{setup}
+print({marker!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+{stmt}
+elapsed = time.perf_counter() - start
+print(elapsed, 'web3' in sys.modules)
+'''
+
+def run_stage(path:str, setup:str, stmt:str, importtime:bool = False) -> subprocess.CompletedProcess:
+    args = [sys.executable]
+    if importtime:
+        args += ['-X', 'importtime']
+    args += ['-c', RUNNER.format(path=path, setup=setup, stmt=stmt, marker=MARKER)]
+    return subprocess.run(args, capture_output=True, text=True, check=True)
+
+def slowest_imports(importtime_output:str, count:int = 5):
+    # (cumulative µs, module) for the top-level imports in -X importtime output,
+    # after the stage's setup
+    entries = []
+    for line in importtime_output.split(MARKER, 1)[-1].splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):
+            entries.append((int(cumulative), name.strip()))
+    return sorted(entries, reverse=True)[:count]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='Interpreters started per stage')
+    parser.add_argument('--importtime', action='store_true', help="Show each stage's slowest imports")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        make_wrapper.write_project_wrapper('DFK', REPO_DIR / 'abi_maker' / 'demo_abis' / 'DFK_ABIS.json',
+                                           Path(out_dir) / 'DFK', overwrite_ok=True)
+        # Compile once up front so no stage pays for writing .pyc files
+        run_stage(out_dir, 'import DFK', f"DFK.AllDfkContracts('cv', rpc={RPC!r}).load_all()")
+
+        print(f'median of {args.runs} runs')
+        print(f'{"stage":<20}{"ms":>10}  web3 imported')
+        for name, (setup, stmt) in STAGES.items():
+            results = [run_stage(out_dir, setup, stmt).stdout.split() for _ in range(args.runs)]
+            elapsed = statistics.median(float(r[0]) for r in results)
+            print(f'{name:<20}{elapsed * 1000:>10.1f}  {results[0][1]}')
+            if args.importtime:
+                output = run_stage(out_dir, setup, stmt, importtime=True).stderr
+                for cumulative, module in slowest_imports(output):
+                    print(f'    {module:<40}{cumulative / 1000:>8.1f} ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import random
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from web3 import Web3, EthereumTesterProvider
+
+from abi_maker import make_wrapper
+
+DEMO_ABIS_DIR = Path(__file__).parent.parent / 'abi_maker' / 'demo_abis'
+
+# RPC name the eth-tester chain is registered under in provider_registry
+TESTER_RPC = 'tester'
+
+@pytest.fixture(scope='session')
+def dfk(tmp_path_factory):
+    # The DFK demo bundle, generated once with async wrappers & importable as `DFK`
+    out_dir = tmp_path_factory.mktemp('generated')
+    make_wrapper.write_project_wrapper('DFK', DEMO_ABIS_DIR / 'DFK_ABIS.json', out_dir / 'DFK',
+                                       overwrite_ok=True, async_wrappers=True)
+    sys.path.insert(0, str(out_dir))
+    import DFK
+    return DFK
+
+@pytest.fixture(scope='session')
+def tester_w3(dfk):
+    # An in-process eth-tester chain that wrappers created with rpc=TESTER_RPC use
+    w3 = Web3(EthereumTesterProvider())
+    dfk.provider_registry.W3_INSTANCES[TESTER_RPC] = w3
+    return w3
+
+@pytest.fixture(scope='session')
+def contracts(dfk, tester_w3):
+    return dfk.AllDfkContracts('cv', rpc=TESTER_RPC)
+
+def deploy_runtime(w3:Web3, runtime:bytes) -> str:
+    # Deploy `runtime` as a contract's code, as is. Returns its address
+    n = len(runtime)
+    init = bytes([0x61, n >> 8, n & 0xff,   # PUSH2 n
+                  0x80,                     # DUP1
+                  0x60, 12,                 # PUSH1 12: where runtime starts in this code
+                  0x60, 0,                  # PUSH1 0
+                  0x39,                     # CODECOPY
+                  0x60, 0,                  # PUSH1 0
+                  0xf3]) + runtime          # RETURN
+    tx_hash = w3.eth.send_transaction({'from': w3.eth.accounts[0], 'data': init})
+    return w3.eth.get_transaction_receipt(tx_hash)['contractAddress']
+
+def returning_runtime(return_data:bytes) -> bytes:
+    # Code that returns `return_data` for any call
+    n = len(return_data)
+    return bytes([0x61, n >> 8, n & 0xff,   # PUSH2 n
+                  0x60, 14,                 # PUSH1 14: where return_data starts in this code
+                  0x60, 0,                  # PUSH1 0
+                  0x39,                     # CODECOPY
+                  0x61, n >> 8, n & 0xff,   # PUSH2 n
+                  0x60, 0,                  # PUSH1 0
+                  0xf3]) + return_data      # RETURN
+
+def reverting_runtime(return_data:bytes = b'') -> bytes:
+    # Code that reverts with `return_data` for any call
+    runtime = returning_runtime(return_data)
+    return runtime[:-(len(return_data) + 1)] + b'\xfd' + return_data
+
+@pytest.fixture
+def deploy(tester_w3):
+    # deploy(runtime) -> address, on the eth-tester chain
+    return lambda runtime: deploy_runtime(tester_w3, runtime)
+
+@pytest.fixture
+def returning(deploy):
+    # returning(return_data) -> address of a contract returning it for any call
+    return lambda return_data: deploy(returning_runtime(return_data))
+
+@pytest.fixture
+def reverting(deploy):
+    return lambda return_data=b'': deploy(reverting_runtime(return_data))
+
+def sample_value(abi_type, rng:random.Random):
+    # A random value of the parsed ABI type
+    if abi_type.is_array:
+        dim = abi_type.arrlist[-1]
+        length = dim[0] if dim else rng.randint(0, 3)
+        return [sample_value(abi_type.item_type, rng) for _ in range(length)]
+    if getattr(abi_type, 'components', None):
+        return tuple(sample_value(c, rng) for c in abi_type.components)
+    base, sub = abi_type.base, abi_type.sub
+    if base == 'uint':
+        return rng.randrange(2 ** min(sub, 64))
+    if base == 'int':
+        return rng.randrange(-2 ** 30, 2 ** 30)
+    if base == 'bool':
+        return rng.random() < 0.5
+    if base == 'address':
+        return Web3.to_checksum_address(rng.randbytes(20))
+    if base == 'string':
+        return 'hero' * rng.randint(0, 4)
+    if base == 'bytes':
+        return rng.randbytes(sub if sub else rng.randint(0, 40))
+    raise ValueError(f'No sample for {abi_type}')
+
+class RPCError(Exception):
+    # Raised by a StubRPC answer function to answer with a JSON-RPC error
+    def __init__(self, code:int, message:str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class StubRPC:
+    # A JSON-RPC server on a local port. Answers with `answer(method, params)`,
+    # or the default answers below, and counts the POSTs & requests it gets.
+    # Set `status` to have every POST fail with that HTTP status, and 
+    # `batches=False` to have it reject JSON-RPC batches
+    def __init__(self, answer=None, status:int = 200, batches:bool = True):
+        self.answer = answer or default_answer
+        self.status = status
+        self.batches = batches
+        self.posts = 0
+        self.requests = 0
+        self.methods = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.posts += 1
+                    stub.requests += len(body) if isinstance(body, list) else 1
+                if stub.status != 200:
+                    self.send_response(stub.status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if not isinstance(body, list):
+                    out = stub._respond(body)
+                elif stub.batches:
+                    out = [stub._respond(request) for request in body]
+                else:
+                    out = {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch not supported'}}
+                data = json.dumps(out).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _respond(self, request):
+        with self._lock:
+            self.methods.append(request['method'])
+        try:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'result': self.answer(request['method'], request['params'])}
+        except RPCError as e:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': e.code, 'message': e.message}}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def default_answer(method:str, params):
+    if method == 'eth_getBalance':
+        # Something different for each address
+        return hex(int(params[0], 16) % 1000)
+    if method == 'eth_call':
+        # The last 32 bytes of calldata, e.g. the argument of balanceOf(address)
+        return '0x' + params[0]['data'][-64:]
+    return {
+        'eth_chainId': '0x1',
+        'net_version': '1',
+        'eth_blockNumber': '0x64',
+        'eth_gasPrice': hex(10 ** 9),
+    }.get(method)
+
+@pytest.fixture
+def stub_rpc():
+    # stub_rpc(**kwargs) -> a running StubRPC, shut down after the test
+    stubs = []
+    def make(**kwargs) -> StubRPC:
+        stubs.append(StubRPC(**kwargs))
+        return stubs[-1]
+    yield make
+    for stub in stubs:
+        stub.close()
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from web3 import Web3
+
+from conftest import RPCError, default_answer
+
+# Requests made at the same time from different threads should go out as one
+# JSON-RPC batch POST, each caller getting its own response back
+
+def addresses(n:int):
+    return [Web3.to_checksum_address(f'0x{i + 1:040x}') for i in range(n)]
+
+def run_together(fn, args):
+    # fn(arg) for each of `args`, in threads released all at once
+    barrier = threading.Barrier(len(args))
+    def call(arg):
+        barrier.wait()
+        return fn(arg)
+    with ThreadPoolExecutor(len(args)) as executor:
+        return list(executor.map(call, args))
+
+def test_concurrent_requests_share_one_post(dfk, stub_rpc):
+    stub = stub_rpc()
+    dfk.provider_registry.configure_rpc(stub.url, batch_requests=True, flush_interval=0.2)
+    w3 = dfk.provider_registry.get_w3(stub.url)
+
+    owners = addresses(20)
+    balances = run_together(w3.eth.get_balance, owners)
+
+    assert stub.posts == 1
+    assert stub.requests == 20
+    assert balances == [int(a, 16) % 1000 for a in owners]
+
+def test_batches_split_at_max_batch_size(dfk, stub_rpc):
+    stub = stub_rpc()
+    dfk.provider_registry.configure_rpc(stub.url, batch_requests=True, flush_interval=0.2, max_batch_size=4)
+    w3 = dfk.provider_registry.get_w3(stub.url)
+
+    owners = addresses(10)
+    balances = run_together(w3.eth.get_balance, owners)
+
+    # Two full batches of 4, then the last 2 when the flush interval is up
+    assert stub.posts == 3
+    assert stub.requests == 10
+    assert balances == [int(a, 16) % 1000 for a in owners]
+
+def test_wrapper_view_calls_are_batched(dfk, stub_rpc):
+    stub = stub_rpc()
+    dfk.provider_registry.configure_rpc(stub.url, batch_requests=True, flush_interval=0.2)
+    jewel_token = dfk.AllDfkContracts('cv', rpc=stub.url).jewel_token
+
+    owners = addresses(16)
+    balances = run_together(jewel_token.balance_of, owners)
+
+    # web3 checks the chain id before each eth_call, so that's 32 requests:
+    # a batch of eth_chainIds, then one of eth_calls
+    assert stub.posts == 2
+    assert sorted(stub.methods) == ['eth_call'] * 16 + ['eth_chainId'] * 16
+    # The stub's eth_call answers with the balanceOf() argument
+    assert balances == [int(a, 16) for a in owners]
+
+def test_batches_rejected_by_server_are_resent_singly(dfk, stub_rpc):
+    stub = stub_rpc(batches=False)
+    dfk.provider_registry.configure_rpc(stub.url, batch_requests=True, flush_interval=0.2)
+    w3 = dfk.provider_registry.get_w3(stub.url)
+
+    owners = addresses(5)
+    balances = run_together(w3.eth.get_balance, owners)
+
+    # The rejected batch, then one POST per request
+    assert stub.posts == 6
+    assert balances == [int(a, 16) % 1000 for a in owners]
+
+def test_rate_limited_requests_in_a_batch_are_resent(dfk, stub_rpc):
+    limited = []
+    def answer(method, params):
+        # The first two requests are turned away
+        if len(limited) < 2:
+            limited.append(params[0])
+            raise RPCError(-32005, 'Too Many Requests')
+        return default_answer(method, params)
+    stub = stub_rpc(answer=answer)
+    dfk.provider_registry.configure_rpc(stub.url, batch_requests=True, flush_interval=0.2)
+    w3 = dfk.provider_registry.get_w3(stub.url)
+
+    owners = addresses(5)
+    balances = run_together(w3.eth.get_balance, owners)
+
+    assert balances == [int(a, 16) % 1000 for a in owners]
+    # The two go again in a batch of their own, after the limiter's pause
+    assert stub.posts == 2
+    assert stub.requests == 7
+    limiter = w3.provider.limiter.stats()
+    assert limiter['rate_limit_errors'] == 1
+    assert limiter['rate'] is not None
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+from eth_account import Account
+
+# CredentialStore lookups must give what Credentials' static helpers give when
+# scanning a list of the same credentials, and bulk signing must give what
+# signing one at a time does
+
+NICKNAMES = ['Slipfoot', 'slim', 'Sliver', 'Aldo', 'aldous', 'Bex', 'Slipfoot', 'Zed', 'zebra', '']
+
+@pytest.fixture(scope='module')
+def creds(dfk):
+    rng = random.Random(0)
+    accounts = [Account.from_key(rng.randbytes(32)) for _ in NICKNAMES]
+    return [dfk.credentials.Credentials(a.address, a.key.hex(), n) for a, n in zip(accounts, NICKNAMES)]
+
+@pytest.fixture(scope='module')
+def signing_pool(dfk):
+    yield dfk.credentials.signing_pool(max_workers=2)
+    dfk.credentials.shutdown_signing_pool()
+
+def lookup(fn, *args):
+    # The credential found, or the exception type raised
+    try:
+        return fn(*args)
+    except ValueError as e:
+        return type(e)
+
+QUERIES = ['sli', 'SLI', 'slip', 'Slipfoot', 'slipfoot', 'ald', 'aldo', 'b', 'z', 'zeb', 'q', '', 'Slipfoots']
+
+@pytest.mark.parametrize('accept_abbreviation', [True, False])
+def test_nickname_lookups_match_list(dfk, creds, accept_abbreviation):
+    Credentials = dfk.credentials.Credentials
+    store = dfk.credentials.CredentialStore(creds)
+    for query in QUERIES:
+        assert (lookup(store.cred_for_nickname, query, accept_abbreviation)
+                is lookup(Credentials.cred_for_nickname, creds, query, accept_abbreviation))
+        assert (lookup(Credentials.cred_for_nickname, store, query, accept_abbreviation)
+                is lookup(Credentials.cred_for_nickname, creds, query, accept_abbreviation))
+    assert (store.creds_for_nicknames(QUERIES, accept_abbreviation)
+            == [c for c in (lookup(Credentials.cred_for_nickname, creds, q, accept_abbreviation) for q in QUERIES)
+                if c is not ValueError])
+
+def test_prefix_matches_keep_order(dfk, creds):
+    store = dfk.credentials.CredentialStore(creds)
+    for query in QUERIES:
+        assert store.creds_matching_abbreviation(query) == [c for c in creds if c.matches_abbreviation(query)]
+
+def test_address_lookups_match_list(dfk, creds):
+    Credentials = dfk.credentials.Credentials
+    store = dfk.credentials.CredentialStore(creds)
+    for cred in creds:
+        assert store.cred_for_address(cred.address) is Credentials.cred_for_address(creds, cred.address)
+        # The store also ignores case
+        assert store.cred_for_address(cred.address.lower()) is cred
+    with pytest.raises(ValueError):
+        store.cred_for_address('0x' + '00' * 20)
+    with pytest.raises(ValueError):
+        Credentials.cred_for_address(creds, '0x' + '00' * 20)
+
+def tx_dicts(creds, count:int):
+    return [{
+        'from': creds[i % len(creds)].address,
+        'to': '0x' + '33' * 20,
+        'value': i,
+        'nonce': i,
+        'gas': 21000,
+        'maxFeePerGas': 2 * 10 ** 9,
+        'maxPriorityFeePerGas': 10 ** 9,
+        'chainId': 1,
+    } for i in range(count)]
+
+@pytest.mark.parametrize('count', [3, 130])
+def test_bulk_signing_matches_inline(dfk, creds, signing_pool, count):
+    # 130 transactions are signed in the process pool, in 3 chunks
+    txs = tx_dicts(creds, count)
+    store = dfk.credentials.CredentialStore(creds)
+    expected = [Account.sign_transaction(tx, store.cred_for_address(tx['from']).private_key) for tx in txs]
+
+    signed = store.sign_transactions(txs)
+    assert [s.rawTransaction for s in signed] == [e.rawTransaction for e in expected]
+    signed = dfk.credentials.sign_transactions(txs, [store.cred_for_address(tx['from']) for tx in txs])
+    assert [s.hash for s in signed] == [e.hash for e in expected]
+
+def test_signing_pool_spawns(signing_pool):
+    assert signing_pool._mp_context.get_start_method() == 'spawn'
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+from eth_abi import encode
+from eth_abi.grammar import parse
+from eth_utils.abi import collapse_if_tuple
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3.logs import DISCARD
+
+from conftest import sample_value
+
+# parse_events() decodes each log once through EventDecoder, and must give
+# exactly what web3's process_receipt(errors=DISCARD) gives for each event.
+# Receipts are made of logs for every event of a contract, with made-up
+# args, mixed with logs no event of the contract matches
+
+CONTRACTS = ['hero_core', 'jewel_token', 'dfk_duel_s2', 'assisting_auction', 'quest_core']
+TX_HASH = HexBytes(b'\x01' * 32)
+
+def sample_log(event_abi, rng:random.Random, address:str, log_index:int, topic0:bytes) -> AttributeDict:
+    topics = [HexBytes(topic0)]
+    data_types, data_values = [], []
+    for i in event_abi['inputs']:
+        abi_type = parse(collapse_if_tuple(i))
+        value = sample_value(abi_type, rng)
+        if not i['indexed']:
+            data_types.append(abi_type.to_type_str())
+            data_values.append(value)
+        elif abi_type.is_dynamic:
+            # Indexed dynamic values are stored as their hash
+            topics.append(HexBytes(rng.randbytes(32)))
+        else:
+            topics.append(HexBytes(encode([abi_type.to_type_str()], [value])))
+    return AttributeDict({
+        'address': address,
+        'topics': topics,
+        'data': HexBytes(encode(data_types, data_values)),
+        'logIndex': log_index,
+        'transactionIndex': 0,
+        'transactionHash': TX_HASH,
+        'blockHash': HexBytes(b'\x02' * 32),
+        'blockNumber': 1,
+    })
+
+def sample_receipt(wrapper, rng:random.Random) -> AttributeDict:
+    logs = []
+    other_address = Web3.to_checksum_address(rng.randbytes(20))
+    for topic, event_abi in list(wrapper.EVENT_TOPICS.items()) * 2:
+        logs.append(sample_log(event_abi, rng, wrapper.contract_address, len(logs), HexBytes(topic)))
+        # An event of some other contract
+        logs.append(sample_log(event_abi, rng, other_address, len(logs), rng.randbytes(32)))
+    return AttributeDict({'logs': logs, 'transactionHash': TX_HASH})
+
+def processed(wrapper, receipt) -> dict:
+    events = {}
+    for event_abi in wrapper.EVENT_TOPICS.values():
+        event = wrapper.contract.events[event_abi['name']]()
+        decoded = list(event.process_receipt(receipt, errors=DISCARD))
+        if decoded:
+            events[event_abi['name']] = decoded
+    return events
+
+@pytest.mark.parametrize('contract_name', CONTRACTS)
+def test_parse_events_matches_process_receipt(contracts, contract_name):
+    wrapper = getattr(contracts, contract_name)
+    receipt = sample_receipt(wrapper, random.Random(contract_name))
+
+    events = wrapper.parse_events(receipt)
+    assert events == processed(wrapper, receipt)
+    assert sum(len(e) for e in events.values()) == len(receipt['logs']) // 2
+
+def test_filtered_parse_events_match_process_receipt(contracts):
+    hero_core = contracts.hero_core
+    receipt = sample_receipt(hero_core, random.Random(1))
+    names = [e['name'] for e in hero_core.EVENT_TOPICS.values()][:2]
+
+    expected = {n: e for n, e in processed(hero_core, receipt).items() if n in names}
+    assert hero_core.parse_events(receipt, event_names=names) == expected
+    assert hero_core.parse_events(receipt, addresses=['0x' + '44' * 20]) == {}
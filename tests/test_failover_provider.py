@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from web3 import Web3
+
+# A list of RPC URLs is used with failover: reads that fail on one endpoint
+# are retried on the next, and failing endpoints drop down the ranking
+
+OWNER = Web3.to_checksum_address('0x' + '11' * 20)
+BALANCE = int(OWNER, 16) % 1000
+
+@pytest.fixture
+def failing_and_good(stub_rpc):
+    # Two fresh endpoints, so neither has any health history
+    return stub_rpc(status=500), stub_rpc()
+
+def test_read_fails_over_to_second_url(dfk, failing_and_good):
+    failing, good = failing_and_good
+    w3 = dfk.provider_registry.get_w3(dfk.provider_registry.rpc_key([failing.url, good.url]))
+
+    assert w3.eth.get_balance(OWNER) == BALANCE
+    assert failing.posts == 1
+    assert good.methods == ['eth_getBalance']
+    assert w3.provider.stats()['retries'] == 1
+
+def test_failing_url_is_demoted(dfk, failing_and_good):
+    failing, good = failing_and_good
+    w3 = dfk.provider_registry.get_w3(dfk.provider_registry.rpc_key([failing.url, good.url]))
+    w3.eth.get_balance(OWNER)
+
+    stats = dfk.failover_provider.endpoint_stats()
+    assert stats[failing.url]['errors'] == 1
+    assert stats[failing.url]['error_rate'] > 0
+    assert stats[failing.url]['down_for'] > 0
+    assert stats[good.url]['errors'] == 0
+
+    # In its cooldown, the failing URL isn't tried at all
+    assert w3.eth.get_balance(OWNER) == BALANCE
+    assert failing.posts == 1
+    assert good.posts == 2
+    assert w3.provider.stats()['retries'] == 1
+
+def test_errors_lower_score_after_cooldown(dfk):
+    urls = ['http://flaky.invalid', 'http://steady.invalid']
+    router = dfk.failover_provider._Router(urls)
+    flaky, steady = router.health
+    for health in router.health:
+        health.record_success(0.1)
+    flaky.record_failure(0.1)
+    flaky.record_success(0.1)
+
+    # Back up, with the same latency, but its error rate still counts against it
+    assert not flaky.is_down(0)
+    assert flaky.score() > steady.score()
+    assert router.ranked(probe=False) == [1, 0]
+
+def test_writes_are_not_retried(dfk, failing_and_good):
+    failing, good = failing_and_good
+    w3 = dfk.provider_registry.get_w3(dfk.provider_registry.rpc_key([failing.url, good.url]))
+
+    with pytest.raises(Exception):
+        w3.provider.make_request('eth_sendRawTransaction', ['0x00'])
+    assert failing.posts == 1
+    assert good.posts == 0
+
+def test_async_read_fails_over_to_second_url(dfk, failing_and_good):
+    failing, good = failing_and_good
+    w3 = dfk.provider_registry.get_async_w3(dfk.provider_registry.rpc_key([failing.url, good.url]))
+
+    async def main():
+        balance = await w3.eth.get_balance(OWNER)
+        await dfk.provider_registry.close_async_sessions()
+        return balance
+
+    assert asyncio.run(main()) == BALANCE
+    assert failing.posts == 1
+    assert good.methods == ['eth_getBalance']
+    assert dfk.failover_provider.endpoint_stats()[failing.url]['down_for'] > 0
+
+def test_p95_is_nearest_rank(dfk):
+    health = dfk.failover_provider.EndpointHealth('http://p95.invalid')
+    for ms in range(1, 31):
+        health.record_success(ms / 1000)
+    # The 29th of 30, not the 28th
+    assert health.p95() == 0.029
+
+def test_close_rpc_stops_hedging_threads(dfk, stub_rpc):
+    urls = [stub_rpc().url, stub_rpc().url]
+    key = dfk.provider_registry.configure_failover(urls, hedged_reads=True)
+    w3 = dfk.provider_registry.get_w3(key)
+    assert w3.eth.get_balance(OWNER) == BALANCE
+    executor = w3.provider._executor
+    assert executor is not None
+
+    dfk.provider_registry.close_rpc(key)
+    assert executor._shutdown
+    for thread in executor._threads:
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+
+    # The group can be set up again, and gets a new provider
+    dfk.provider_registry.configure_failover(urls, hedged_reads=False)
+    new_w3 = dfk.provider_registry.get_w3(key)
+    assert new_w3 is not w3
+    assert new_w3.eth.get_balance(OWNER) == BALANCE
+    assert new_w3.provider.router.hedged_reads is False
+    dfk.provider_registry.close_rpc(key)
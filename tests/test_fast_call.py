@@ -0,0 +1,80 @@
+import random
+
+import pytest
+from eth_abi import encode
+from eth_abi.grammar import parse
+from web3 import Web3
+from web3.exceptions import BadFunctionCallOutput
+
+from conftest import sample_value
+
+# fast_call() encodes & decodes from the generated FUNCTION_SELECTORS tables
+# rather than through web3's contract functions. For each view below, a
+# contract returning made-up data is deployed on eth-tester, and fast_call(),
+# view_call() and web3 itself must all give the same result for it
+
+VIEWS = [
+    # Nested structs
+    ('hero_core', 'getHero', [1]),
+    # Dynamic array of scalars
+    ('assisting_auction', 'getUserAuctions', ['0x' + '11' * 20]),
+    # Array of structs holding dynamic arrays
+    ('alchemist', 'getPotions', []),
+    # Array of structs with nested structs
+    ('dfk_duel_s2', 'getDuelTurns', [7]),
+    # A plain scalar
+    ('jewel_token', 'totalSupply', []),
+]
+
+@pytest.mark.parametrize('contract_name, function_name, args', VIEWS)
+def test_fast_call_matches_web3(contracts, tester_w3, returning, contract_name, function_name, args):
+    wrapper = getattr(contracts, contract_name)
+    args = [Web3.to_checksum_address(a) if isinstance(a, str) else a for a in args]
+    output_types = wrapper.FUNCTION_SELECTORS[function_name][2]
+    rng = random.Random(function_name)
+    for _ in range(3):
+        values = [sample_value(parse(t), rng) for t in output_types]
+        address = returning(encode(output_types, values))
+
+        expected = tester_w3.eth.contract(address, abi=wrapper.abi).functions[function_name](*args).call()
+        assert wrapper.fast_call(function_name, args, contract_address=address) == expected
+        assert wrapper.view_call(function_name, args, contract_address=address) == expected
+
+def test_fast_call_struct_results(contracts, returning):
+    # Results compare equal to web3's tuples, but are the generated NamedTuples
+    hero_core = contracts.hero_core
+    output_types = hero_core.FUNCTION_SELECTORS['getHero'][2]
+    values = [sample_value(parse(t), random.Random(0)) for t in output_types]
+    address = returning(encode(output_types, values))
+
+    hero = hero_core.fast_call('getHero', [1], contract_address=address)
+    assert type(hero).__name__ == 'Hero'
+    assert hero.id == values[0][0]
+    assert type(hero.summoning_info).__name__ == 'SummoningInfo'
+    assert hero == hero_core.view_call('getHero', [1], contract_address=address)
+
+@pytest.mark.parametrize('revert_data', [
+    b'',
+    # Error(string) with the reason 'nope'
+    bytes.fromhex('08c379a0') + encode(['string'], ['nope']),
+])
+def test_fast_call_revert(contracts, tester_w3, reverting, revert_data):
+    # Reverts surface exactly as web3 raises them (on eth-tester, as TransactionFailed)
+    wrapper = contracts.hero_core
+    address = reverting(revert_data)
+
+    with pytest.raises(Exception) as expected:
+        tester_w3.eth.contract(address, abi=wrapper.abi).functions.getHero(1).call()
+    with pytest.raises(expected.type) as fast:
+        wrapper.fast_call('getHero', [1], contract_address=address)
+    with pytest.raises(expected.type) as view:
+        wrapper.view_call('getHero', [1], contract_address=address)
+    assert str(fast.value) == str(view.value) == str(expected.value)
+
+def test_fast_call_bad_output(contracts, returning):
+    # Too little return data for the output types
+    address = returning(b'\x01' * 5)
+    with pytest.raises(BadFunctionCallOutput):
+        contracts.hero_core.fast_call('getHero', [1], contract_address=address)
+    with pytest.raises(BadFunctionCallOutput):
+        contracts.hero_core.view_call('getHero', [1], contract_address=address)
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+from web3.exceptions import MethodUnavailable
+
+GWEI = 10 ** 9
+
+class FakeEth:
+    # Stands in for w3.eth. `fee_history_error`, if set, is raised by fee_history()
+    def __init__(self):
+        self.fee_history_error = None
+        self.base_fees = [30 * GWEI, 40 * GWEI]
+        self.gas_price = 7 * GWEI
+        self.max_priority_fee = GWEI
+
+    def fee_history(self, blocks, newest, percentiles):
+        if self.fee_history_error is not None:
+            raise self.fee_history_error
+        return {'baseFeePerGas': self.base_fees, 'reward': [[2 * GWEI], [3 * GWEI]]}
+
+class FakeW3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+def test_eip1559_fees(dfk):
+    oracle = dfk.fee_oracle.FeeOracle(FakeW3())
+    assert oracle.fees() == {'maxFeePerGas': 83 * GWEI, 'maxPriorityFeePerGas': 3 * GWEI}
+
+@pytest.mark.parametrize('error', [
+    ValueError({'code': -32601, 'message': 'the method eth_feeHistory does not exist/is not available'}),
+    ValueError({'code': -32000, 'message': 'Method not found'}),
+    MethodUnavailable('eth_feeHistory'),
+    NotImplementedError(),
+])
+def test_legacy_fees_when_fee_history_unsupported(dfk, error):
+    w3 = FakeW3()
+    w3.eth.fee_history_error = error
+    assert dfk.fee_oracle.FeeOracle(w3).fees() == {'gasPrice': 7 * GWEI}
+
+def test_legacy_fees_without_base_fee(dfk):
+    # As eth-tester answers eth_feeHistory before any block is mined
+    w3 = FakeW3()
+    w3.eth.base_fees = []
+    assert dfk.fee_oracle.FeeOracle(w3).fees() == {'gasPrice': 7 * GWEI}
+
+@pytest.mark.parametrize('error', [
+    TimeoutError('timed out'),
+    ValueError({'code': 429, 'message': 'Too many requests'}),
+])
+def test_transient_errors_are_raised(dfk, error):
+    w3 = FakeW3()
+    w3.eth.fee_history_error = error
+    oracle = dfk.fee_oracle.FeeOracle(w3)
+    with pytest.raises(type(error)):
+        oracle.fees()
+
+def test_background_refresh_keeps_fees_on_error(dfk):
+    w3 = FakeW3()
+    oracle = dfk.fee_oracle.FeeOracle(w3, ttl=0.01)
+    fees = oracle.fees()
+    w3.eth.fee_history_error = TimeoutError('timed out')
+    time.sleep(0.02)
+
+    # Stale, so this starts a refresh, which fails
+    assert oracle.cached_fees() == fees
+    for thread in threading.enumerate():
+        if thread.name == 'FeeOracle':
+            thread.join()
+    assert oracle.cached_fees() == fees
+    assert 'gasPrice' not in oracle.cached_fees()
+
+class SlowEth:
+    # Counts fee queries, each of which takes a moment, and reports no tips
+    def __init__(self):
+        self.fee_history_error = None
+        self.base_fees = [30 * GWEI, 40 * GWEI]
+        self.queries = []
+
+    def fee_history(self, blocks, newest, percentiles):
+        self.queries.append('eth_feeHistory')
+        time.sleep(0.05)
+        if self.fee_history_error is not None:
+            raise self.fee_history_error
+        return {'baseFeePerGas': self.base_fees, 'reward': []}
+
+    @property
+    def max_priority_fee(self):
+        self.queries.append('eth_maxPriorityFeePerGas')
+        return GWEI
+
+def fees_from_threads(oracle, count:int):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+    def get(i):
+        barrier.wait()
+        try:
+            results[i] = oracle.fees()
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=get, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def test_concurrent_callers_share_one_fetch(dfk):
+    w3 = FakeW3()
+    w3.eth = SlowEth()
+    oracle = dfk.fee_oracle.FeeOracle(w3)
+
+    results = fees_from_threads(oracle, 8)
+    assert w3.eth.queries == ['eth_feeHistory', 'eth_maxPriorityFeePerGas']
+    assert results == [{'maxFeePerGas': 81 * GWEI, 'maxPriorityFeePerGas': GWEI}] * 8
+    assert oracle.fetch_count == 1
+
+def test_concurrent_callers_share_a_failed_fetch(dfk):
+    w3 = FakeW3()
+    w3.eth = SlowEth()
+    w3.eth.fee_history_error = TimeoutError('timed out')
+    oracle = dfk.fee_oracle.FeeOracle(w3)
+
+    results = fees_from_threads(oracle, 4)
+    assert w3.eth.queries == ['eth_feeHistory']
+    assert all(isinstance(r, TimeoutError) for r in results)
+
+    # The next caller tries again
+    w3.eth.fee_history_error = None
+    assert oracle.fees() == {'maxFeePerGas': 81 * GWEI, 'maxPriorityFeePerGas': GWEI}
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+from eth_tester.backends.pyevm.main import get_default_account_keys
+from web3 import AsyncWeb3
+from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+from conftest import TESTER_RPC
+
+RECIPIENT = '0x' + '33' * 20
+
+def credentials(dfk, index:int):
+    key = get_default_account_keys()[index]
+    return dfk.credentials.Credentials(key.public_key.to_checksum_address(), key.to_hex())
+
+@pytest.fixture
+def gas_cache(dfk):
+    cache = dfk.gas_cache.enable_gas_cache()
+    yield cache
+    dfk.gas_cache.disable_gas_cache()
+
+@pytest.fixture
+def async_contracts(dfk, tester_w3):
+    # An AsyncWeb3 on the same eth-tester chain as `tester_w3`, so receipts
+    # reach the sync ReceiptWatcher
+    provider = AsyncEthereumTesterProvider()
+    provider.ethereum_tester = tester_w3.provider.ethereum_tester
+    dfk.provider_registry.ASYNC_W3_INSTANCES[TESTER_RPC] = AsyncWeb3(provider)
+    yield dfk.AsyncAllDfkContracts('cv', rpc=TESTER_RPC)
+    del dfk.provider_registry.ASYNC_W3_INSTANCES[TESTER_RPC]
+
+def test_repeat_send_is_a_hit(dfk, contracts, gas_cache):
+    cred = credentials(dfk, 2)
+    receipts = [contracts.jewel_token.transfer(cred, RECIPIENT, 0) for _ in range(3)]
+
+    assert all(r['status'] == 1 for r in receipts)
+    assert gas_cache.stats() == {'hits': 2, 'misses': 1, 'invalidations': 0, 'entries': 1}
+
+def test_async_repeat_send_is_a_hit(dfk, async_contracts, gas_cache):
+    cred = credentials(dfk, 3)
+
+    async def main():
+        return [await async_contracts.jewel_token.transfer(cred, RECIPIENT, 0) for _ in range(3)]
+
+    receipts = asyncio.run(main())
+    assert all(r['status'] == 1 for r in receipts)
+    assert gas_cache.stats() == {'hits': 2, 'misses': 1, 'invalidations': 0, 'entries': 1}
+    key, = gas_cache.entries
+    assert key[0] == dfk.nonce_manager.CHAIN_IDS[TESTER_RPC]
@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Importing a generated package and building its aggregator shouldn't import
+# web3; the first contract built does. Run in a fresh interpreter, since this
+# one has web3 loaded already
+
+CHECK = '''
+import sys
+sys.path.insert(0, {path!r})
+from DFK import AllDfkContracts
+contracts = AllDfkContracts('cv', rpc='http://localhost:8545')
+print('web3' in sys.modules)
+contracts.hero_core
+print('web3' in sys.modules)
+'''
+
+def test_web3_is_imported_with_first_contract(dfk):
+    path = str(Path(dfk.__file__).parent.parent)
+    result = subprocess.run([sys.executable, '-c', CHECK.format(path=path)],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['False', 'True']
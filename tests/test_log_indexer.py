@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+
+# LogIndexer against a fake node whose eth_getLogs rejects ranges over
+# `max_range` blocks, as many providers do, and has a JEWEL Transfer at each
+# block in `log_blocks`
+
+SENDER = '0x' + '11' * 20
+RECIPIENT = '0x' + '22' * 20
+
+class FakeEth:
+    def __init__(self, transfer_topic:str, address:str, log_blocks, head:int, max_range:int | None = None):
+        self.transfer_topic = HexBytes(transfer_topic)
+        self.address = address
+        self.log_blocks = list(log_blocks)
+        self.block_number = head
+        self.max_range = max_range
+        # (fromBlock, toBlock) of every request, and of those rejected as too large
+        self.requests = []
+        self.rejected = []
+        self._lock = threading.Lock()
+
+    def get_logs(self, filter_params):
+        lo, hi = filter_params['fromBlock'], filter_params['toBlock']
+        with self._lock:
+            self.requests.append((lo, hi))
+            if self.max_range is not None and hi - lo + 1 > self.max_range:
+                self.rejected.append((lo, hi))
+                raise ValueError({'code': -32005, 'message': 'query returned more than 10000 results'})
+        return [self.transfer_log(b) for b in self.log_blocks if lo <= b <= hi]
+
+    def transfer_log(self, block:int) -> AttributeDict:
+        return AttributeDict({
+            'address': self.address,
+            'topics': [self.transfer_topic,
+                       HexBytes(encode(['address'], [SENDER])),
+                       HexBytes(encode(['address'], [RECIPIENT]))],
+            'data': HexBytes(encode(['uint256'], [block])),
+            'blockNumber': block,
+            'logIndex': 0,
+            'transactionIndex': 0,
+            'transactionHash': HexBytes(block.to_bytes(32, 'big')),
+            'blockHash': HexBytes(bytes(32)),
+            'removed': False,
+        })
+
+class FakeW3:
+    def __init__(self, eth:FakeEth):
+        self.eth = eth
+
+class FakeWrapper:
+    # The parts of a contract wrapper LogIndexer uses, with a fake node
+    def __init__(self, jewel_token, eth:FakeEth):
+        self.w3 = FakeW3(eth)
+        self.contract_address = jewel_token.contract_address
+        self._decoder = jewel_token.event_decoder()
+
+    def get_chain_id(self) -> int:
+        return 1
+
+    def event_decoder(self):
+        return self._decoder
+
+@pytest.fixture
+def make_wrapper(contracts):
+    jewel_token = contracts.jewel_token
+    transfer_topic = next(t for t, e in jewel_token.EVENT_TOPICS.items() if e['name'] == 'Transfer')
+    def make(log_blocks=(), head:int = 1000, max_range:int | None = None) -> FakeWrapper:
+        eth = FakeEth(transfer_topic, jewel_token.contract_address, log_blocks, head, max_range)
+        return FakeWrapper(jewel_token, eth)
+    return make
+
+@pytest.fixture
+def make_indexer(dfk, tmp_path):
+    indexers = []
+    def make(**kwargs):
+        indexer = dfk.log_indexer.LogIndexer(str(tmp_path / 'events.db'), **kwargs)
+        indexers.append(indexer)
+        return indexer
+    yield make
+    for indexer in indexers:
+        indexer.close()
+
+def stored_blocks(indexer, wrapper):
+    return [e['blockNumber'] for e in indexer.events(wrapper, 'Transfer')]
+
+def test_ranges_shrink_when_rejected(make_wrapper, make_indexer):
+    log_blocks = [5, 150, 151, 640, 999]
+    wrapper = make_wrapper(log_blocks, max_range=100)
+    indexer = make_indexer(chunk_size=1000, max_workers=4)
+
+    assert indexer.index(wrapper, 0, 999) == len(log_blocks)
+    assert stored_blocks(indexer, wrapper) == log_blocks
+    assert indexer.checkpoint(1, wrapper.contract_address) == 999
+
+    eth = wrapper.w3.eth
+    accepted = [r for r in eth.requests if r not in eth.rejected]
+    assert all(hi - lo + 1 <= 100 for lo, hi in accepted)
+    # Shrinking, rather than splitting every new range again and again
+    assert len(eth.rejected) < len(accepted)
+    assert indexer.request_count == len(eth.requests)
+
+def test_ranges_grow_when_empty(make_wrapper, make_indexer):
+    wrapper = make_wrapper(head=100_000)
+    indexer = make_indexer(chunk_size=10, max_workers=1)
+
+    assert indexer.index(wrapper, 0, 9_999) == 0
+    sizes = [hi - lo + 1 for lo, hi in wrapper.w3.eth.requests]
+    assert sizes[:4] == [10, 20, 40, 80]
+    assert sizes == sorted(sizes[:-1]) + sizes[-1:]
+    assert indexer.request_count == len(sizes) < 15
+
+def test_resumes_from_checkpoint(make_wrapper, make_indexer):
+    wrapper = make_wrapper([10, 480, 495, 600], head=500)
+    indexer = make_indexer(max_workers=2)
+    eth = wrapper.w3.eth
+
+    # Stops DEFAULT_CONFIRMATIONS blocks behind the head
+    assert indexer.index(wrapper) == 2
+    assert indexer.checkpoint(1, wrapper.contract_address) == 488
+    assert stored_blocks(indexer, wrapper) == [10, 480]
+
+    eth.block_number = 700
+    eth.requests.clear()
+    assert indexer.index(wrapper) == 2
+    assert min(lo for lo, _ in eth.requests) == 489
+    assert indexer.checkpoint(1, wrapper.contract_address) == 688
+    assert stored_blocks(indexer, wrapper) == [10, 480, 495, 600]
+
+    # Nothing new, nothing fetched
+    eth.requests.clear()
+    assert indexer.index(wrapper) == 0
+    assert eth.requests == []
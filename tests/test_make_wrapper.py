@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from abi_maker import make_wrapper
+from conftest import DEMO_ABIS_DIR
+
+# Generating the DFK demo bundle into a tmp dir, from a copy of its ABI JSON
+# that tests can edit
+
+@pytest.fixture
+def abis():
+    return json.loads((DEMO_ABIS_DIR / 'DFK_ABIS.json').read_text())
+
+@pytest.fixture
+def generate(tmp_path, abis):
+    # generate(output_dir, **kwargs) -> written paths, relative to output_dir,
+    # for whatever's in `abis` at the time
+    abi_path = tmp_path / 'DFK_ABIS.json'
+    def gen(output_dir, **kwargs):
+        abi_path.write_text(json.dumps(abis))
+        written = make_wrapper.write_project_wrapper('DFK', abi_path, output_dir, overwrite_ok=True, **kwargs)
+        return sorted(str(p.relative_to(output_dir)) for p in written)
+    return gen
+
+def mtimes(output_dir):
+    return {str(p.relative_to(output_dir)): p.stat().st_mtime_ns for p in output_dir.rglob('*') if p.is_file()}
+
+def test_incremental_rewrites_only_what_changed(tmp_path, abis, generate):
+    out = tmp_path / 'DFK'
+    generate(out)
+    before = mtimes(out)
+
+    # Nothing changed, nothing written
+    assert generate(out, incremental=True) == []
+    assert mtimes(out) == before
+
+    # A new address rewrites that contract's module, and the copy of the ABI JSON
+    abis['CONTRACTS']['Alchemist']['ADDRESS']['cv'] = '0x' + 'ab' * 20
+    assert generate(out, incremental=True) == ['DFK_ABIS.json', 'contracts/alchemist.py']
+    assert '0x' + 'ab' * 20 in (out / 'contracts' / 'alchemist.py').read_text()
+    after = mtimes(out)
+    changed = {path for path in before if after[path] != before[path]}
+    assert changed == {'DFK_ABIS.json', 'contracts/alchemist.py', make_wrapper.MANIFEST_NAME}
+
+    # A contract dropped from the JSON has its module deleted, and the shared
+    # modules listing every contract are rewritten
+    del abis['CONTRACTS']['AssistingAuction']
+    written = generate(out, incremental=True)
+    assert not (out / 'contracts' / 'assisting_auction.py').exists()
+    assert 'all_dfk_contracts.py' in written and 'contracts/__init__.py' in written
+    assert not any(path.startswith('contracts/') and path != 'contracts/__init__.py' for path in written)
+    assert 'AssistingAuction' not in json.loads((out / make_wrapper.MANIFEST_NAME).read_text())['contracts']
+
+def tree(output_dir):
+    return {str(p.relative_to(output_dir)): p.read_bytes() for p in output_dir.rglob('*') if p.is_file()}
+
+@pytest.mark.parametrize('options', [{}, {'fast_calls': True, 'async_wrappers': True}])
+def test_parallel_output_matches_serial(tmp_path, generate, options):
+    serial = generate(tmp_path / 'serial', jobs=1, **options)
+    parallel = generate(tmp_path / 'parallel', jobs=4, **options)
+
+    assert parallel == serial
+    assert tree(tmp_path / 'parallel') == tree(tmp_path / 'serial')
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+from web3 import Web3
+
+# Wrapper calls against the stub node are counted per (chain, contract,
+# method), and the JSON-RPC requests they make are put down to them
+
+OWNER = Web3.to_checksum_address('0x' + '11' * 20)
+SPENDER = Web3.to_checksum_address('0x' + '22' * 20)
+
+@pytest.fixture
+def metrics(dfk):
+    m = dfk.metrics.enable_metrics()
+    yield m
+    dfk.metrics.disable_metrics()
+
+def series(snapshot, family:str, **labels):
+    # {last label: count} of the series in `family` matching `labels`
+    last = {'call': 'operation', 'rpc': 'rpc_method'}[family]
+    return {s[last]: s['count'] for s in snapshot
+            if s['family'] == family and all(s[k] == v for k, v in labels.items())}
+
+def test_view_call_and_its_requests_are_counted(dfk, stub_rpc, metrics):
+    stub = stub_rpc()
+    jewel_token = dfk.AllDfkContracts('cv', rpc=stub.url).jewel_token
+    jewel_token.balance_of(OWNER)
+    jewel_token.balance_of(OWNER)
+    # Made outside any wrapper call
+    jewel_token.w3.eth.block_number
+
+    snapshot = metrics.snapshot()
+    in_call = dict(chain='1', contract='JewelToken', method='balanceOf')
+    assert series(snapshot, 'call', **in_call) == {'view_call': 2}
+    # web3 checks the chain id before each eth_call
+    assert series(snapshot, 'rpc', **in_call) == {'eth_call': 2, 'eth_chainId': 2}
+    assert series(snapshot, 'rpc', chain='1', contract='', method='') == {'eth_blockNumber': 1}
+    assert all(s['errors'] == 0 for s in snapshot)
+    assert dfk.metrics.CALL_CONTEXT.get() is None
+
+    prometheus = metrics.to_prometheus().splitlines()
+    labels = 'chain="1",contract="JewelToken",method="balanceOf"'
+    assert '# TYPE abi_wrapper_calls_total counter' in prometheus
+    assert f'abi_wrapper_calls_total{{{labels},operation="view_call"}} 2' in prometheus
+    assert f'abi_wrapper_call_errors_total{{{labels},operation="view_call"}} 0' in prometheus
+    assert f'abi_rpc_requests_total{{{labels},rpc_method="eth_call"}} 2' in prometheus
+    assert f'abi_rpc_request_seconds_bucket{{{labels},rpc_method="eth_call",le="+Inf"}} 2' in prometheus
+    assert f'abi_rpc_request_seconds_count{{{labels},rpc_method="eth_call"}} 2' in prometheus
+    assert json.loads(metrics.to_json()) == snapshot
+
+def test_failed_call_counts_as_an_error(contracts, reverting, metrics):
+    address = reverting()
+    with pytest.raises(Exception):
+        contracts.jewel_token.view_call('balanceOf', (OWNER,), contract_address=address)
+
+    call, = metrics.snapshot()
+    assert (call['method'], call['operation'], call['count'], call['errors']) == ('balanceOf', 'view_call', 1, 1)
+
+def test_concurrent_async_calls_are_told_apart(dfk, stub_rpc, metrics):
+    stub = stub_rpc()
+    jewel_token = dfk.AsyncAllDfkContracts('cv', rpc=stub.url).jewel_token
+
+    async def main():
+        results = await asyncio.gather(jewel_token.balance_of(OWNER), jewel_token.allowance(OWNER, SPENDER))
+        await dfk.provider_registry.close_async_sessions()
+        return results
+
+    assert asyncio.run(main()) == [int(OWNER, 16), int(SPENDER, 16)]
+    snapshot = metrics.snapshot()
+    for method in ('balanceOf', 'allowance'):
+        assert series(snapshot, 'call', chain='1', contract='AsyncJewelToken', method=method) == {'view_call': 1}
+        assert series(snapshot, 'rpc', chain='1', contract='AsyncJewelToken', method=method)['eth_call'] == 1
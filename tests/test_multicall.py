@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+from eth_abi import encode
+from web3.exceptions import BadFunctionCallOutput
+
+# CallBatch runs queued view calls through Multicall3's aggregate3 on an
+# eth-tester chain. A call that fails gets its own exception; the rest of
+# its batch is unaffected
+
+MULTICALL3_RUNTIME = Path(__file__).with_name('data').joinpath('multicall3.hex')
+
+@pytest.fixture
+def multicall_address(deploy):
+    return deploy(bytes.fromhex(MULTICALL3_RUNTIME.read_text().strip()[2:]))
+
+@pytest.fixture
+def aggregate3_calls(dfk, tester_w3, multicall_address):
+    # The params of each aggregate3 eth_call sent to the Multicall3 contract
+    calls = []
+    def counting_middleware(make_request, w3):
+        def middleware(method, params):
+            if (method == 'eth_call' and params[0].get('to', '').lower() == multicall_address.lower()
+                    and params[0]['data'].startswith(dfk.multicall.AGGREGATE3_SELECTOR)):
+                calls.append(params)
+            return make_request(method, params)
+        return middleware
+    tester_w3.middleware_onion.inject(counting_middleware, name='count_aggregate3', layer=0)
+    yield calls
+    tester_w3.middleware_onion.remove('count_aggregate3')
+
+def auction_lists(n:int):
+    return [[i, i * 10, i * 100][:i % 4] for i in range(n)]
+
+def test_batch_is_one_aggregate3(contracts, returning, multicall_address, aggregate3_calls):
+    auctions = contracts.assisting_auction
+    owner = '0x' + '11' * 20
+    expected = auction_lists(8)
+    targets = [returning(encode(['uint256[]'], [ids])) for ids in expected]
+
+    with contracts.batch(multicall_address=multicall_address) as batch:
+        futures = [auctions.view_call('getUserAuctions', [owner], contract_address=t, batch=batch) for t in targets]
+        assert not any(f.done() for f in futures)
+
+    assert len(aggregate3_calls) == 1
+    assert [f.result() for f in futures] == expected
+    assert expected == [auctions.fast_call('getUserAuctions', [owner], contract_address=t) for t in targets]
+
+def test_failed_calls_fail_alone(dfk, contracts, returning, reverting, multicall_address, aggregate3_calls):
+    auctions = contracts.assisting_auction
+    owner = '0x' + '11' * 20
+    good = returning(encode(['uint256[]'], [[1, 2, 3]]))
+    reverts = reverting(b'\xde\xad')
+    # Too short to decode as uint256[]
+    garbled = returning(b'\x01' * 5)
+
+    with contracts.batch(multicall_address=multicall_address) as batch:
+        futures = [auctions.view_call('getUserAuctions', [owner], contract_address=t, batch=batch)
+                   for t in (good, reverts, garbled, good)]
+
+    assert len(aggregate3_calls) == 1
+    assert futures[0].result() == futures[3].result() == [1, 2, 3]
+    error = futures[1].exception()
+    assert isinstance(error, dfk.multicall.MulticallError)
+    assert error.target == reverts
+    assert error.return_data == b'\xde\xad'
+    assert isinstance(futures[2].exception(), BadFunctionCallOutput)
+
+def test_batches_are_chunked(contracts, returning, multicall_address, aggregate3_calls):
+    jewel_token = contracts.jewel_token
+    targets = [returning(encode(['uint256'], [i])) for i in range(7)]
+
+    with contracts.batch(multicall_address=multicall_address, chunk_size=3) as batch:
+        futures = [jewel_token.view_call('totalSupply', [], contract_address=t, batch=batch) for t in targets]
+
+    assert len(aggregate3_calls) == 3
+    # Every chunk is pinned to the same block
+    assert len({params[1] for params in aggregate3_calls}) == 1
+    assert [f.result() for f in futures] == list(range(7))
+
+def test_exception_in_block_cancels_batch(contracts, returning, multicall_address, aggregate3_calls):
+    target = returning(encode(['uint256'], [1]))
+    with pytest.raises(RuntimeError):
+        with contracts.batch(multicall_address=multicall_address) as batch:
+            future = contracts.jewel_token.view_call('totalSupply', [], contract_address=target, batch=batch)
+            raise RuntimeError
+    assert future.cancelled()
+    assert aggregate3_calls == []
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+ADDRESS = '0x' + '22' * 20
+CHAIN_ID = 1
+
+class FakeEth:
+    # Stands in for w3.eth; the node's pending transaction count is `count`
+    def __init__(self, count:int = 0):
+        self.count = count
+        self.fetches = 0
+
+    def get_transaction_count(self, address, block_identifier):
+        self.fetches += 1
+        return self.count
+
+class FakeW3:
+    def __init__(self, count:int = 0):
+        self.eth = FakeEth(count)
+
+def test_resync_between_check_and_take(dfk):
+    # A resync() landing after needs_fetch() said no fetch was needed
+    class RacingNonceManager(dfk.nonce_manager.NonceManager):
+        raced = False
+        def needs_fetch(self, chain_id, address):
+            needs = super().needs_fetch(chain_id, address)
+            if not needs and not self.raced:
+                self.raced = True
+                self.resync(chain_id, address)
+            return needs
+
+    manager = RacingNonceManager()
+    w3 = FakeW3(count=5)
+    assert manager.next_nonce(w3, CHAIN_ID, ADDRESS) == 5
+    w3.eth.count = 9
+    # Fetches again instead of raising
+    assert manager.next_nonce(w3, CHAIN_ID, ADDRESS) == 9
+    assert manager.raced
+    assert manager.next_nonce(w3, CHAIN_ID, ADDRESS) == 10
+
+def test_concurrent_senders_and_resyncs(dfk):
+    manager = dfk.nonce_manager.NonceManager()
+    w3 = FakeW3()
+    errors = []
+    done = threading.Event()
+
+    def send():
+        try:
+            for _ in range(2000):
+                manager.next_nonce(w3, CHAIN_ID, ADDRESS)
+        except Exception as e:
+            errors.append(e)
+
+    def resync():
+        while not done.is_set():
+            manager.resync(CHAIN_ID, ADDRESS)
+
+    senders = [threading.Thread(target=send) for _ in range(4)]
+    resyncer = threading.Thread(target=resync)
+    resyncer.start()
+    for t in senders:
+        t.start()
+    for t in senders:
+        t.join()
+    done.set()
+    resyncer.join()
+    assert errors == []
+    assert w3.eth.fetches > 1
+
+def test_take_without_fetch_raises(dfk):
+    manager = dfk.nonce_manager.NonceManager()
+    with pytest.raises(ValueError):
+        manager.take(CHAIN_ID, ADDRESS)
+    assert manager.try_take(CHAIN_ID, ADDRESS) is None
+    assert manager.take(CHAIN_ID, ADDRESS, fetched_nonce=3) == 3
+    assert manager.take(CHAIN_ID, ADDRESS) == 4
+
+def test_deprecated_nonce_methods_can_release(contracts, tester_w3):
+    jewel_token = contracts.jewel_token
+    sender = tester_w3.eth.accounts[1]
+    with pytest.warns(DeprecationWarning):
+        nonce = jewel_token.get_nonce_and_update(sender)
+    # Given back, so it's handed out again rather than leaving a gap
+    jewel_token.release_nonce(sender, nonce)
+    with pytest.warns(DeprecationWarning):
+        gas_dict = jewel_token.get_gas_dict_and_update(sender)
+    assert gas_dict['nonce'] == nonce
+    jewel_token.release_nonce(sender, nonce)
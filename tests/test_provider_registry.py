@@ -0,0 +1,61 @@
+import asyncio
+import gc
+import warnings
+
+from web3 import Web3
+
+OWNER = Web3.to_checksum_address('0x' + '11' * 20)
+
+def test_async_sessions_close_with_their_loop(dfk, stub_rpc):
+    stub = stub_rpc()
+    w3 = dfk.provider_registry.get_async_w3(stub.url)
+    provider = w3.provider
+    sessions = []
+
+    async def get_balance():
+        balance = await w3.eth.get_balance(OWNER)
+        sessions.append(await provider._session())
+        return balance
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        # Each loop gets its own session, closed when asyncio.run() shuts the loop down
+        assert asyncio.run(get_balance()) == asyncio.run(get_balance()) == int(OWNER, 16) % 1000
+        assert sessions[0] is not sessions[1]
+        assert all(session.closed for session in sessions)
+        sessions.clear()
+        gc.collect()
+    assert not [w for w in caught if 'Unclosed' in str(w.message)]
+
+    # Closed loops are forgotten once a new session is made
+    asyncio.run(get_balance())
+    assert len(provider._sessions) == 1
+
+def test_close_async_sessions(dfk, stub_rpc):
+    stub = stub_rpc()
+    w3 = dfk.provider_registry.get_async_w3(stub.url)
+
+    async def main():
+        await w3.eth.get_balance(OWNER)
+        session = await w3.provider._session()
+        stats = dfk.provider_registry.pool_stats()[stub.url]['async']
+        await dfk.provider_registry.close_async_sessions()
+        return session, stats
+
+    session, stats = asyncio.run(main())
+    assert session.closed
+    assert stats['requests'] == 1
+    assert stats['sessions'] == 1
+    assert stats['active_connections'] == 0
+    assert dfk.provider_registry.pool_stats()[stub.url]['async']['sessions'] == 0
+
+def test_pool_stats_has_sync_and_async(dfk, stub_rpc):
+    stub = stub_rpc()
+    dfk.provider_registry.get_w3(stub.url).eth.get_balance(OWNER)
+    async_w3 = dfk.provider_registry.get_async_w3(stub.url)
+    asyncio.run(async_w3.eth.get_balance(OWNER))
+
+    stats = dfk.provider_registry.pool_stats()[stub.url]
+    assert stats['requests'] == 1
+    assert stats['async']['requests'] == 1
+    assert stats['async']['errors'] == 0
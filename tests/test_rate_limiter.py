@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+
+def test_interrupted_acquire_leaves_the_queue(dfk):
+    limiter = dfk.rate_limiter.RateLimiter(max_in_flight=1)
+    limiter.acquire()
+
+    # As if a signal handler raised while we waited for the slot
+    def interrupted_wait(timeout=None):
+        raise KeyboardInterrupt
+    limiter._cond.wait = interrupted_wait
+    with pytest.raises(KeyboardInterrupt):
+        limiter.acquire()
+    del limiter._cond.wait
+    assert limiter.stats()['waiting'] == 0
+
+    # The next request isn't stuck behind the abandoned one
+    limiter.release()
+    waiter = threading.Thread(target=limiter.acquire, daemon=True)
+    waiter.start()
+    waiter.join(timeout=2)
+    assert not waiter.is_alive()
+
+def test_async_acquire_sleeps_until_tokens(dfk, monkeypatch):
+    limiter = dfk.rate_limiter.RateLimiter(max_requests_per_second=10, burst=1)
+    sleeps = []
+    sleep = asyncio.sleep
+    async def recording_sleep(delay, *args):
+        sleeps.append(delay)
+        await sleep(delay, *args)
+    monkeypatch.setattr(asyncio, 'sleep', recording_sleep)
+
+    async def main():
+        await limiter.acquire_async()
+        await limiter.acquire_async()
+
+    asyncio.run(main())
+    # Sleeps until the next token, ~0.1s away, rather than polling
+    assert sleeps[0] == pytest.approx(0.1, abs=0.02)
+    assert dfk.rate_limiter.ASYNC_POLL_INTERVAL not in sleeps
+
+def test_async_acquire_waits_for_release(dfk):
+    limiter = dfk.rate_limiter.RateLimiter(max_in_flight=1)
+    limiter.acquire()
+    threading.Timer(0.05, limiter.release).start()
+
+    async def main():
+        return await asyncio.wait_for(limiter.acquire_async(), timeout=2)
+
+    asyncio.run(main())
+    assert limiter.stats()['in_flight'] == 1
+    assert limiter.stats()['waits'] == 1
+
+@pytest.mark.parametrize('max_rate', [None, 10])
+def test_rate_does_not_recover_while_paused(dfk, max_rate):
+    limiter = dfk.rate_limiter.RateLimiter(max_requests_per_second=max_rate)
+    limiter.rate_limited(retry_after=5)
+    backed_off = limiter.rate
+    paused_until = limiter.paused_until
+
+    with limiter._cond:
+        limiter._refill(paused_until - 1)
+    assert limiter.rate == backed_off
+
+    with limiter._cond:
+        limiter._refill(paused_until + 1)
+    assert limiter.rate > backed_off
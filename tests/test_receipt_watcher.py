@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+from hexbytes import HexBytes
+from web3.exceptions import TransactionNotFound
+
+# ReceiptWatcher against a fake chain. `mine()` adds a block holding the
+# given (hash, sender, nonce) transactions
+
+SENDER = '0x' + '11' * 20
+
+def tx_hash(n:int) -> HexBytes:
+    return HexBytes(n.to_bytes(32, 'big'))
+
+class FakeEth:
+    def __init__(self, head:int = 100):
+        self.block_number = head
+        self.blocks = {}
+        self.receipts = {}
+        # sender: mined transaction count
+        self.nonces = {}
+        # Block numbers fetched with get_block()
+        self.blocks_fetched = []
+        self._lock = threading.Lock()
+
+    def mine(self, *txs):
+        with self._lock:
+            self.block_number += 1
+            self.blocks[self.block_number] = [{'hash': h, 'from': s, 'nonce': n} for h, s, n in txs]
+            for h, s, n in txs:
+                self.receipts[h] = {'transactionHash': h, 'blockNumber': self.block_number, 'status': 1}
+                self.nonces[s] = max(self.nonces.get(s, 0), n + 1)
+
+    def get_block(self, block_number, full_transactions=False):
+        self.blocks_fetched.append(block_number)
+        return {'transactions': self.blocks.get(block_number, [])}
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+    def get_transaction_count(self, address, block_identifier):
+        return self.nonces.get(address, 0)
+
+class FakeW3:
+    def __init__(self, eth:FakeEth):
+        self.eth = eth
+
+@pytest.fixture
+def chain():
+    return FakeEth()
+
+@pytest.fixture
+def watcher(dfk, chain):
+    return dfk.receipt_watcher.ReceiptWatcher(FakeW3(chain), 1, poll_interval=0.01)
+
+def test_few_pending_look_up_receipts(watcher, chain):
+    pending = watcher.watch(tx_hash(1), SENDER, 0, timeout=5)
+    chain.mine((tx_hash(1), SENDER, 0))
+
+    assert pending.result(timeout=2)['blockNumber'] == 101
+    # No block fetched for a lone transaction
+    assert chain.blocks_fetched == []
+
+def test_few_pending_spot_replacement_by_nonce(dfk, watcher, chain):
+    pending = watcher.watch(tx_hash(1), SENDER, 0, timeout=5)
+    chain.mine((tx_hash(2), SENDER, 0))
+
+    with pytest.raises(dfk.receipt_watcher.TransactionReplaced) as e:
+        pending.result(timeout=2)
+    assert e.value.replacement_hash is None
+
+def test_many_pending_scan_blocks(dfk, watcher, chain):
+    count = dfk.receipt_watcher.FULL_SCAN_MIN_PENDING + 1
+    pending = [watcher.watch(tx_hash(i), SENDER, i, timeout=5) for i in range(count)]
+    # Let the first poll find nothing mined, so later blocks are scanned
+    while watcher.last_block is None:
+        threading.Event().wait(0.01)
+    chain.mine(*[(tx_hash(i), SENDER, i) for i in range(count - 1)])
+    # The last one is replaced
+    chain.mine((tx_hash(99), SENDER, count - 1))
+
+    assert [p.result(timeout=2)['blockNumber'] for p in pending[:-1]] == [101] * (count - 1)
+    with pytest.raises(dfk.receipt_watcher.TransactionReplaced) as e:
+        pending[-1].result(timeout=2)
+    assert e.value.replacement_hash == tx_hash(99)
+    assert chain.blocks_fetched == [101, 102]
+
+def test_restart_starts_from_head(dfk, watcher, chain):
+    watcher.watch(tx_hash(1), SENDER, 0, timeout=5)
+    chain.mine((tx_hash(1), SENDER, 0))
+    while watcher.pending_count():
+        threading.Event().wait(0.01)
+
+    # Blocks mined while idle hold nothing sent since, so aren't scanned
+    for _ in range(5):
+        chain.mine()
+    count = dfk.receipt_watcher.FULL_SCAN_MIN_PENDING
+    pending = [watcher.watch(tx_hash(10 + i), SENDER, 1 + i, timeout=5) for i in range(count)]
+    chain.mine(*[(tx_hash(10 + i), SENDER, 1 + i) for i in range(count)])
+
+    assert all(p.result(timeout=2)['blockNumber'] == 107 for p in pending)
+    assert all(b > 106 for b in chain.blocks_fetched)
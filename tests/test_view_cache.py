@@ -0,0 +1,84 @@
+import pytest
+from web3 import Web3
+
+from conftest import default_answer
+
+# View calls through the cache, against a stub node whose head block the
+# test moves on. Its eth_call answers with the balanceOf() argument
+
+OWNERS = [Web3.to_checksum_address(f'0x{i + 1:040x}') for i in range(4)]
+
+@pytest.fixture
+def node(stub_rpc):
+    head = {'number': 100}
+    def answer(method, params):
+        if method == 'eth_blockNumber':
+            return hex(head['number'])
+        return default_answer(method, params)
+    stub = stub_rpc(answer=answer)
+    stub.head = head
+    return stub
+
+@pytest.fixture
+def jewel_token(dfk, node):
+    return dfk.AllDfkContracts('cv', rpc=node.url).jewel_token
+
+@pytest.fixture
+def view_cache(dfk):
+    # head_ttl=0: every 'latest' call checks the head block
+    cache = dfk.view_cache.enable_view_cache(max_entries=3, head_ttl=0)
+    yield cache
+    dfk.view_cache.disable_view_cache()
+
+def eth_calls(node) -> int:
+    return node.methods.count('eth_call')
+
+def test_same_block_is_a_hit(jewel_token, node, view_cache):
+    assert [jewel_token.balance_of(OWNERS[0]) for _ in range(3)] == [int(OWNERS[0], 16)] * 3
+
+    assert eth_calls(node) == 1
+    stats = view_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 1, 1)
+    assert stats['hit_rate'] == pytest.approx(2 / 3)
+
+def test_new_block_invalidates_latest(jewel_token, node, view_cache):
+    jewel_token.balance_of(OWNERS[0])
+    jewel_token.balance_of(OWNERS[1], block_identifier=50)
+    node.head['number'] += 1
+
+    assert jewel_token.balance_of(OWNERS[0]) == int(OWNERS[0], 16)
+    # Calls pinned to a block are still good
+    assert jewel_token.balance_of(OWNERS[1], block_identifier=50) == int(OWNERS[1], 16)
+
+    assert eth_calls(node) == 3
+    stats = view_cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations']) == (1, 3, 1)
+    assert stats['hit_rate'] == 0.25
+
+def test_least_recently_used_is_evicted(jewel_token, node, view_cache):
+    for owner in OWNERS[:3]:
+        jewel_token.balance_of(owner, block_identifier=50)
+    # Use the first again, so the second is the oldest when the fourth goes in
+    jewel_token.balance_of(OWNERS[0], block_identifier=50)
+    jewel_token.balance_of(OWNERS[3], block_identifier=50)
+
+    stats = view_cache.stats()
+    assert (stats['entries'], stats['evictions']) == (3, 1)
+    assert eth_calls(node) == 4
+    jewel_token.balance_of(OWNERS[0], block_identifier=50)
+    assert eth_calls(node) == 4
+    jewel_token.balance_of(OWNERS[1], block_identifier=50)
+    assert eth_calls(node) == 5
+
+def test_latest_result_from_an_old_head_is_not_stored(dfk):
+    cache = dfk.view_cache.ViewCache()
+    cache.new_block(1, 100)
+    key = (1, OWNERS[0], '0x70a08231', 'latest')
+    cache.new_block(1, 101)
+
+    # The call was made at block 100, but 101 was seen before it returned
+    cache.put(key, b'\x01', head=100)
+    assert cache.get(key) is None
+    cache.put(key, b'\x01', head=101)
+    assert cache.get(key) == b'\x01'
+    assert cache.stats()['invalidations'] == 0